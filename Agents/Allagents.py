@@ -1,31 +1,7 @@
-import chromadb
-from chromadb.config import Settings
-import json
-
-# 初始化 Chroma
-client = chromadb.Client(Settings())
-collection = client.get_or_create_collection(name="proteins")
-
-# 加载文档
-with open("Agents/uniprot_documents_with_embedding.json", "r", encoding="utf-8") as f:
-    docs = json.load(f)
-
-# 添加到数据库
-def flatten_metadata(meta):
-    new_meta = {}
-    for k, v in meta.items():
-        if isinstance(v, list):
-            new_meta[k] = ", ".join(map(str, v))
-        else:
-            new_meta[k] = v
-    return new_meta
-
-collection.add(
-    documents=[doc["document"] for doc in docs],
-    metadatas=[flatten_metadata(doc["metadata"]) for doc in docs],
-    ids=[doc["id"] for doc in docs],
-    embeddings=[doc["embedding"] for doc in docs]
-)
+from protein_index import DEFAULT_INDEX_DIR, open_index
+
+# 二进制 embedding 存储（由 embedding_store.py convert 生成），mmap 只读打开
+collection = open_index(DEFAULT_INDEX_DIR)
 
 
 from esm import pretrained
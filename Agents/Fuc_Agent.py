@@ -1,55 +1,46 @@
-import requests
-import json
-from dotenv import load_dotenv
-from google import genai
-
-load_dotenv()
-google_client = genai.Client()
+import httpx
+import deepgo_client
+import llm_gateway
+from prompts import FUNCTION_PROMPT
+from deepgo_client import get_go_terms_batch
+from go_terms import summarize_go_response
 
 def get_go_terms(sequence, threshold=0.3):
     """
-    调用 DeepGO API 获取蛋白质的 GO terms
+    调用 DeepGO API 获取蛋白质的 GO terms（先查本地缓存）
     
     Args:
         sequence: 蛋白质序列
         threshold: 置信度阈值
     
     Returns:
-        GO terms 结果
+        GO terms 结果，请求失败时返回 None
     """
-    url = "https://deepgo.cbrc.kaust.edu.sa/deepgo/api/create"
-    headers = {"Content-Type": "application/json"}
+    return get_go_terms_batch([sequence], threshold=threshold).get(sequence)
 
-    payload = {
-        "version": "latest",
-        "data_format": "fasta",
-        "data": sequence,
-        "threshold": threshold
-    }
-    
+async def get_go_terms_async(sequence, threshold=0.3):
+    """get_go_terms 的异步版本，等待 DeepGO 响应时不阻塞事件循环"""
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        return await deepgo_client.get_go_terms_async(sequence, threshold=threshold)
+    except (httpx.HTTPError, ValueError) as e:
         print(f"DeepGO API 请求失败: {e}")
         return None
 
-def parse_go_terms(go_response):
+def parse_go_terms(go_response, threshold=0.3):
     """
     解析 GO terms 响应，提取关键信息
     
     Args:
         go_response: DeepGO API 响应
+        threshold: 置信度阈值，低于阈值的术语不进入提示词
     
     Returns:
-        格式化的 GO terms 信息
+        格式化的 GO terms 信息（每个命名空间最具体的术语，按 token 预算截断）
     """
     if not go_response:
         return "无法获取 GO terms 信息"
     
-    # 直接返回原始响应，让 LLM 处理
-    return json.dumps(go_response, indent=2, ensure_ascii=False)
+    return summarize_go_response(go_response, threshold=threshold)
 
 def calculate_function_confidence(go_response, sequence) -> float:
     """
@@ -69,6 +60,10 @@ def calculate_function_confidence(go_response, sequence) -> float:
     # 功能智能体应该有最高置信度
     return 0.8
 
+def build_function_prompt(sequence, go_terms_text):
+    """Returns: (静态前缀, 每蛋白内容)；功能智能体只看序列摘要"""
+    return FUNCTION_PROMPT.render(sequence=sequence, go_terms=go_terms_text)
+
 def generate_function_description(sequence, go_terms_text) -> str:
     """
     使用 LLM 根据 GO terms 生成功能描述
@@ -80,33 +75,12 @@ def generate_function_description(sequence, go_terms_text) -> str:
     Returns:
         功能描述文本
     """
-    prompt = f"""
-    You are a protein function prediction expert. Please provide a detailed functional analysis based on the following protein sequence and GO terms prediction results:
+    prefix, body = build_function_prompt(sequence, go_terms_text)
+    return llm_gateway.generate(body, agent="function", prefix=prefix)
 
-    Protein sequence:
-    {sequence}
-
-    GO Terms prediction results:
-    {go_terms_text}
-
-    Please provide a comprehensive functional analysis from three aspects:
-    1. Molecular Function (MF) - Biochemical activity of the protein
-    2. Biological Process (BP) - Biological processes the protein participates in
-    3. Cellular Component (CC) - Cellular localization of the protein
-
-    Please provide detailed and accurate functional descriptions, including:
-    - Main functional characteristics
-    - Possible biological roles
-    - Related metabolic pathways
-    - Potential disease associations
-    - Domain and functional site analysis
-    """
-    
-    response = google_client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt
-    )
-    return response.text
+async def generate_function_description_async(sequence, go_terms_text) -> str:
+    prefix, body = build_function_prompt(sequence, go_terms_text)
+    return await llm_gateway.generate_async(body, agent="function", prefix=prefix)
 
 def function_agent(state: dict) -> dict:
     """
@@ -124,7 +98,7 @@ def function_agent(state: dict) -> dict:
     go_response = get_go_terms(sequence, threshold=0.3)
     
     # 解析 GO terms
-    go_terms_text = parse_go_terms(go_response)
+    go_terms_text = parse_go_terms(go_response, threshold=0.3)
     
     # 生成功能描述
     function_nl = generate_function_description(sequence, go_terms_text)
@@ -136,3 +110,15 @@ def function_agent(state: dict) -> dict:
         "function_nl": function_nl,
         "function_confidence": function_confidence
     }
+
+async def function_agent_async(state: dict) -> dict:
+    """function_agent 的异步版本，供 StateGraph 异步执行时使用"""
+    sequence = state["input"]
+    go_response = await get_go_terms_async(sequence, threshold=0.3)
+    go_terms_text = parse_go_terms(go_response, threshold=0.3)
+    function_nl = await generate_function_description_async(sequence, go_terms_text)
+    function_confidence = calculate_function_confidence(go_response, sequence)
+    return {
+        "function_nl": function_nl,
+        "function_confidence": function_confidence
+    }
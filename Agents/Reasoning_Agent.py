@@ -1,10 +1,6 @@
 
-from dotenv import load_dotenv
-from google import genai
-import os
-
-load_dotenv()
-google_client = genai.Client()
+import llm_gateway
+from prompts import REASONING_PROMPT
 
 def calculate_reasoning_confidence(function_confidence, sequence_confidence, structure_confidence, function_nl, sequence_nl, structure_nl) -> float:
     """
@@ -55,6 +51,27 @@ def calculate_reasoning_confidence(function_confidence, sequence_confidence, str
         print(f"Warning: Error calculating reasoning confidence: {e}")
         return 0.5  # 默认中等置信度
 
+def build_reasoning_prompt(state: dict):
+    """Returns: (静态前缀, 每蛋白内容)"""
+    return REASONING_PROMPT.render(
+        function_nl=state.get("function_nl", ""),
+        sequence_nl=state.get("sequence_nl", ""),
+        structure_nl=state.get("structure_nl", ""),
+        function_confidence=state.get("function_confidence", 0.5),
+        sequence_confidence=state.get("sequence_confidence", 0.5),
+        structure_confidence=state.get("structure_confidence", 0.5),
+    )
+
+def _final_confidence(state: dict) -> float:
+    return calculate_reasoning_confidence(
+        state.get("function_confidence", 0.5),
+        state.get("sequence_confidence", 0.5),
+        state.get("structure_confidence", 0.5),
+        state.get("function_nl", ""),
+        state.get("sequence_nl", ""),
+        state.get("structure_nl", "")
+    )
+
 def reasoning_agent(state: dict) -> dict:
     """
     综合三个agent的分析结果，生成最终结论
@@ -65,61 +82,49 @@ def reasoning_agent(state: dict) -> dict:
     Returns:
         包含final_answer和final_confidence的字典
     """
-    seq = state["input"]
-    function_nl = state.get("function_nl", "")
-    sequence_nl = state.get("sequence_nl", "")
-    structure_nl = state.get("structure_nl", "")
-    function_confidence = state.get("function_confidence", 0.5)
-    sequence_confidence = state.get("sequence_confidence", 0.5)
-    structure_confidence = state.get("structure_confidence", 0.5)
+    prefix, body = build_reasoning_prompt(state)
+    final_answer = llm_gateway.generate(body, agent="reasoning", prefix=prefix)
     
-    prompt = f"""You are a protein function summary expert. Please synthesize the analysis from function expert, sequence expert, and structure expert to summarize the potential functions, pathways, domains, and disease associations of this protein.
-
-Function expert analysis (confidence: {function_confidence:.2f}):
-{function_nl}
-
-Sequence expert analysis (confidence: {sequence_confidence:.2f}):
-{sequence_nl}
-
-Structure expert analysis (confidence: {structure_confidence:.2f}):
-{structure_nl}
-
-Notes:
-1. The function expert analysis is based on GO terms prediction and has higher authority, so it should be given more weight
-2. If a certain expert has low confidence, please adjust the reliance on that expert's analysis accordingly
-3. Please highlight the consistency and complementarity among the expert analysis results
+    return {
+        "final_answer": final_answer,
+        "final_confidence": _final_confidence(state)
+    }
 
-Please synthesize the above three expert analyses and generate a comprehensive, accurate, and fluent natural language functional description from three aspects:
-1. Molecular Function (MF) - Biochemical activity of the protein
-2. Biological Process (BP) - Biological processes the protein participates in
-3. Cellular Component (CC) - Cellular localization of the protein
+def _stream_writer():
+    """LangGraph 的自定义流写入器；不在 stream_mode="custom" 的图中运行时返回空操作"""
+    try:
+        from langgraph.config import get_stream_writer
 
-    Please provide detailed and accurate functional descriptions, including:
-    - Main functional characteristics
-    - Possible biological roles
-    - Related metabolic pathways
-    - Potential disease associations
-    - Domain and functional site analysis
+        return get_stream_writer()
+    except Exception:
+        return lambda _: None
 
+async def reasoning_agent_stream_async(state: dict) -> dict:
+    """
+    reasoning_agent 的流式版本：先写出 final_confidence，再把综合分析逐块写入 LangGraph 的 custom 流
 
-"""
-    
-    response = google_client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt
-    )
-    
-    # 计算综合置信度
-    final_confidence = calculate_reasoning_confidence(
-        function_confidence,
-        sequence_confidence, 
-        structure_confidence, 
-        function_nl,
-        sequence_nl, 
-        structure_nl
-    )
+    custom 流中的事件：{"final_confidence": float}、{"final_answer_delta": str}
+    """
+    writer = _stream_writer()
+    final_confidence = _final_confidence(state)
+    writer({"final_confidence": final_confidence})
+    parts = []
+    prefix, body = build_reasoning_prompt(state)
+    async for delta in llm_gateway.generate_stream_async(body, agent="reasoning", prefix=prefix):
+        parts.append(delta)
+        writer({"final_answer_delta": delta})
     
     return {
-        "final_answer": response.text,
+        "final_answer": "".join(parts),
         "final_confidence": final_confidence
-    }
\ No newline at end of file
+    }
+
+async def reasoning_agent_async(state: dict) -> dict:
+    """reasoning_agent 的异步版本"""
+    prefix, body = build_reasoning_prompt(state)
+    final_answer = await llm_gateway.generate_async(body, agent="reasoning", prefix=prefix)
+    
+    return {
+        "final_answer": final_answer,
+        "final_confidence": _final_confidence(state)
+    }
@@ -1,56 +1,57 @@
-import chromadb
-from chromadb.config import Settings
-import json
-
-# 初始化 Chroma
-client = chromadb.Client(Settings())
-collection = client.get_or_create_collection(name="proteins")
-
-# 加载文档
-with open("Agents/uniprot_documents_with_embedding copy.json", "r", encoding="utf-8") as f:
-    docs = json.load(f)
-
-# 添加到数据库
-def flatten_metadata(meta):
-    new_meta = {}
-    for k, v in meta.items():
-        if isinstance(v, list):
-            new_meta[k] = ", ".join(map(str, v))
-        else:
-            new_meta[k] = v
-    return new_meta
-
-collection.add(
-    documents=[doc["document"] for doc in docs],
-    metadatas=[flatten_metadata(doc["metadata"]) for doc in docs],
-    ids=[doc["id"] for doc in docs],
-    embeddings=[doc["embedding"] for doc in docs]
-)
+import asyncio
+import os
+from protein_index import DEFAULT_INDEX_DIR, open_index
+
+# 持久化索引需预先构建：python Agents/protein_index.py build
+PROTEIN_INDEX_DIR = DEFAULT_INDEX_DIR
+# 检索后端：exact（默认）/ ivfpq / hnsw，ANN 索引需先用 ann_backends.py build 构建
+PROTEIN_INDEX_BACKEND = os.environ.get("PROTEIN_INDEX_BACKEND", "exact")
+PROTEIN_INDEX_PARAMS = {
+    "ivfpq": {
+        "nprobe": int(os.environ.get("PROTEIN_INDEX_NPROBE", "32")),
+        "refine": int(os.environ.get("PROTEIN_INDEX_REFINE", "10")),
+    },
+    "hnsw": {"ef_search": int(os.environ.get("PROTEIN_INDEX_EF_SEARCH", "64"))},
+}
+_index = None
+
+def get_index():
+    """首次检索时以只读方式打开索引，导入模块时不再重建向量库"""
+    global _index
+    if _index is None:
+        _index = open_index(
+            PROTEIN_INDEX_DIR,
+            backend=PROTEIN_INDEX_BACKEND,
+            **PROTEIN_INDEX_PARAMS.get(PROTEIN_INDEX_BACKEND, {}),
+        )
+    return _index
 
 
-from esm import pretrained
-import torch
 import numpy as np
+from esm_embedder import embed_sequences, MODEL_NAME, REPR_LAYER
+from embedding_cache import get_embedding_cache
+from tracing import current_span, span
 
-# 加载模型
-model, alphabet = pretrained.esm2_t33_650M_UR50D()
-batch_converter = alphabet.get_batch_converter()
-model.eval()
+def _embed_uncached(seqs):
+    current_span().set(cache_hit=False)
+    return embed_sequences(seqs)
 
 def embed_sequence(seq):
-    batch_labels, batch_strs, batch_tokens = batch_converter([("query", seq)])
-    with torch.no_grad():
-        results = model(batch_tokens, repr_layers=[33])
-    embedding = results["representations"][33][0, 1:len(seq)+1].mean(0).cpu().numpy()
-    return embedding.tolist()
+    # 先查内容寻址缓存，重复序列无需再跑 ESM
+    with span("esm.embed", length=len(seq), cache_hit=True):
+        return get_embedding_cache().embed([seq], _embed_uncached, MODEL_NAME, REPR_LAYER)[0]
+
+def embedding_cache_stats():
+    return get_embedding_cache().stats()
 
 def query_rag(seq, top_k=3):
     emb = embed_sequence(seq)
-    results = collection.query(
-        query_embeddings=[emb],
-        n_results=top_k,
-        include=["documents", "metadatas", "distances"]
-    )
+    with span("index.query", backend=PROTEIN_INDEX_BACKEND, top_k=top_k):
+        results = get_index().query(
+            query_embeddings=[emb],
+            n_results=top_k,
+            include=["documents", "metadatas", "distances"]
+        )
     return results
 
 def calculate_sequence_confidence(query_seq, retrieved_docs) -> float:
@@ -111,13 +112,11 @@ def calculate_sequence_confidence(query_seq, retrieved_docs) -> float:
         print(f"Warning: Error calculating sequence confidence: {e}")
         return 0.5  # 默认中等置信度
 
-from dotenv import load_dotenv
-from google import genai
+import llm_gateway
+from prompts import SEQUENCE_PROMPT
 
-load_dotenv()
-google_client = genai.Client()
-
-def generate(query_seq, retrieved_docs) -> str:
+def build_sequence_prompt(query_seq, retrieved_docs):
+    """Returns: (静态前缀, 每蛋白内容)"""
     docs = retrieved_docs.get("documents", [[]])[0]
     dists = retrieved_docs.get("distances", [[]])[0]
     lines = []
@@ -126,34 +125,15 @@ def generate(query_seq, retrieved_docs) -> str:
         dist_str = f"{dist:.4f}" if isinstance(dist, (int, float, float)) else "NA"
         lines.append(f"[{i+1}] distance={dist_str}\n{doc}")
     relevant_info = "\n\n".join(lines) if lines else "(no retrievals)"
-    prompt = f"""
-    You are a protein sequence information expert. Please provide a functional prediction based on the following protein sequence and related annotations from similar proteins:
-
-    User input sequence:
-    {query_seq}
-
-    Related annotations from similar proteins:
-    {relevant_info}
-
-   Please generate a comprehensive, accurate, and fluent natural language functional description from three aspects:
-    1. Molecular Function (MF) - Biochemical activity of the protein
-    2. Biological Process (BP) - Biological processes the protein participates in
-    3. Cellular Component (CC) - Cellular localization of the protein
-
-    Please provide detailed and accurate functional descriptions, including:
-    - Main functional characteristics
-    - Possible biological roles
-    - Related metabolic pathways
-    - Potential disease associations
-    - Domain and functional site analysis
-    
-    """
+    return SEQUENCE_PROMPT.render(sequence=query_seq, relevant_info=relevant_info)
 
-    response = google_client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt
-    )
-    return response.text
+def generate(query_seq, retrieved_docs) -> str:
+    prefix, body = build_sequence_prompt(query_seq, retrieved_docs)
+    return llm_gateway.generate(body, agent="sequence", prefix=prefix)
+
+async def generate_async(query_seq, retrieved_docs) -> str:
+    prefix, body = build_sequence_prompt(query_seq, retrieved_docs)
+    return await llm_gateway.generate_async(body, agent="sequence", prefix=prefix)
 
 def sequence_agent(state: dict) -> dict:
     seq = state["input"]
@@ -166,3 +146,14 @@ def sequence_agent(state: dict) -> dict:
         "sequence_confidence": sequence_confidence
     }
 
+async def sequence_agent_async(state: dict) -> dict:
+    """sequence_agent 的异步版本：ESM 编码与检索为 CPU 计算，放到线程中执行"""
+    seq = state["input"]
+    result = await asyncio.to_thread(query_rag, seq, 3)
+    sequence_nl = await generate_async(seq, result)
+    sequence_confidence = calculate_sequence_confidence(seq, result)
+    
+    return {
+        "sequence_nl": sequence_nl,
+        "sequence_confidence": sequence_confidence
+    }
@@ -1,107 +1,183 @@
-import requests
-from Bio.PDB import PDBParser, DSSP
+import asyncio
 import biotite.structure as struc
-import biotite.structure.io as bsio
+import numpy as np
 import os
-from math import sqrt
+from concurrent.futures import ThreadPoolExecutor
+from structure_context import StructureContext, load_structure_context
+from neighbor_search import NeighborSearch
+from structure_cache import get_structure_cache, structure_key
+from secondary_structure import assign_secondary_structure, secondary_structure_percentages
+from fold_backends import get_fold_backend
+from chunked_fold import WINDOW_WORKERS, plan_windows, stitch_windows
+from tracing import propagate, span
 
-def get_pdb(seq):
-    url = "https://api.esmatlas.com/foldSequence/v1/pdb/"
-    os.makedirs("Structure_Agent", exist_ok=True)
-    fallback_pdb = "Structure_Agent/model_1.pdb"
-    # 长度>400时截断并记录标记
-    truncated_flag_path = "Structure_Agent/.truncated"
+FALLBACK_PDB = "Structure_Agent/model_1.pdb"
+# ESM Atlas 单次折叠的序列长度上限
+FOLD_MAX_LEN = 400
+# 超长序列分窗折叠后拼接（FOLD_CHUNKED=0 时退回截断到前 400 aa）
+FOLD_CHUNKED = os.environ.get("FOLD_CHUNKED", "1") != "0"
+
+def _prepare_fold_sequence(seq):
+    """
+    长度>400时分窗（或在关闭分窗时截断）
+
+    Returns:
+        (实际折叠的序列, 折叠信息字典)；截断信息作为数据随请求返回，不再写共享标记文件
+    """
     original_len = len(seq)
-    if original_len > 400:
-        try:
-            with open(truncated_flag_path, "w") as f:
-                f.write(str(original_len))
-        except Exception:
-            pass
-        seq = seq[:400]
-    else:
-        if os.path.exists(truncated_flag_path):
-            try:
-                os.remove(truncated_flag_path)
-            except Exception:
-                pass
+    if not FOLD_CHUNKED:
+        seq = seq[:FOLD_MAX_LEN]
+    fold = {
+        "truncated": len(seq) < original_len,
+        "original_length": original_len,
+        "folded_length": len(seq),
+        "windows": 1,
+    }
+    return seq, fold
+
+def _cache_lookup(key):
     try:
-        response = requests.post(url, data=seq)
-        if not response.ok:
-            raise RuntimeError(f"ESM Atlas API request failed: {response.status_code} {response.text[:200]}")
-        text = response.text
-        # 有些情况下服务端返回错误页，但HTTP 200，需检测关键字
-        if "Service Temporarily Unavailable" in text or "<html" in text.lower():
-            raise RuntimeError("ESM Atlas API returned an error page content.")
-        # 简单有效性检查：必须包含 ATOM 记录
-        if "ATOM" not in text:
-            raise ValueError("Retrieved PDB has no ATOM records; possibly an error or unsuitable sequence.")
-        with open("Structure_Agent/result.pdb", "w") as f:
-            f.write(text)
-        return "Structure_Agent/result.pdb"
+        cached = get_structure_cache().get(key)
     except Exception as e:
-        # 回退到本地模型（若存在）
-        if os.path.exists(fallback_pdb):
-            print(f"Warning: Using local fallback model due to API error: {e}")
-            return fallback_pdb
-        # 若无本地回退，抛出更友好的错误
-        raise RuntimeError(
-            f"Failed to obtain PDB from ESM Atlas and no fallback found. Original error: {e}"
-        )
+        print(f"Warning: Structure cache lookup failed: {e}")
+        return None
+    return None if cached is None else cached[0]
+
+def _cache_store(key, text):
+    try:
+        get_structure_cache().put(key, text)
+    except Exception as e:
+        print(f"Warning: Structure cache write failed: {e}")
+
+def _fold_fallback(fold, e):
+    # 回退到本地模型（若存在）
+    if os.path.exists(FALLBACK_PDB):
+        print(f"Warning: Using local fallback model due to API error: {e}")
+        with open(FALLBACK_PDB, "r") as f:
+            fold.update(pdb_text=f.read(), pdb_path=FALLBACK_PDB, source="fallback")
+        return fold
+    # 若无本地回退，抛出更友好的错误
+    raise RuntimeError(
+        f"Failed to obtain PDB from fold backend and no fallback found. Original error: {e}"
+    )
 
-def extract_structure_features(pdb_file):
+def _fold_single(seq):
+    """
+    用当前折叠后端折叠不超过 FOLD_MAX_LEN 的序列，先查结构缓存
+
+    Returns:
+        (pdb_text, 来源 cache / 后端名)
+    """
+    backend = get_fold_backend()
+    key = structure_key(seq, FOLD_MAX_LEN, backend.cache_namespace)
+    with span("fold", kind="client", backend=backend.name, length=len(seq)) as trace:
+        cached = _cache_lookup(key)
+        if cached is not None:
+            trace.set(cache_hit=True)
+            return cached, "cache"
+        text = backend.fold(seq)
+        _cache_store(key, text)
+        return text, backend.name
+
+async def _fold_single_async(seq):
+    backend = get_fold_backend()
+    key = structure_key(seq, FOLD_MAX_LEN, backend.cache_namespace)
+    with span("fold", kind="client", track_cpu=False, backend=backend.name, length=len(seq)) as trace:
+        cached = _cache_lookup(key)
+        if cached is not None:
+            trace.set(cache_hit=True)
+            return cached, "cache"
+        text = await backend.fold_async(seq)
+        _cache_store(key, text)
+        return text, backend.name
+
+def get_pdb(seq):
+    """
+    折叠序列，结果只保存在内存中，多个请求可并行执行
+    超过 FOLD_MAX_LEN 的序列按重叠窗口并行折叠后拼接为全长结构
+
+    Returns:
+        折叠信息字典：pdb_text / pdb_path（仅本地回退时有值）/ source / truncated / original_length / folded_length / windows
+    """
+    seq, fold = _prepare_fold_sequence(seq)
+    fold["pdb_path"] = None
+    try:
+        if len(seq) > FOLD_MAX_LEN:
+            windows = plan_windows(len(seq), FOLD_MAX_LEN)
+            with ThreadPoolExecutor(max_workers=min(WINDOW_WORKERS, len(windows))) as pool:
+                results = list(pool.map(propagate(_fold_single), [seq[start:end] for start, end in windows]))
+            text = stitch_windows(windows, [t for t, _ in results], seq)
+            fold.update(windows=len(windows), source="chunked")
+        else:
+            text, source = _fold_single(seq)
+            fold["source"] = source
+    except Exception as e:
+        return _fold_fallback(fold, e)
+    fold["pdb_text"] = text
+    return fold
+
+async def get_pdb_async(seq):
+    """get_pdb 的异步版本，等待折叠后端时不阻塞事件循环"""
+    seq, fold = _prepare_fold_sequence(seq)
+    fold["pdb_path"] = None
+    try:
+        if len(seq) > FOLD_MAX_LEN:
+            windows = plan_windows(len(seq), FOLD_MAX_LEN)
+            slots = asyncio.Semaphore(WINDOW_WORKERS)
+
+            async def fold_window(window_seq):
+                async with slots:
+                    return await _fold_single_async(window_seq)
+
+            results = await asyncio.gather(*(fold_window(seq[start:end]) for start, end in windows))
+            text = await asyncio.to_thread(stitch_windows, windows, [t for t, _ in results], seq)
+            fold.update(windows=len(windows), source="chunked")
+        else:
+            text, source = await _fold_single_async(seq)
+            fold["source"] = source
+    except Exception as e:
+        return _fold_fallback(fold, e)
+    fold["pdb_text"] = text
+    return fold
+
+def fold_metadata(fold):
+    """写入智能体状态的折叠元数据（不含 PDB 文本）"""
+    return {k: v for k, v in fold.items() if k != "pdb_text"}
+
+def extract_structure_features(ctx):
+    ctx = load_structure_context(ctx)
     # 1. 基本信息
-    parser = PDBParser(QUIET=True)
-    structure = parser.get_structure("protein", pdb_file)
-    # 安全获取第一个模型
-    models = list(structure.get_models())
-    if len(models) == 0:
+    if len(ctx.atoms) == 0:
         raise ValueError("PDB中未找到任何模型（MODEL/ATOM 记录缺失或解析失败）。")
-    model = models[0]
-    chains = list(model.get_chains())
-    num_chains = len(chains)
-    chain_ids = [chain.id for chain in chains]
-    residues = [res for res in model.get_residues() if res.get_id()[0] == ' ']
-    num_residues = len(residues)
+    num_chains = len(ctx.chain_ids)
+    chain_ids = ctx.chain_ids
+    num_residues = ctx.num_residues
 
     # 2. pLDDT均值
-    struct = bsio.load_structure(pdb_file, extra_fields=["b_factor"])
     try:
-        plddt_mean = float(struct.b_factor.mean())
+        plddt_mean = float(ctx.b_factors.mean())
     except Exception:
         plddt_mean = None
 
-    # 3. 二级结构比例（需DSSP和mkdssp可用）
+    # 3. 二级结构比例（有 DSSP 时用 DSSP，否则 P-SEA；按结构哈希缓存）
     try:
-        dssp = DSSP(model, pdb_file)
-        helix = sum(1 for aa in dssp if aa[2] in ('H', 'G', 'I'))  # α-螺旋
-        sheet = sum(1 for aa in dssp if aa[2] in ('E', 'B'))        # β-折叠
-        coil = sum(1 for aa in dssp if aa[2] == ' ')                # 无规卷曲
-        total = len(dssp)
-        helix_percent = helix / total * 100
-        sheet_percent = sheet / total * 100
-        coil_percent = coil / total * 100
+        ss, ss_method = assign_secondary_structure(ctx)
+        helix_percent, sheet_percent, coil_percent = secondary_structure_percentages(ss)
     except Exception as e:
+        print(f"Warning: Secondary structure assignment failed: {e}")
+        ss_method = None
         helix_percent = sheet_percent = coil_percent = None
 
     # 4. 二硫键数量
-    disulfide_bonds = 0
-    cys_atoms = [atom for atom in struct if atom.element == "S" and atom.res_name == "CYS"]
-    # 简单统计，严格方法需空间距离判断
-    if len(cys_atoms) >= 2:
-        # 以3.0Å为阈值判断S-S键（欧氏距离）
-        for i in range(len(cys_atoms)):
-            for j in range(i+1, len(cys_atoms)):
-                diff = (cys_atoms[i].coord - cys_atoms[j].coord)
-                dist = ((diff ** 2).sum()) ** 0.5
-                if dist <= 3.0:
-                    disulfide_bonds += 1
+    # 以3.0Å为阈值判断S-S键（欧氏距离）
+    sg_mask = (ctx.elements == "S") & (ctx.atoms.res_name == "CYS")
+    disulfide_bonds = len(NeighborSearch(ctx.coords[sg_mask]).pairs_within(3.0))
 
     # 5. 疏水/亲水残基比例
-    hydrophobic = {"ALA","VAL","ILE","LEU","MET","PHE","TRP","PRO"}
-    hydrophilic = {"ARG","ASN","ASP","GLN","GLU","HIS","LYS","SER","THR","TYR","CYS"}
-    hydrophobic_count = sum(1 for res in residues if res.get_resname() in hydrophobic)
-    hydrophilic_count = sum(1 for res in residues if res.get_resname() in hydrophilic)
+    hydrophobic = ["ALA","VAL","ILE","LEU","MET","PHE","TRP","PRO"]
+    hydrophilic = ["ARG","ASN","ASP","GLN","GLU","HIS","LYS","SER","THR","TYR","CYS"]
+    hydrophobic_count = int(np.isin(ctx.res_names, hydrophobic).sum())
+    hydrophilic_count = int(np.isin(ctx.res_names, hydrophilic).sum())
     hydrophobic_ratio = (hydrophobic_count / num_residues * 100) if num_residues > 0 else None
     hydrophilic_ratio = (hydrophilic_count / num_residues * 100) if num_residues > 0 else None
 
@@ -113,66 +189,50 @@ def extract_structure_features(pdb_file):
         "helix_percent": helix_percent,
         "sheet_percent": sheet_percent,
         "coil_percent": coil_percent,
+        "ss_method": ss_method,
         "disulfide_bonds": disulfide_bonds,
         "hydrophobic_ratio": hydrophobic_ratio,
         "hydrophilic_ratio": hydrophilic_ratio
     }
 
-def find_metal_binding_sites(pdb_file):
-    parser = PDBParser(QUIET=True)
-    structure = parser.get_structure("protein", pdb_file)
+def find_metal_binding_sites(ctx):
+    ctx = load_structure_context(ctx)
+    atoms = ctx.atoms
     metals = []
-    for model in structure:
-        for chain in model:
-            for residue in chain:
-                if residue.id[0] == "H":  # HETATM
-                    resname = residue.get_resname()
-                    if resname in ["ZN", "MG", "CA", "FE", "CU", "MN", "CO", "NI"]:
-                        metals.append((resname, chain.id, residue.id[1]))
+    hetero_starts = struc.get_residue_starts(atoms)
+    for start in hetero_starts:
+        if atoms.hetero[start]:  # HETATM
+            resname = atoms.res_name[start]
+            if resname in ["ZN", "MG", "CA", "FE", "CU", "MN", "CO", "NI"]:
+                metals.append((str(resname), str(atoms.chain_id[start]), int(atoms.res_id[start])))
     return metals
 
-def find_binding_pockets(pdb_file):
+def find_binding_pockets(ctx):
     """使用简单几何方法识别结合口袋"""
     try:
-        from Bio.PDB import PDBParser
-        import numpy as np
+        ctx = load_structure_context(ctx)
+        pockets = []
+        # 获取所有原子坐标
+        atoms = ctx.coords
         
-        parser = PDBParser(QUIET=True)
-        structure = parser.get_structure("protein", pdb_file)
+        if len(atoms) < 10:
+            return pockets
         
-        pockets = []
-        for model in structure:
-            # 获取所有原子坐标
-            atoms = []
-            for chain in model:
-                for residue in chain:
-                    for atom in residue:
-                        atoms.append(atom.get_coord())
-            
-            if len(atoms) < 10:
-                return pockets
-                
-            atoms = np.array(atoms)
-            
-            # 简单的口袋识别：寻找表面凹陷
-            # 计算每个原子的可及性
-            accessible_atoms = []
-            for i, atom in enumerate(atoms):
-                distances = np.linalg.norm(atoms - atom, axis=1)
-                neighbors = np.sum(distances < 10.0)  # 10Å内的邻居
-                if neighbors < 15:  # 表面原子邻居较少
-                    accessible_atoms.append(i)
-            
-            # 寻找凹陷区域
-            if len(accessible_atoms) > 5:
-                surface_coords = atoms[accessible_atoms]
-                # 简单的聚类识别凹陷
-                pocket_centers = find_pocket_centers(surface_coords)
-                for center in pocket_centers:
-                    pockets.append({
-                        'center': center,
-                        'size': estimate_pocket_size(center, atoms)
-                    })
+        # 简单的口袋识别：寻找表面凹陷
+        # 计算每个原子的可及性：10Å内的邻居数，表面原子邻居较少
+        neighbors = ctx.atom_neighbors.count_within(atoms, 10.0)
+        accessible_atoms = np.flatnonzero(neighbors < 15)
+        
+        # 寻找凹陷区域
+        if len(accessible_atoms) > 5:
+            surface_coords = atoms[accessible_atoms]
+            # 简单的聚类识别凹陷
+            pocket_centers = find_pocket_centers(surface_coords)
+            for center in pocket_centers:
+                pockets.append({
+                    'center': center,
+                    'size': estimate_pocket_size(center, ctx.atom_neighbors)
+                })
         
         return pockets
     except Exception as e:
@@ -181,7 +241,6 @@ def find_binding_pockets(pdb_file):
 
 def find_pocket_centers(surface_coords, min_distance=8.0):
     """寻找口袋中心"""
-    import numpy as np
     from sklearn.cluster import DBSCAN
     
     if len(surface_coords) < 3:
@@ -199,21 +258,15 @@ def find_pocket_centers(surface_coords, min_distance=8.0):
     
     return centers
 
-def estimate_pocket_size(center, all_atoms, radius=8.0):
+def estimate_pocket_size(center, neighbors, radius=8.0):
     """估算口袋大小"""
-    import numpy as np
-    distances = np.linalg.norm(all_atoms - center, axis=1)
-    nearby_atoms = np.sum(distances < radius)
-    return nearby_atoms
+    return neighbors.count_within(center, radius)
 
-def analyze_flexibility(pdb_file):
+def analyze_flexibility(ctx):
     """基于B-factor分析结构柔性"""
     try:
-        import biotite.structure.io as bsio
-        import numpy as np
-        
-        struct = bsio.load_structure(pdb_file, extra_fields=["b_factor"])
-        b_factors = struct.b_factor
+        ctx = load_structure_context(ctx)
+        b_factors = ctx.b_factors
         
         if len(b_factors) == 0:
             return {}
@@ -242,87 +295,66 @@ def analyze_flexibility(pdb_file):
         print(f"Warning: Flexibility analysis failed: {e}")
         return {}
 
-def find_catalytic_sites(pdb_file):
+CATALYTIC_TYPES = ['HIS', 'ASP', 'GLU', 'SER', 'THR', 'CYS', 'LYS', 'ARG']
+HYDROPHOBIC_TYPES = ['ALA', 'VAL', 'ILE', 'LEU', 'MET', 'PHE', 'TRP']
+
+def _ca_neighbor_residues(ctx, res_idx, radius):
+    """同一条链上 CA 距离小于 radius 的残基序号（含自身）"""
+    hits = ctx.ca_residue_index[ctx.ca_neighbors.query_radius(ctx.ca_coords[res_idx], radius)[0]]
+    return hits[ctx.res_chain_ids[hits] == ctx.res_chain_ids[res_idx]]
+
+def find_catalytic_sites(ctx):
     """识别潜在的催化残基"""
     try:
-        from Bio.PDB import PDBParser
-        import numpy as np
-        
-        parser = PDBParser(QUIET=True)
-        structure = parser.get_structure("protein", pdb_file)
-        
+        ctx = load_structure_context(ctx)
         catalytic_residues = []
-        catalytic_types = ['HIS', 'ASP', 'GLU', 'SER', 'THR', 'CYS', 'LYS', 'ARG']
         
-        for model in structure:
-            for chain in model:
-                chain_residues = list(chain.get_residues())
-                
-                for residue in chain_residues:
-                    if residue.get_resname() in catalytic_types:
-                        # 检查是否在活性位点区域
-                        if is_in_active_site_region(residue, chain_residues):
-                            catalytic_residues.append({
-                                'residue': residue.get_resname(),
-                                'position': residue.get_id()[1],
-                                'chain': chain.id,
-                                'confidence': calculate_catalytic_confidence(residue, chain_residues)
-                            })
+        for res_idx in np.flatnonzero(np.isin(ctx.res_names, CATALYTIC_TYPES)):
+            # 检查是否在活性位点区域
+            if is_in_active_site_region(ctx, res_idx):
+                catalytic_residues.append({
+                    'residue': str(ctx.res_names[res_idx]),
+                    'position': int(ctx.res_ids[res_idx]),
+                    'chain': str(ctx.res_chain_ids[res_idx]),
+                    'confidence': calculate_catalytic_confidence(ctx, res_idx)
+                })
         
         return catalytic_residues
     except Exception as e:
         print(f"Warning: Catalytic site analysis failed: {e}")
         return []
 
-def is_in_active_site_region(residue, chain_residues):
+def is_in_active_site_region(ctx, res_idx):
     """判断残基是否在活性位点区域"""
     try:
-        import numpy as np
-        
         # 获取残基坐标
-        if 'CA' not in residue:
+        if not ctx.has_ca[res_idx]:
             return False
         
-        ca_coord = residue['CA'].get_coord()
-        
-        # 检查周围是否有其他催化残基
-        catalytic_neighbors = 0
-        for other_residue in chain_residues:
-            if other_residue.get_resname() in ['HIS', 'ASP', 'GLU', 'SER', 'THR', 'CYS', 'LYS', 'ARG']:
-                if 'CA' in other_residue:
-                    other_coord = other_residue['CA'].get_coord()
-                    distance = np.linalg.norm(ca_coord - other_coord)
-                    if distance < 15.0:  # 15Å内的催化残基
-                        catalytic_neighbors += 1
+        # 检查周围15Å内是否有其他催化残基
+        nearby = _ca_neighbor_residues(ctx, res_idx, 15.0)
+        catalytic_neighbors = int(np.isin(ctx.res_names[nearby], CATALYTIC_TYPES).sum())
         
         return catalytic_neighbors >= 2  # 至少2个催化残基邻居
     except Exception:
         return False
 
-def calculate_catalytic_confidence(residue, chain_residues):
+def calculate_catalytic_confidence(ctx, res_idx):
     """计算催化残基的置信度"""
     try:
-        import numpy as np
-        
         confidence = 0.5  # 基础置信度
         
         # 基于残基类型调整
-        resname = residue.get_resname()
+        resname = ctx.res_names[res_idx]
         if resname in ['HIS', 'ASP', 'GLU']:  # 常见催化残基
             confidence += 0.2
         elif resname in ['SER', 'CYS']:  # 亲核残基
             confidence += 0.1
         
         # 基于周围环境调整
-        if 'CA' in residue:
-            ca_coord = residue['CA'].get_coord()
-            nearby_hydrophobic = 0
-            for other_residue in chain_residues:
-                if other_residue.get_resname() in ['ALA', 'VAL', 'ILE', 'LEU', 'MET', 'PHE', 'TRP']:
-                    if 'CA' in other_residue:
-                        distance = np.linalg.norm(ca_coord - other_residue['CA'].get_coord())
-                        if distance < 8.0:
-                            nearby_hydrophobic += 1
+        if ctx.has_ca[res_idx]:
+            nearby = _ca_neighbor_residues(ctx, res_idx, 8.0)
+            nearby_hydrophobic = int(np.isin(ctx.res_names[nearby], HYDROPHOBIC_TYPES).sum())
             
             if nearby_hydrophobic >= 3:  # 周围有疏水环境
                 confidence += 0.1
@@ -331,14 +363,18 @@ def calculate_catalytic_confidence(residue, chain_residues):
     except Exception:
         return 0.5
 
-def calc_surface_area_and_volume(pdb_file):
-    struct = bsio.load_structure(pdb_file)
-    # 计算表面积
-    area = struc.sasa(struct)
-    total_area = area.sum()
-    # 体积估算（粗略，精确需用MSMS等工具）
-    atom_volumes = {"C": 20.6, "N": 15.6, "O": 14.7, "S": 33.5, "H": 5.2}
-    total_volume = sum(atom_volumes.get(atom.element, 18.0) for atom in struct)
+# 原子体积（Å³），未列出的元素按 18.0 计
+ATOM_VOLUMES = {"C": 20.6, "N": 15.6, "O": 14.7, "S": 33.5, "H": 5.2}
+DEFAULT_ATOM_VOLUME = 18.0
+
+def calc_surface_area_and_volume(ctx):
+    ctx = load_structure_context(ctx)
+    # 计算表面积（原子 SASA 缓存在结构上下文中，口袋 / 催化位点检测共用）
+    total_area = ctx.atom_sasa.sum()
+    # 体积估算（粗略，精确需用MSMS等工具）：按元素查表后求和
+    elements, inverse = np.unique(ctx.elements, return_inverse=True)
+    volumes = np.array([ATOM_VOLUMES.get(e, DEFAULT_ATOM_VOLUME) for e in elements])
+    total_volume = float(volumes[inverse].sum())
     return total_area, total_volume
 
 def calculate_structure_confidence(pdb_file, features, metals, area, volume) -> float:
@@ -445,90 +481,135 @@ def structure_features_to_text(features, metals, area, volume, pockets=None, fle
     
     return text
 
-from dotenv import load_dotenv
-from google import genai
+import llm_gateway
+from prompts import STRUCTURE_PROMPT
 
-load_dotenv()
-google_client = genai.Client()
+def build_structure_prompt(query_seq, docs):
+    """Returns: (静态前缀, 每蛋白内容)；结构智能体只看序列摘要"""
+    return STRUCTURE_PROMPT.render(sequence=query_seq, structure_info=docs)
 
 def generate(query_seq, docs) -> str:
-    prompt = f"""
-    You are a protein structure expert. Please provide a comprehensive functional prediction based on the following protein structure information:
-
-    Protein sequence:
-    {query_seq}
-
-    Protein structure information:
-    {docs}
-
-   Please generate a comprehensive, accurate, and fluent natural language functional description from three aspects:
-    1. Molecular Function (MF) - Biochemical activity of the protein
-    2. Biological Process (BP) - Biological processes the protein participates in
-    3. Cellular Component (CC) - Cellular localization of the protein
-
-    Please provide detailed and accurate functional descriptions, including:
-    - Main functional characteristics
-    - Possible biological roles
-    - Related metabolic pathways
-    - Potential disease associations
-    - Domain and functional site analysis
-    
-    """
-
     try:
-        response = google_client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt
-        )
-        return response.text
+        prefix, body = build_structure_prompt(query_seq, docs)
+        return llm_gateway.generate(body, agent="structure", prefix=prefix)
     except Exception:
         # 网络/SSL异常时降级为直接返回结构文本，避免中断
         return "[Structure LLM generation temporarily unavailable, returning structure summary]\n" + docs
 
-def structure_agent(state: dict) -> dict:
-    seq = state["input"]
-    pdb_file = get_pdb(seq)
-    features = extract_structure_features(pdb_file)
-    metals = find_metal_binding_sites(pdb_file)
-    area, volume = calc_surface_area_and_volume(pdb_file)
+async def generate_async(query_seq, docs) -> str:
+    try:
+        prefix, body = build_structure_prompt(query_seq, docs)
+        return await llm_gateway.generate_async(body, agent="structure", prefix=prefix)
+    except Exception:
+        return "[Structure LLM generation temporarily unavailable, returning structure summary]\n" + docs
+
+def collect_structure_features(ctx):
+    """
+    在同一个结构上下文上运行全部特征提取（纯本地计算）
+
+    Returns:
+        包含 features / metals / area / volume / pockets / flexibility / catalytic_sites 的字典
+    """
+    ctx = load_structure_context(ctx)
+    features = extract_structure_features(ctx)
+    metals = find_metal_binding_sites(ctx)
+    area, volume = calc_surface_area_and_volume(ctx)
     
     # 新增的结构分析功能
-    pockets = find_binding_pockets(pdb_file)
-    flexibility = analyze_flexibility(pdb_file)
-    catalytic_sites = find_catalytic_sites(pdb_file)
+    pockets = find_binding_pockets(ctx)
+    flexibility = analyze_flexibility(ctx)
+    catalytic_sites = find_catalytic_sites(ctx)
     
-    base_text = structure_features_to_text(features, metals, area, volume, pockets, flexibility, catalytic_sites)
-    
-    # 如果存在截断标记，提示并降权
-    truncated_flag_path = "Structure_Agent/.truncated"
-    if os.path.exists(truncated_flag_path):
-        try:
-            with open(truncated_flag_path, "r") as f:
-                orig_len = f.read().strip()
-        except Exception:
-            orig_len = "unknown"
-        base_text = (
-            f"Note: Input sequence exceeds ESM Atlas limit, structure prediction performed only on first 400 aa (original length: {orig_len}).\n" + base_text
-        )
-    
-    structure_nl = generate(seq, base_text)
-    structure_confidence = calculate_structure_confidence(pdb_file, features, metals, area, volume)
+    return {
+        "features": features,
+        "metals": metals,
+        "area": area,
+        "volume": volume,
+        "pockets": pockets,
+        "flexibility": flexibility,
+        "catalytic_sites": catalytic_sites,
+    }
+
+def score_structure(ctx, analysis, truncated=False):
+    """根据 collect_structure_features 的结果计算结构置信度"""
+    structure_confidence = calculate_structure_confidence(
+        ctx.path, analysis["features"], analysis["metals"], analysis["area"], analysis["volume"]
+    )
     
     # 根据新特征调整置信度
-    if pockets and len(pockets) > 0:
+    if analysis["pockets"]:
         structure_confidence = min(1.0, structure_confidence + 0.1)  # 有结合口袋增加置信度
     
-    if catalytic_sites and len(catalytic_sites) > 0:
+    if analysis["catalytic_sites"]:
         structure_confidence = min(1.0, structure_confidence + 0.05)  # 有催化位点增加置信度
     
-    if os.path.exists(truncated_flag_path):
+    if truncated:
         structure_confidence = max(0.0, min(1.0, structure_confidence * 0.7))
-        try:
-            os.remove(truncated_flag_path)
-        except Exception:
-            pass
+    
+    return structure_confidence
+
+def analyze_structure(fold):
+    """
+    提取结构特征并计算置信度（纯本地计算）
+
+    Args:
+        fold: get_pdb 返回的折叠信息字典，或 PDB / mmCIF 文件路径
+
+    Returns:
+        (结构描述文本, 结构置信度)
+    """
+    if isinstance(fold, str):
+        fold = {"pdb_path": fold, "pdb_text": None, "truncated": False}
+    with span("structure.features") as trace:
+        # 只解析一次，所有特征提取共用同一个结构上下文
+        if fold.get("pdb_text") is not None:
+            ctx = StructureContext.from_text(fold["pdb_text"], path=fold.get("pdb_path"))
+        else:
+            ctx = load_structure_context(fold["pdb_path"])
+        trace.set(residues=len(ctx.res_ids))
+        analysis = collect_structure_features(ctx)
+    
+    base_text = structure_features_to_text(
+        analysis["features"], analysis["metals"], analysis["area"], analysis["volume"],
+        analysis["pockets"], analysis["flexibility"], analysis["catalytic_sites"]
+    )
+    
+    if fold.get("windows", 1) > 1:
+        base_text = (
+            f"Note: Full-length structure assembled from {fold['windows']} overlapping {FOLD_MAX_LEN} aa prediction windows.\n" + base_text
+        )
+    
+    # 截断的序列：提示并降权
+    truncated = fold.get("truncated", False)
+    if truncated:
+        orig_len = fold.get("original_length", "unknown")
+        base_text = (
+            f"Note: Input sequence exceeds ESM Atlas limit, structure prediction performed only on first {FOLD_MAX_LEN} aa (original length: {orig_len}).\n" + base_text
+        )
+    
+    return base_text, score_structure(ctx, analysis, truncated)
+
+def structure_agent(state: dict) -> dict:
+    seq = state["input"]
+    fold = get_pdb(seq)
+    base_text, structure_confidence = analyze_structure(fold)
+    structure_nl = generate(seq, base_text)
+    
+    return {
+        "structure_nl": structure_nl,
+        "structure_confidence": structure_confidence,
+        "structure_meta": fold_metadata(fold)
+    }
+
+async def structure_agent_async(state: dict) -> dict:
+    """structure_agent 的异步版本：结构特征提取为 CPU 计算，放到线程中执行"""
+    seq = state["input"]
+    fold = await get_pdb_async(seq)
+    base_text, structure_confidence = await asyncio.to_thread(analyze_structure, fold)
+    structure_nl = await generate_async(seq, base_text)
     
     return {
         "structure_nl": structure_nl,
-        "structure_confidence": structure_confidence
+        "structure_confidence": structure_confidence,
+        "structure_meta": fold_metadata(fold)
     }
@@ -0,0 +1,273 @@
+"""
+序列检索的近邻搜索后端（可插拔）
+
+    exact  分块暴力检索，结果精确，作为召回率基准
+    ivfpq  faiss IVF-PQ，可选用 mmap 存储中的原始向量对候选精排；检索旋钮：nprobe / refine
+    hnsw   faiss HNSW（fp16 标量量化）；检索旋钮：ef_search
+
+ivfpq / hnsw 依赖 faiss（pip install faiss-cpu，已列入 requirement.txt）。
+所有后端返回平方欧氏距离，与 Seq_Agent 置信度阈值保持一致。
+ANN 索引文件保存在蛋白质索引目录中（ann_<backend>.faiss），由 build 子命令离线构建：
+    python Agents/ann_backends.py build --index Agents/protein_index --backend ivfpq
+    python Agents/ann_backends.py recall --index Agents/protein_index --backend ivfpq --k 10 --nprobe 32
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from embedding_store import open_store
+
+ADD_CHUNK = 65536
+
+
+def _import_faiss():
+    try:
+        import faiss
+    except ImportError as e:
+        raise ImportError(
+            "ivfpq / hnsw 检索后端需要 faiss：pip install faiss-cpu（或 conda install -c pytorch faiss-cpu）；"
+            "未安装时请使用 PROTEIN_INDEX_BACKEND=exact"
+        ) from e
+    return faiss
+
+
+def ann_index_path(index_dir, name):
+    return os.path.join(index_dir, f"ann_{name}.faiss")
+
+
+def _exact_rerank(store, queries, candidates, k):
+    """用存储中的原始向量对候选行精确重排"""
+    distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+    rows = np.full((len(queries), k), -1, dtype=np.int64)
+    for q, cand in enumerate(candidates):
+        cand = cand[cand >= 0]
+        if len(cand) == 0:
+            continue
+        # 有序读取对 mmap 更友好
+        cand = np.unique(cand)
+        vecs = store.get_embeddings(cand)
+        d = ((vecs - queries[q]) ** 2).sum(axis=1)
+        top = np.argsort(d)[:k]
+        distances[q, :len(top)] = d[top]
+        rows[q, :len(top)] = cand[top]
+    return distances, rows
+
+
+class ExactBackend:
+    name = "exact"
+
+    def __init__(self, store, index_dir=None, block_size=65536):
+        self.store = store
+        self.block_size = block_size
+
+    def search(self, queries, k):
+        """分块暴力检索，返回 (distances, rows)，均为 (Q, k) 数组"""
+        embeddings, norms = self.store.embeddings, self.store.norms
+        n = len(self.store)
+        k = min(k, n)
+        q_norms = np.einsum("ij,ij->i", queries, queries)
+
+        best_d = np.full((len(queries), 0), np.inf, dtype=np.float32)
+        best_i = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, n, self.block_size):
+            block = np.asarray(embeddings[start:start + self.block_size], dtype=np.float32)
+            d = q_norms[:, None] - 2.0 * queries @ block.T + norms[start:start + len(block)][None, :]
+            idx = np.arange(start, start + len(block))[None, :].repeat(len(queries), axis=0)
+            best_d = np.concatenate([best_d, d], axis=1)
+            best_i = np.concatenate([best_i, idx], axis=1)
+            if best_d.shape[1] > k:
+                part = np.argpartition(best_d, k - 1, axis=1)[:, :k]
+                best_d = np.take_along_axis(best_d, part, axis=1)
+                best_i = np.take_along_axis(best_i, part, axis=1)
+
+        order = np.argsort(best_d, axis=1)
+        distances = np.maximum(np.take_along_axis(best_d, order, axis=1), 0.0)
+        return distances, np.take_along_axis(best_i, order, axis=1)
+
+
+class IVFPQBackend:
+    name = "ivfpq"
+
+    def __init__(self, store, index_dir, nprobe=32, refine=10):
+        """
+        Args:
+            nprobe: 检索的倒排桶数，越大召回越高、延迟越高
+            refine: 先取 k*refine 个 PQ 候选，再用原始向量精排；0 表示不精排
+        """
+        faiss = _import_faiss()
+
+        self.store = store
+        # IVF 倒排表支持 mmap，多个 worker 共享 page cache
+        self.index = faiss.read_index(ann_index_path(index_dir, self.name), faiss.IO_FLAG_MMAP)
+        self.index.nprobe = nprobe
+        self.refine = refine
+
+    def search(self, queries, k):
+        k = min(k, len(self.store))
+        if not self.refine:
+            distances, rows = self.index.search(queries, k)
+            return distances, rows.astype(np.int64)
+        _, candidates = self.index.search(queries, k * self.refine)
+        return _exact_rerank(self.store, queries, candidates, k)
+
+    @staticmethod
+    def build(store, index_dir, nlist=None, m=64, nbits=8, train_size=None):
+        faiss = _import_faiss()
+
+        n, dim = len(store), store.dim
+        if nlist is None:
+            # 经验值：约 4*sqrt(N) 个倒排桶
+            nlist = max(16, int(4 * np.sqrt(n)))
+        train_size = min(n, train_size or max(64 * nlist, 2 ** nbits * 40))
+        train_rows = np.sort(np.random.default_rng(0).choice(n, size=train_size, replace=False))
+
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, m, nbits)
+        index.train(store.get_embeddings(train_rows))
+        for start in range(0, n, ADD_CHUNK):
+            index.add(np.asarray(store.embeddings[start:start + ADD_CHUNK], dtype=np.float32))
+        faiss.write_index(index, ann_index_path(index_dir, IVFPQBackend.name))
+        return {"nlist": nlist, "m": m, "nbits": nbits, "train_size": train_size}
+
+
+class HNSWBackend:
+    name = "hnsw"
+
+    def __init__(self, store, index_dir, ef_search=64):
+        """
+        Args:
+            ef_search: 检索时的候选队列长度，越大召回越高、延迟越高
+        """
+        faiss = _import_faiss()
+
+        self.store = store
+        self.index = faiss.read_index(ann_index_path(index_dir, self.name))
+        faiss.downcast_index(self.index).hnsw.efSearch = ef_search
+
+    def search(self, queries, k):
+        k = min(k, len(self.store))
+        distances, rows = self.index.search(queries, k)
+        return distances, rows.astype(np.int64)
+
+    @staticmethod
+    def build(store, index_dir, m=32, ef_construction=200):
+        faiss = _import_faiss()
+
+        # fp16 标量量化，内存占用约为 IndexHNSWFlat 的一半，精度损失可忽略
+        index = faiss.IndexHNSWSQ(store.dim, faiss.ScalarQuantizer.QT_fp16, m)
+        index.hnsw.efConstruction = ef_construction
+        index.train(store.get_embeddings(np.arange(min(len(store), 10000))))
+        for start in range(0, len(store), ADD_CHUNK):
+            index.add(np.asarray(store.embeddings[start:start + ADD_CHUNK], dtype=np.float32))
+        faiss.write_index(index, ann_index_path(index_dir, HNSWBackend.name))
+        return {"m": m, "ef_construction": ef_construction}
+
+
+BACKENDS = {
+    ExactBackend.name: ExactBackend,
+    IVFPQBackend.name: IVFPQBackend,
+    HNSWBackend.name: HNSWBackend,
+}
+
+
+def load_backend(name, store, index_dir, **search_params):
+    """
+    按名称加载检索后端
+
+    Args:
+        name: exact / ivfpq / hnsw
+        store: EmbeddingStore
+        index_dir: 索引目录
+        search_params: 检索旋钮（nprobe / refine / ef_search 等）
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"未知的检索后端: {name}，可选: {', '.join(BACKENDS)}")
+    return BACKENDS[name](store, index_dir, **search_params)
+
+
+def build_backend(name, index_dir, **build_params):
+    store = open_store(index_dir)
+    if name == ExactBackend.name:
+        return {}
+    params = BACKENDS[name].build(store, index_dir, **build_params)
+    with open(os.path.join(index_dir, f"ann_{name}.json"), "w", encoding="utf-8") as f:
+        json.dump(params, f)
+    return params
+
+
+def measure_recall(index_dir, name, k=10, num_queries=200, **search_params):
+    """
+    以 exact 为基准统计 recall@k 与单查询延迟
+
+    查询向量取自存储中的随机行（不排除自身），与真实检索时的分布一致。
+    """
+    store = open_store(index_dir)
+    exact = ExactBackend(store)
+    backend = load_backend(name, store, index_dir, **search_params)
+    rows = np.random.default_rng(1).choice(len(store), size=min(num_queries, len(store)), replace=False)
+    queries = store.get_embeddings(np.sort(rows))
+
+    hits, latencies = 0, []
+    for q in queries:
+        q = q[None, :]
+        _, truth = exact.search(q, k)
+        t0 = time.perf_counter()
+        _, found = backend.search(q, k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        hits += len(set(truth[0].tolist()) & set(found[0].tolist()))
+
+    latencies = np.array(latencies)
+    return {
+        "backend": name,
+        "k": k,
+        "queries": len(queries),
+        "recall": hits / (len(queries) * min(k, len(store))),
+        "latency_ms_p50": float(np.percentile(latencies, 50)),
+        "latency_ms_p95": float(np.percentile(latencies, 95)),
+        "params": search_params,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="蛋白质索引 ANN 后端工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="构建 ANN 索引")
+    build.add_argument("--index", default="Agents/protein_index")
+    build.add_argument("--backend", choices=sorted(BACKENDS), default="ivfpq")
+    build.add_argument("--nlist", type=int, default=None)
+    build.add_argument("--pq-m", type=int, default=64)
+    build.add_argument("--hnsw-m", type=int, default=32)
+    build.add_argument("--ef-construction", type=int, default=200)
+
+    recall = sub.add_parser("recall", help="统计相对 exact 检索的 recall@k 与延迟")
+    recall.add_argument("--index", default="Agents/protein_index")
+    recall.add_argument("--backend", choices=sorted(BACKENDS), default="ivfpq")
+    recall.add_argument("--k", type=int, default=10)
+    recall.add_argument("--queries", type=int, default=200)
+    recall.add_argument("--nprobe", type=int, default=32)
+    recall.add_argument("--refine", type=int, default=10)
+    recall.add_argument("--ef-search", type=int, default=64)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        if args.backend == "ivfpq":
+            params = build_backend(args.backend, args.index, nlist=args.nlist, m=args.pq_m)
+        elif args.backend == "hnsw":
+            params = build_backend(args.backend, args.index, m=args.hnsw_m, ef_construction=args.ef_construction)
+        else:
+            params = build_backend(args.backend, args.index)
+        print(f"✅ {args.backend} 索引构建完成: {params}")
+    elif args.command == "recall":
+        if args.backend == "ivfpq":
+            search_params = {"nprobe": args.nprobe, "refine": args.refine}
+        elif args.backend == "hnsw":
+            search_params = {"ef_search": args.ef_search}
+        else:
+            search_params = {}
+        report = measure_recall(args.index, args.backend, k=args.k, num_queries=args.queries, **search_params)
+        print(json.dumps(report, indent=2, ensure_ascii=False))
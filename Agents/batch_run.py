@@ -0,0 +1,275 @@
+"""
+多序列批量分析入口
+
+读取 FASTA 或 TSV（id<TAB>sequence）文件，以有限并发运行 function / sequence / structure / reasoning
+四个智能体，每个蛋白完成后立即追加写入 JSONL。单个蛋白失败只记录错误，不影响其余蛋白。
+每 DEEPGO_BATCH_SIZE 条蛋白先用一次多记录 FASTA 请求预取 GO terms。
+结束时打印按 span 汇总的耗时 / token / 缓存分解（每个蛋白一个 protein span，见 tracing）。
+
+用法：
+    python Agents/batch_run.py proteome.fasta --output Agents/batch_results.jsonl --concurrency 8
+    python Agents/batch_run.py proteome.fasta --async --concurrency 64   # 单事件循环，无需每个请求一个线程
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from update import app, async_app
+from http_client import http_stats
+from llm_gateway import llm_stats
+from deepgo_client import BATCH_SIZE as DEEPGO_BATCH_SIZE, prefetch_go_terms
+from tracing import propagate, span, trace_run
+
+RESULT_KEYS = [
+    "function_nl", "function_confidence",
+    "sequence_nl", "sequence_confidence",
+    "structure_nl", "structure_confidence", "structure_meta",
+    "final_answer", "final_confidence",
+]
+
+
+def read_sequences(path):
+    """
+    逐条读取 FASTA 或 TSV 中的序列
+
+    Yields:
+        (protein_id, sequence)
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        first = f.readline()
+        f.seek(0)
+        if first.startswith(">"):
+            protein_id, chunks = None, []
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if line.startswith(">"):
+                    if protein_id is not None and chunks:
+                        yield protein_id, "".join(chunks).upper()
+                    # 兼容 UniProt 头部 >sp|P12345|NAME_HUMAN ...
+                    header = line[1:].split()[0]
+                    parts = header.split("|")
+                    protein_id = parts[1] if len(parts) >= 3 else header
+                    chunks = []
+                else:
+                    chunks.append(line)
+            if protein_id is not None and chunks:
+                yield protein_id, "".join(chunks).upper()
+        else:
+            for line_no, line in enumerate(f):
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) < 2 or not fields[1].strip():
+                    continue
+                # 跳过表头
+                if line_no == 0 and fields[1].strip().lower() in ("sequence", "seq"):
+                    continue
+                yield fields[0].strip(), fields[1].strip().upper()
+
+
+def load_finished_ids(output_path):
+    """读取已成功完成的蛋白 id，用于断点续跑"""
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "ok":
+                finished.add(record["id"])
+    return finished
+
+
+def _fill_record(record, result):
+    record["status"] = "ok"
+    for key in RESULT_KEYS:
+        if key in result:
+            record[key] = result[key]
+
+
+def _fill_error(record, e):
+    record["status"] = "error"
+    record["error"] = f"{type(e).__name__}: {e}"
+
+
+def analyze_one(protein_id, sequence):
+    """分析单个蛋白，异常被捕获为错误记录"""
+    start = time.time()
+    record = {"id": protein_id, "length": len(sequence)}
+    with span("protein", id=protein_id, length=len(sequence)) as trace:
+        try:
+            _fill_record(record, app.invoke({"input": sequence}))
+        except Exception as e:
+            _fill_error(record, e)
+        trace.set(status=record["status"])
+    record["elapsed_s"] = round(time.time() - start, 3)
+    return record
+
+
+async def analyze_one_async(protein_id, sequence):
+    start = time.time()
+    record = {"id": protein_id, "length": len(sequence)}
+    with span("protein", track_cpu=False, id=protein_id, length=len(sequence)) as trace:
+        try:
+            _fill_record(record, await async_app.ainvoke({"input": sequence}))
+        except Exception as e:
+            _fill_error(record, e)
+        trace.set(status=record["status"])
+    record["elapsed_s"] = round(time.time() - start, 3)
+    return record
+
+
+def _write_record(out, counts, record):
+    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    out.flush()
+    counts[record["status"]] += 1
+    done = counts["ok"] + counts["error"]
+    print(f"[{done}] {record['id']} {record['status']} ({record['elapsed_s']}s)")
+
+
+def _pending(input_path, finished, counts):
+    for protein_id, sequence in read_sequences(input_path):
+        if protein_id in finished:
+            counts["skipped"] += 1
+            continue
+        yield protein_id, sequence
+
+
+def iter_chunks(pairs, size):
+    """把 (id, sequence) 流按 size 条分组"""
+    chunk = []
+    for pair in pairs:
+        chunk.append(pair)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _prefetch(chunk):
+    # 一次 FASTA 请求预取整组蛋白的 GO terms，智能体中的逐条查询随后命中缓存
+    try:
+        prefetch_go_terms([seq for _, seq in chunk])
+    except Exception as e:
+        print(f"Warning: DeepGO prefetch failed: {e}")
+
+
+def _open_output(output_path):
+    out_dir = os.path.dirname(output_path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    return open(output_path, "a", encoding="utf-8")
+
+
+def run_batch(input_path, output_path, concurrency=8, resume=True):
+    """
+    批量分析并流式写出结果
+
+    Args:
+        input_path: FASTA 或 TSV 文件
+        output_path: 输出 JSONL 文件（追加写入）
+        concurrency: 同时分析的蛋白数
+        resume: 跳过输出文件中已成功的蛋白
+
+    Returns:
+        {"ok": 成功数, "error": 失败数, "skipped": 跳过数}
+    """
+    finished = load_finished_ids(output_path) if resume else set()
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+    write_lock = threading.Lock()
+    # 限制排队中的任务数，避免一次性把整个蛋白组读入内存
+    slots = threading.BoundedSemaphore(concurrency * 2)
+
+    with _open_output(output_path) as out, ThreadPoolExecutor(max_workers=concurrency) as pool, \
+            ThreadPoolExecutor(max_workers=1) as prefetcher:
+        def on_done(future):
+            with write_lock:
+                _write_record(out, counts, future.result())
+            slots.release()
+
+        def submit_chunk(chunk, prefetch):
+            # 等本组预取写入缓存后再提交，组内蛋白的 GO 查询直接命中缓存
+            prefetch.result()
+            for protein_id, sequence in chunk:
+                slots.acquire()
+                pool.submit(propagate(analyze_one), protein_id, sequence).add_done_callback(on_done)
+
+        # 预取提前一组：当前组的蛋白分析期间，下一组的 DeepGO 请求已在后台发出
+        ahead = None
+        for chunk in iter_chunks(_pending(input_path, finished, counts), DEEPGO_BATCH_SIZE):
+            prefetch = prefetcher.submit(propagate(_prefetch), chunk)
+            if ahead is not None:
+                submit_chunk(*ahead)
+            ahead = (chunk, prefetch)
+        if ahead is not None:
+            submit_chunk(*ahead)
+
+    return counts
+
+
+async def run_batch_async(input_path, output_path, concurrency=32, resume=True):
+    """
+    run_batch 的异步版本：所有蛋白共享一个事件循环，并发数由信号量限制
+    CPU 计算（ESM 编码、结构特征）在节点内部交给线程执行
+    """
+    finished = load_finished_ids(output_path) if resume else set()
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+    slots = asyncio.Semaphore(concurrency)
+    pending = set()
+
+    async def worker(protein_id, sequence, out):
+        try:
+            _write_record(out, counts, await analyze_one_async(protein_id, sequence))
+        finally:
+            slots.release()
+
+    async def submit_chunk(chunk, prefetch, out):
+        await prefetch
+        for protein_id, sequence in chunk:
+            await slots.acquire()
+            task = asyncio.create_task(worker(protein_id, sequence, out))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+    with _open_output(output_path) as out:
+        # 与 run_batch 相同，DeepGO 预取提前一组
+        ahead = None
+        for chunk in iter_chunks(_pending(input_path, finished, counts), DEEPGO_BATCH_SIZE):
+            prefetch = asyncio.create_task(asyncio.to_thread(_prefetch, chunk))
+            if ahead is not None:
+                await submit_chunk(*ahead, out)
+            ahead = (chunk, prefetch)
+        if ahead is not None:
+            await submit_chunk(*ahead, out)
+        if pending:
+            await asyncio.gather(*pending)
+
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多智能体蛋白质批量分析")
+    parser.add_argument("input", help="FASTA 或 TSV（id<TAB>sequence）文件")
+    parser.add_argument("--output", default="Agents/batch_results.jsonl")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--no-resume", action="store_true", help="不跳过已完成的蛋白")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="使用异步节点在单个事件循环中并发")
+    args = parser.parse_args()
+
+    with trace_run("batch", input=args.input, concurrency=args.concurrency):
+        if args.use_async:
+            counts = asyncio.run(run_batch_async(args.input, args.output, concurrency=args.concurrency, resume=not args.no_resume))
+        else:
+            counts = run_batch(args.input, args.output, concurrency=args.concurrency, resume=not args.no_resume)
+    print(f"✅ 批量分析完成: 成功 {counts['ok']}，失败 {counts['error']}，跳过 {counts['skipped']}")
+    print("外部 API 统计:", json.dumps(http_stats(), indent=2, ensure_ascii=False))
+    print("LLM 调用统计:", json.dumps(llm_stats(), indent=2, ensure_ascii=False))
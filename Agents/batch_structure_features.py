@@ -0,0 +1,197 @@
+"""
+批量结构特征提取
+
+输入一个目录（递归查找 PDB / mmCIF）或清单文件（每行一个路径，或带 path 列的 CSV / TSV），
+用进程池并行提取结构特征（mmCIF 直接读取，无需先转换为 PDB），每个结构一行写入 Parquet。
+每个 worker 单线程计算，吞吐随 CPU 核数线性增长。
+
+用法：
+    python Agents/batch_structure_features.py Structure_Agent --output Agents/structure_features.parquet --workers 8
+    python Agents/batch_structure_features.py manifest.tsv --output features.parquet
+"""
+
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+STRUCTURE_SUFFIXES = (".pdb", ".ent", ".cif", ".mmcif", ".bcif")
+WRITE_BATCH_ROWS = 256
+
+SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("path", pa.string()),
+    ("status", pa.string()),
+    ("error", pa.string()),
+    ("num_chains", pa.int32()),
+    ("chain_ids", pa.list_(pa.string())),
+    ("num_residues", pa.int32()),
+    ("sequence", pa.string()),
+    ("plddt_mean", pa.float64()),
+    ("helix_percent", pa.float64()),
+    ("sheet_percent", pa.float64()),
+    ("coil_percent", pa.float64()),
+    ("ss_method", pa.string()),
+    ("disulfide_bonds", pa.int32()),
+    ("hydrophobic_ratio", pa.float64()),
+    ("hydrophilic_ratio", pa.float64()),
+    ("surface_area", pa.float64()),
+    ("volume", pa.float64()),
+    ("metal_sites", pa.list_(pa.string())),
+    ("num_pockets", pa.int32()),
+    ("largest_pocket_size", pa.int32()),
+    ("flexibility_score", pa.float64()),
+    ("num_catalytic_sites", pa.int32()),
+    ("structure_confidence", pa.float64()),
+    ("elapsed_s", pa.float64()),
+])
+
+
+def list_structures(source):
+    """
+    Args:
+        source: 结构目录，或清单文件（每行一个路径 / 带 path 列的 CSV、TSV，可选 id 列）
+
+    Returns:
+        [(structure_id, path), ...]
+    """
+    if os.path.isdir(source):
+        entries = []
+        for root, _, files in os.walk(source):
+            for fname in sorted(files):
+                if fname.lower().endswith(STRUCTURE_SUFFIXES):
+                    entries.append((os.path.splitext(fname)[0], os.path.join(root, fname)))
+        return sorted(entries, key=lambda item: item[1])
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, "r", encoding="utf-8") as f:
+        first = f.readline()
+        f.seek(0)
+        delimiter = "\t" if "\t" in first else ","
+        header = [h.strip().lower() for h in first.split(delimiter)]
+        if "path" in header:
+            rows = [(row.get("id"), row["path"]) for row in csv.DictReader(f, delimiter=delimiter)]
+        else:
+            rows = [(None, line.strip()) for line in f if line.strip() and not line.startswith("#")]
+
+    entries = []
+    for structure_id, path in rows:
+        path = path if os.path.isabs(path) else os.path.join(base_dir, path)
+        entries.append((structure_id or os.path.splitext(os.path.basename(path))[0], path))
+    return entries
+
+
+def _worker_init():
+    # 并行度由进程数提供，避免每个进程再开 BLAS / OpenMP 线程抢占核心
+    os.environ["OMP_NUM_THREADS"] = "1"
+    os.environ["OPENBLAS_NUM_THREADS"] = "1"
+    os.environ["MKL_NUM_THREADS"] = "1"
+    try:
+        # fork 出的进程已加载 NumPy，环境变量不再生效，需在运行时限制线程池
+        from threadpoolctl import threadpool_limits
+
+        threadpool_limits(1)
+    except ImportError:
+        pass
+
+
+def extract_one(entry):
+    """在 worker 进程中提取单个结构的特征行，异常记录在 error 列"""
+    from Struct_Agent import collect_structure_features, score_structure
+    from structure_context import StructureContext
+    import biotite.structure as struc
+
+    structure_id, path = entry
+    start = time.time()
+    row = {"id": structure_id, "path": path}
+    try:
+        ctx = StructureContext.from_file(path)
+        analysis = collect_structure_features(ctx)
+        features = analysis["features"]
+        sequences, _ = struc.to_sequence(ctx.protein) if ctx.num_residues else ([], None)
+        row.update(
+            status="ok",
+            num_chains=features["num_chains"],
+            chain_ids=[str(c) for c in features["chain_ids"]],
+            num_residues=features["num_residues"],
+            sequence="".join(str(seq) for seq in sequences),
+            plddt_mean=features["plddt_mean"],
+            helix_percent=features["helix_percent"],
+            sheet_percent=features["sheet_percent"],
+            coil_percent=features["coil_percent"],
+            ss_method=features.get("ss_method"),
+            disulfide_bonds=features["disulfide_bonds"],
+            hydrophobic_ratio=features["hydrophobic_ratio"],
+            hydrophilic_ratio=features["hydrophilic_ratio"],
+            surface_area=float(analysis["area"]),
+            volume=float(analysis["volume"]),
+            metal_sites=[f"{name}:{chain}:{res_id}" for name, chain, res_id in analysis["metals"]],
+            num_pockets=len(analysis["pockets"]),
+            largest_pocket_size=max((p["size"] for p in analysis["pockets"]), default=None),
+            flexibility_score=analysis["flexibility"].get("flexibility_score"),
+            num_catalytic_sites=len(analysis["catalytic_sites"]),
+            structure_confidence=score_structure(ctx, analysis),
+        )
+    except Exception as e:
+        row["status"] = "error"
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["elapsed_s"] = round(time.time() - start, 3)
+    return row
+
+
+def _write_rows(writer, rows):
+    columns = {field.name: [row.get(field.name) for row in rows] for field in SCHEMA}
+    writer.write_table(pa.Table.from_pydict(columns, schema=SCHEMA))
+
+
+def run_structure_batch(source, output_path, workers=None, chunksize=4):
+    """
+    并行提取并写出 Parquet
+
+    Args:
+        source: 结构目录或清单文件
+        output_path: 输出 Parquet 文件
+        workers: 进程数，默认等于 CPU 核数
+        chunksize: 每次分发给 worker 的结构数
+
+    Returns:
+        {"ok": 成功数, "error": 失败数}
+    """
+    entries = list_structures(source)
+    workers = workers or os.cpu_count() or 1
+    counts = {"ok": 0, "error": 0}
+    out_dir = os.path.dirname(output_path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    rows = []
+    with pq.ParquetWriter(output_path, SCHEMA) as writer, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_worker_init) as pool:
+        for row in pool.map(extract_one, entries, chunksize=chunksize):
+            counts[row["status"]] += 1
+            if row["status"] == "error":
+                print(f"Warning: {row['path']}: {row['error']}")
+            rows.append(row)
+            if len(rows) >= WRITE_BATCH_ROWS:
+                _write_rows(writer, rows)
+                rows = []
+        if rows:
+            _write_rows(writer, rows)
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量结构特征提取（PDB / mmCIF -> Parquet）")
+    parser.add_argument("source", help="结构目录，或清单文件（每行一个路径 / 带 path 列的 CSV、TSV）")
+    parser.add_argument("--output", default="Agents/structure_features.parquet")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunksize", type=int, default=4)
+    args = parser.parse_args()
+
+    start = time.time()
+    counts = run_structure_batch(args.source, args.output, workers=args.workers, chunksize=args.chunksize)
+    print(f"✅ 结构特征提取完成: 成功 {counts['ok']}，失败 {counts['error']}，耗时 {time.time() - start:.1f}s -> {args.output}")
@@ -0,0 +1,134 @@
+"""
+长序列分窗折叠与拼接
+
+ESM Atlas 单次只能折叠 400 aa。超长序列切成相互重叠的窗口分别折叠（窗口可并行、可命中结构缓存），
+再以重叠区的 CA 原子做 Kabsch 叠合，把各窗口拼成一个全长结构：
+    - 重叠区在中点处切开，每个残基取自离窗口边缘更远的那个窗口
+    - B-factor（pLDDT）随原子一起保留，因此逐残基 pLDDT 与二级结构（DSSP）覆盖全长
+    - 窗口残基数（及给出序列时的残基类型）与请求不符，或重叠区可配对的 CA 少于 MIN_OVERLAP_CA 个时抛出 ValueError，
+      由调用方回退，不会静默拼出缺失残基的结构
+"""
+
+import io
+import os
+
+import numpy as np
+import biotite.structure as struc
+import biotite.structure.io.pdb as bpdb
+from biotite.sequence import ProteinSequence
+
+WINDOW_OVERLAP = int(os.environ.get("FOLD_WINDOW_OVERLAP", "100"))
+WINDOW_WORKERS = int(os.environ.get("FOLD_WINDOW_WORKERS", "4"))
+# Kabsch 叠合至少需要 3 对点
+MIN_OVERLAP_CA = 3
+
+
+def plan_windows(length, window, overlap=WINDOW_OVERLAP):
+    """
+    规划重叠窗口
+
+    Args:
+        length: 序列长度
+        window: 窗口长度（折叠长度上限）
+        overlap: 相邻窗口最少重叠的残基数
+
+    Returns:
+        [(start, end), ...]，左闭右开；最后一个窗口与序列末端对齐
+    """
+    if length <= window:
+        return [(0, length)]
+    overlap = min(overlap, window // 2)
+    step = window - overlap
+    windows = []
+    start = 0
+    while start + window < length:
+        windows.append((start, start + window))
+        start += step
+    windows.append((length - window, length))
+    return windows
+
+
+def _window_atoms(pdb_text, offset):
+    """解析单个窗口的蛋白原子，并把残基编号改为全长序列中的位置（从 1 开始）"""
+    atoms = bpdb.get_structure(bpdb.PDBFile.read(io.StringIO(pdb_text)), model=1, extra_fields=["b_factor"])
+    atoms = atoms[~atoms.hetero]
+    starts = struc.get_residue_starts(atoms)
+    ordinal = np.searchsorted(starts, np.arange(len(atoms)), side="right") - 1
+    atoms.res_id = ordinal + offset + 1
+    atoms.chain_id[:] = "A"
+    return atoms
+
+
+def _one_letter(res_name):
+    try:
+        return ProteinSequence.convert_letter_3to1(res_name)
+    except KeyError:
+        return "X"
+
+
+def _check_window(atoms, start, end, sequence):
+    n_residues = len(struc.get_residue_starts(atoms))
+    if n_residues != end - start:
+        raise ValueError(
+            f"Fold window {start + 1}-{end} returned {n_residues} residues, expected {end - start}"
+        )
+    if sequence is None:
+        return
+    names = atoms.res_name[struc.get_residue_starts(atoms)]
+    mismatches = sum(
+        1 for name, expected in zip(names, sequence[start:end])
+        if _one_letter(name) not in (expected, "X") and expected != "X"
+    )
+    if mismatches:
+        raise ValueError(
+            f"Fold window {start + 1}-{end} does not match the input sequence ({mismatches} residues differ)"
+        )
+
+
+def stitch_windows(windows, pdb_texts, sequence=None):
+    """
+    把各窗口的预测结构拼接为全长结构
+
+    Args:
+        windows: plan_windows 的结果
+        pdb_texts: 与 windows 一一对应的 PDB 文本
+        sequence: 全长序列（可选），给出时逐窗口核对残基类型
+
+    Returns:
+        全长 PDB 文本
+
+    Raises:
+        ValueError: 某个窗口的残基数或残基类型与请求不符，或重叠区无法叠合
+    """
+    pieces = []
+    prev, prev_end = None, None
+    for (start, end), text in zip(windows, pdb_texts):
+        atoms = _window_atoms(text, start)
+        _check_window(atoms, start, end, sequence)
+        if prev is not None:
+            # 用重叠区 CA 把当前窗口叠合到上一个（已叠合的）窗口坐标系
+            overlap_ids = np.arange(start + 1, prev_end + 1)
+            fixed = prev[(prev.atom_name == "CA") & np.isin(prev.res_id, overlap_ids)]
+            mobile_mask = (atoms.atom_name == "CA") & np.isin(atoms.res_id, fixed.res_id)
+            mobile = atoms[mobile_mask]
+            fixed = fixed[np.isin(fixed.res_id, mobile.res_id)]
+            if len(fixed) < MIN_OVERLAP_CA:
+                raise ValueError(
+                    f"Fold window {start + 1}-{end} shares only {len(fixed)} CA atoms with the previous window"
+                )
+            _, transform = struc.superimpose(fixed.coord, mobile.coord)
+            atoms.coord = transform.apply(atoms.coord)
+            # 重叠区中点切开：上一个窗口保留到 cut，当前窗口从 cut+1 开始
+            cut = (start + prev_end) // 2
+            pieces[-1] = pieces[-1][pieces[-1].res_id <= cut]
+            pieces.append(atoms[atoms.res_id > cut])
+        else:
+            pieces.append(atoms)
+        prev, prev_end = atoms, end
+
+    full = struc.concatenate(pieces)
+    pdb_file = bpdb.PDBFile()
+    pdb_file.set_structure(full)
+    out = io.StringIO()
+    pdb_file.write(out)
+    return out.getvalue()
@@ -0,0 +1,218 @@
+"""
+DeepGO 客户端：多序列 FASTA 批量提交 + 本地结果缓存
+
+DeepGO 的 data_format=fasta 一次可以携带多条记录。批量路径把待查询的序列按 DEEPGO_BATCH_SIZE 条
+拼成一个多记录 FASTA 请求，再按记录头把响应中的 predictions 拆回每个蛋白，
+拆分后的单蛋白响应与逐条提交时的结构一致（顶层字段 + 只含该蛋白的 predictions）。
+
+缓存：SQLite，键为 sha256(序列) + 模型版本 + 阈值，超过 DEEPGO_CACHE_TTL_DAYS 天视为过期
+（version=latest 时服务端模型可能更新）。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from http_client import get_async_http_client, get_http_client
+from tracing import span
+
+DEEPGO_URL = "https://deepgo.cbrc.kaust.edu.sa/deepgo/api/create"
+DEEPGO_HEADERS = {"Content-Type": "application/json"}
+DEEPGO_VERSION = os.environ.get("DEEPGO_VERSION", "latest")
+DEEPGO_TIMEOUT = float(os.environ.get("DEEPGO_TIMEOUT", "120"))
+BATCH_SIZE = int(os.environ.get("DEEPGO_BATCH_SIZE", "32"))
+CACHE_PATH = os.environ.get("DEEPGO_CACHE_PATH", "Agents/.cache/deepgo.sqlite")
+CACHE_TTL = float(os.environ.get("DEEPGO_CACHE_TTL_DAYS", "30")) * 86400
+
+
+def go_cache_key(sequence, version, threshold):
+    return f"{hashlib.sha256(sequence.encode('utf-8')).hexdigest()}:{version}:{threshold}"
+
+
+class GOTermCache:
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL):
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS go_terms (key TEXT PRIMARY KEY, response TEXT, created REAL)")
+
+    def get_many(self, keys):
+        """返回 {key: 响应字典}，未命中或已过期的键不在结果中"""
+        found = {}
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                row = self._conn.execute("SELECT response, created FROM go_terms WHERE key = ?", (key,)).fetchone()
+                if row is not None and now - row[1] <= self.ttl:
+                    found[key] = json.loads(row[0])
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO go_terms VALUES (?, ?, ?)",
+                    [(key, json.dumps(response, ensure_ascii=False), now) for key, response in items.items()],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_go_cache():
+    global _cache
+    if _cache is None:
+        # 线程池中的并发首次调用只创建一个实例
+        with _cache_lock:
+            if _cache is None:
+                _cache = GOTermCache()
+    return _cache
+
+
+def build_payload(records, threshold, version=DEEPGO_VERSION):
+    """
+    Args:
+        records: [(记录名, 序列), ...]；只有一条时按原方式提交裸序列
+    """
+    if len(records) == 1:
+        data = records[0][1]
+    else:
+        data = "\n".join(f">{name}\n{seq}" for name, seq in records)
+    return {"version": version, "data_format": "fasta", "data": data, "threshold": threshold}
+
+
+def split_response(response, names):
+    """
+    把多记录请求的响应按记录头拆回每条序列
+
+    Returns:
+        {记录名: 单记录响应}；无法按记录头对应时抛出 ValueError
+    """
+    if len(names) == 1:
+        return {names[0]: response}
+    predictions = response.get("predictions")
+    if not isinstance(predictions, list):
+        raise ValueError("DeepGO response has no predictions list")
+    shared = {k: v for k, v in response.items() if k != "predictions"}
+    split = {}
+    for pred in predictions:
+        header = str(pred.get("protein_info", "")).lstrip(">").split()
+        if header and header[0] in names:
+            split[header[0]] = {**shared, "predictions": [pred]}
+    if len(split) != len(names):
+        # 记录头缺失时，条数一致则按提交顺序对应
+        if len(predictions) != len(names):
+            raise ValueError(f"DeepGO returned {len(predictions)} predictions for {len(names)} sequences")
+        split = {name: {**shared, "predictions": [pred]} for name, pred in zip(names, predictions)}
+    return split
+
+
+def _submit(records, threshold):
+    response = get_http_client().post(
+        DEEPGO_URL, json=build_payload(records, threshold), headers=DEEPGO_HEADERS, timeout=DEEPGO_TIMEOUT
+    )
+    response.raise_for_status()
+    return split_response(response.json(), [name for name, _ in records])
+
+
+def get_go_terms_batch(sequences, threshold=0.3, batch_size=BATCH_SIZE):
+    """
+    批量获取 GO terms：先查缓存，未命中的序列按 batch_size 条合并为一次 FASTA 请求
+
+    Args:
+        sequences: 序列列表（可重复）
+        threshold: 置信度阈值
+        batch_size: 每个请求携带的记录数
+
+    Returns:
+        {序列: DeepGO 响应}；请求失败的序列不在结果中
+    """
+    with span("deepgo", sequences=len(sequences)) as trace:
+        unique = list(dict.fromkeys(sequences))
+        keys = {seq: go_cache_key(seq, DEEPGO_VERSION, threshold) for seq in unique}
+        try:
+            cached = get_go_cache().get_many(list(keys.values()))
+        except Exception as e:
+            print(f"Warning: DeepGO cache lookup failed: {e}")
+            cached = {}
+        results = {seq: cached[keys[seq]] for seq in unique if keys[seq] in cached}
+        pending = [seq for seq in unique if seq not in results]
+
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            records = [(f"q{i}", seq) for i, seq in enumerate(chunk)]
+            try:
+                split = _submit(records, threshold)
+            except Exception as e:
+                print(f"DeepGO API 请求失败: {e}")
+                if len(chunk) == 1:
+                    continue
+                # 合并请求失败（或无法拆分）时退回逐条提交
+                split = {}
+                for name, seq in records:
+                    try:
+                        split.update(_submit([(name, seq)], threshold))
+                    except Exception as e:
+                        print(f"DeepGO API 请求失败: {e}")
+            fetched = {seq: split[name] for name, seq in records if name in split}
+            results.update(fetched)
+            try:
+                get_go_cache().put_many({keys[seq]: response for seq, response in fetched.items()})
+            except Exception as e:
+                print(f"Warning: DeepGO cache write failed: {e}")
+        trace.set(cached=len(unique) - len(pending), pending=len(pending), cache_hit=not pending)
+        return results
+
+
+def prefetch_go_terms(sequences, threshold=0.3):
+    """批量预取并写入缓存，之后的逐条查询直接命中缓存"""
+    return len(get_go_terms_batch(sequences, threshold=threshold))
+
+
+async def get_go_terms_async(sequence, threshold=0.3):
+    """单条查询的异步版本（先查缓存）"""
+    with span("deepgo", track_cpu=False, sequences=1) as trace:
+        key = go_cache_key(sequence, DEEPGO_VERSION, threshold)
+        try:
+            cached = get_go_cache().get_many([key])
+        except Exception as e:
+            print(f"Warning: DeepGO cache lookup failed: {e}")
+            cached = {}
+        if key in cached:
+            trace.set(cache_hit=True)
+            return cached[key]
+        response = await get_async_http_client().post(
+            DEEPGO_URL, json=build_payload([("q0", sequence)], threshold), headers=DEEPGO_HEADERS, timeout=DEEPGO_TIMEOUT
+        )
+        response.raise_for_status()
+        result = response.json()
+        try:
+            get_go_cache().put_many({key: result})
+        except Exception as e:
+            print(f"Warning: DeepGO cache write failed: {e}")
+        return result
@@ -0,0 +1,191 @@
+"""
+内容寻址的序列 embedding 磁盘缓存
+
+键：sha256(模型名 + 层号 + 序列)
+存储：
+    shard_XXXX.npy  float16 (SHARD_ROWS, D) 分片，以 mmap 读写
+    index.sqlite    key -> slot（全局槽位号）/ 最近访问时间
+槽位总数由容量上限决定，写满后按 LRU 复用最久未访问的槽位。
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR", "Agents/.cache/embeddings")
+MAX_BYTES = int(float(os.environ.get("EMBEDDING_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+SHARD_ROWS = 4096
+
+
+def embedding_key(sequence, model_name, layer):
+    return hashlib.sha256(f"{model_name}:{layer}:{sequence}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES, shard_rows=SHARD_ROWS):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.shard_rows = shard_rows
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._shards = {}
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), timeout=30, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER UNIQUE, last_used REAL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+        self._conn.commit()
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        self.dim = row[0] if row else None
+
+    def _capacity(self):
+        return max(1, self.max_bytes // (self.dim * 2))
+
+    def _shard(self, shard_id):
+        shard = self._shards.get(shard_id)
+        if shard is None:
+            path = os.path.join(self.cache_dir, f"shard_{shard_id:04d}.npy")
+            if not os.path.exists(path):
+                # 在临时文件中写好头部与数据区后再替换，其他进程不会打开写了一半的分片
+                # （调用方持有 BEGIN IMMEDIATE，同一分片不会被两个进程同时创建）
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                tmp = np.lib.format.open_memmap(
+                    tmp_path, mode="w+", dtype=np.float16, shape=(self.shard_rows, self.dim)
+                )
+                tmp.flush()
+                del tmp
+                os.replace(tmp_path, path)
+            shard = np.lib.format.open_memmap(path, mode="r+")
+            self._shards[shard_id] = shard
+        return shard
+
+    def get_many(self, keys):
+        """
+        批量查询缓存
+
+        Returns:
+            {key: float32 向量}，只包含命中的键
+        """
+        found = {}
+        if self.dim is None or not keys:
+            self.misses += len(keys)
+            return found
+        with self._lock:
+            # 槽位查询与分片读取放在同一个 BEGIN IMMEDIATE 事务中：put_many 在提交前就会写分片，
+            # 与其互斥才能保证读到的向量属于查到的键（而不是刚被淘汰复用该槽位的其他序列）
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                placeholders = ",".join("?" * len(keys))
+                rows = self._conn.execute(
+                    f"SELECT key, slot FROM entries WHERE key IN ({placeholders})", list(keys)
+                ).fetchall()
+                for key, slot in rows:
+                    shard = self._shard(slot // self.shard_rows)
+                    found[key] = np.asarray(shard[slot % self.shard_rows], dtype=np.float32)
+                if rows:
+                    now = time.time()
+                    self._conn.executemany(
+                        "UPDATE entries SET last_used = ? WHERE key = ?", [(now, k) for k, _ in rows]
+                    )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        """
+        批量写入缓存，超出容量时淘汰最久未访问的条目
+
+        Args:
+            items: {key: 向量}
+        """
+        if not items:
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(len(next(iter(items.values()))))
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('dim', ?)", (self.dim,))
+            capacity = self._capacity()
+            # BEGIN IMMEDIATE 保证多进程分配槽位时互斥
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for key, vec in items.items():
+                    existing = self._conn.execute("SELECT slot FROM entries WHERE key = ?", (key,)).fetchone()
+                    if existing:
+                        slot = existing[0]
+                    else:
+                        count, max_slot = self._conn.execute("SELECT COUNT(*), MAX(slot) FROM entries").fetchone()
+                        if count < capacity:
+                            slot = 0 if max_slot is None else max_slot + 1
+                        else:
+                            old_key, slot = self._conn.execute(
+                                "SELECT key, slot FROM entries ORDER BY last_used LIMIT 1"
+                            ).fetchone()
+                            self._conn.execute("DELETE FROM entries WHERE key = ?", (old_key,))
+                    shard = self._shard(slot // self.shard_rows)
+                    shard[slot % self.shard_rows] = np.asarray(vec, dtype=np.float16)
+                    self._conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", (key, slot, time.time()))
+                for shard in self._shards.values():
+                    shard.flush()
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def embed(self, sequences, embed_fn, model_name, layer):
+        """
+        先查缓存，只对未命中的序列调用 embed_fn
+
+        Args:
+            sequences: 序列列表
+            embed_fn: 批量 embedding 函数，输入序列列表，返回 (N, D) 矩阵
+            model_name: 模型名（参与键计算）
+            layer: 表示层号（参与键计算）
+
+        Returns:
+            float32 矩阵 (len(sequences), D)
+        """
+        keys = [embedding_key(seq, model_name, layer) for seq in sequences]
+        found = self.get_many(list(dict.fromkeys(keys)))
+        missing = {}
+        for key, seq in zip(keys, sequences):
+            if key not in found and key not in missing:
+                missing[key] = seq
+        if missing:
+            computed = embed_fn(list(missing.values()))
+            # 以 float16 精度返回新计算的结果，命中与未命中时检索结果保持一致
+            new_items = {k: np.asarray(v, dtype=np.float16).astype(np.float32) for k, v in zip(missing, computed)}
+            self.put_many(new_items)
+            found.update(new_items)
+        return np.stack([found[k] for k in keys]).astype(np.float32)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    global _cache
+    if _cache is None:
+        # 线程池中的并发首次调用只创建一个实例
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
@@ -0,0 +1,163 @@
+"""
+蛋白质 embedding 二进制列式存储，替代 JSON 编码的 embedding 列表
+
+存储目录结构：
+    embeddings.npy       float16 (N, D) 矩阵，mmap 只读打开
+    norms.npy            float32 (N,) 每行平方范数（按 float16 取值计算）
+    records.jsonl        每行一条元数据：id / sequence / document / metadata
+    record_offsets.npy   uint64 (N+1,) records.jsonl 中每行的字节偏移
+    ids.npy              排序后的定长 id 数组，用于二分查找
+    id_rows.npy          int64，ids.npy 中每个 id 对应的行号
+    manifest.json        条目数、维度、数据类型
+
+所有数组均以 mmap 打开，打开耗时与条目数无关，只有被访问的页才会占用内存。
+
+从旧格式转换：
+    python Agents/embedding_store.py convert --input Agents/uniprot_documents_with_embedding.json --output Agents/protein_index
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+NORMS_FILE = "norms.npy"
+RECORDS_FILE = "records.jsonl"
+OFFSETS_FILE = "record_offsets.npy"
+IDS_FILE = "ids.npy"
+ID_ROWS_FILE = "id_rows.npy"
+
+
+def write_store(out_dir, ids, embeddings, records):
+    """
+    写入 embedding 存储
+
+    Args:
+        out_dir: 输出目录
+        ids: 蛋白 id 列表
+        embeddings: (N, D) 矩阵或等长向量列表
+        records: 与 ids 对齐的元数据字典列表（document / metadata / sequence 等）
+
+    Returns:
+        写入的条目数
+    """
+    n = len(ids)
+    if n == 0:
+        raise ValueError("没有可写入的条目")
+    dim = len(embeddings[0])
+    os.makedirs(out_dir, exist_ok=True)
+
+    # manifest 最后写入，先删除旧的以免读到半成品
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    emb = np.lib.format.open_memmap(os.path.join(out_dir, EMBEDDINGS_FILE), mode="w+", dtype=np.float16, shape=(n, dim))
+    norms = np.empty(n, dtype=np.float32)
+    for start in range(0, n, 65536):
+        block = np.asarray(embeddings[start:start + 65536], dtype=np.float16)
+        emb[start:start + len(block)] = block
+        block32 = block.astype(np.float32)
+        norms[start:start + len(block)] = np.einsum("ij,ij->i", block32, block32)
+    emb.flush()
+    del emb
+    np.save(os.path.join(out_dir, NORMS_FILE), norms)
+
+    offsets = np.zeros(n + 1, dtype=np.uint64)
+    with open(os.path.join(out_dir, RECORDS_FILE), "wb") as f:
+        for row, (doc_id, record) in enumerate(zip(ids, records)):
+            line = json.dumps(dict(record, id=doc_id), ensure_ascii=False).encode("utf-8") + b"\n"
+            f.write(line)
+            offsets[row + 1] = offsets[row] + len(line)
+    np.save(os.path.join(out_dir, OFFSETS_FILE), offsets)
+
+    encoded = np.array([str(doc_id).encode("utf-8") for doc_id in ids])
+    order = np.argsort(encoded, kind="stable")
+    np.save(os.path.join(out_dir, IDS_FILE), encoded[order])
+    np.save(os.path.join(out_dir, ID_ROWS_FILE), order.astype(np.int64))
+
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"count": n, "dim": dim, "dtype": "float16"}, f)
+    return n
+
+
+def convert_json(json_path, out_dir):
+    """
+    将 uniprot_documents_with_embedding.json 转换为二进制存储
+    embedding 为空（计算失败）的条目会被跳过
+    """
+    with open(json_path, "r", encoding="utf-8") as f:
+        docs = json.load(f)
+    docs = [doc for doc in docs if doc.get("embedding")]
+    return write_store(
+        out_dir,
+        [doc["id"] for doc in docs],
+        [doc["embedding"] for doc in docs],
+        [{k: v for k, v in doc.items() if k not in ("id", "embedding")} for doc in docs],
+    )
+
+
+class EmbeddingStore:
+    """只读 embedding 存储"""
+
+    def __init__(self, store_dir):
+        manifest_path = os.path.join(store_dir, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(f"未找到 embedding 存储 {store_dir}（缺少 {MANIFEST_FILE}）")
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.store_dir = store_dir
+        self.embeddings = np.load(os.path.join(store_dir, EMBEDDINGS_FILE), mmap_mode="r")
+        self.norms = np.load(os.path.join(store_dir, NORMS_FILE), mmap_mode="r")
+        self.offsets = np.load(os.path.join(store_dir, OFFSETS_FILE), mmap_mode="r")
+        self.ids = np.load(os.path.join(store_dir, IDS_FILE), mmap_mode="r")
+        self.id_rows = np.load(os.path.join(store_dir, ID_ROWS_FILE), mmap_mode="r")
+        self._records_path = os.path.join(store_dir, RECORDS_FILE)
+
+    def __len__(self):
+        return int(self.manifest["count"])
+
+    @property
+    def dim(self):
+        return int(self.manifest["dim"])
+
+    def row_of(self, doc_id):
+        """id -> 行号，不存在时返回 None"""
+        key = str(doc_id).encode("utf-8")
+        pos = int(np.searchsorted(self.ids, key))
+        if pos < len(self.ids) and self.ids[pos] == key:
+            return int(self.id_rows[pos])
+        return None
+
+    def get_records(self, rows):
+        """按行号读取元数据记录，保持输入顺序"""
+        records = []
+        with open(self._records_path, "rb") as f:
+            for row in rows:
+                start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+                f.seek(start)
+                records.append(json.loads(f.read(end - start)))
+        return records
+
+    def get_embeddings(self, rows):
+        return np.asarray(self.embeddings[np.asarray(rows)], dtype=np.float32)
+
+
+def open_store(store_dir):
+    return EmbeddingStore(store_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="蛋白质 embedding 二进制存储工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="从带 embedding 的文档 JSON 转换")
+    convert.add_argument("--input", default="Agents/uniprot_documents_with_embedding.json")
+    convert.add_argument("--output", default="Agents/protein_index")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        n = convert_json(args.input, args.output)
+        print(f"✅ 转换完成，共 {n} 个蛋白，保存在 {args.output}")
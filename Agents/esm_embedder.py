@@ -0,0 +1,103 @@
+"""
+共享 ESM-2 embedding 引擎
+
+离线建库（Sequence_Agent/getembedding.py）与在线检索（Seq_Agent.query_rag）共用：
+    1. 按序列长度排序分桶，长度相近的序列放在同一批，减少 padding 浪费
+    2. 按 token 预算（批大小 x 批内最大长度）动态决定每批序列数
+    3. 使用 padding mask 做 mean pooling（不含 BOS/EOS/PAD），结果与逐条计算一致
+    4. 返回 float32 矩阵 (N, D)，行顺序与输入一致
+"""
+
+import os
+import threading
+
+import numpy as np
+import torch
+
+MODEL_NAME = "esm2_t33_650M_UR50D"
+REPR_LAYER = 33
+# 每批 token 上限，CPU 上 4k~8k 左右吞吐最佳，可通过环境变量调整
+DEFAULT_MAX_TOKENS = int(os.environ.get("ESM_MAX_TOKENS", "8192"))
+
+
+class ESMEmbedder:
+    def __init__(self, model_name=MODEL_NAME, repr_layer=REPR_LAYER, max_tokens=DEFAULT_MAX_TOKENS,
+                 num_threads=None, truncation_seq_length=None):
+        """
+        Args:
+            model_name: esm.pretrained 中的模型名
+            repr_layer: 取表示的层号
+            max_tokens: 每批 token 预算
+            num_threads: torch CPU 线程数，None 表示使用 torch 默认值
+            truncation_seq_length: 超过该长度的序列被截断，None 表示不截断
+        """
+        import esm
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.model_name = model_name
+        self.repr_layer = repr_layer
+        self.max_tokens = max_tokens
+        self.model, self.alphabet = getattr(esm.pretrained, model_name)()
+        self.batch_converter = self.alphabet.get_batch_converter(truncation_seq_length)
+        self.model.eval()
+        self.embed_dim = self.model.embed_dim
+
+    def _batches(self, sequences):
+        """按长度排序后，按 token 预算切分批次，返回每批的原始下标列表"""
+        order = sorted(range(len(sequences)), key=lambda i: len(sequences[i]))
+        batch, batch_max = [], 0
+        for i in order:
+            n_tokens = len(sequences[i]) + 2  # BOS + EOS
+            if batch and max(batch_max, n_tokens) * (len(batch) + 1) > self.max_tokens:
+                yield batch
+                batch, batch_max = [], 0
+            batch.append(i)
+            batch_max = max(batch_max, n_tokens)
+        if batch:
+            yield batch
+
+    def embed(self, sequences):
+        """
+        批量计算序列 embedding
+
+        Args:
+            sequences: 蛋白质序列列表
+
+        Returns:
+            float32 矩阵 (len(sequences), embed_dim)
+        """
+        sequences = list(sequences)
+        out = np.zeros((len(sequences), self.embed_dim), dtype=np.float32)
+        for batch in self._batches(sequences):
+            _, _, tokens = self.batch_converter([(str(i), sequences[i]) for i in batch])
+            with torch.inference_mode():
+                results = self.model(tokens, repr_layers=[self.repr_layer], return_contacts=False)
+            reps = results["representations"][self.repr_layer]
+            mask = (
+                (tokens != self.alphabet.padding_idx)
+                & (tokens != self.alphabet.cls_idx)
+                & (tokens != self.alphabet.eos_idx)
+            ).unsqueeze(-1).to(reps.dtype)
+            pooled = (reps * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+            out[batch] = pooled.float().cpu().numpy()
+        return out
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder():
+    """进程内共享的 embedding 引擎，首次调用时加载模型"""
+    global _embedder
+    if _embedder is None:
+        # 线程池中的并发首次调用只加载一次模型
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = ESMEmbedder()
+    return _embedder
+
+
+def embed_sequences(sequences):
+    return get_embedder().embed(sequences)
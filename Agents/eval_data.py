@@ -1,9 +1,6 @@
 import json
-from dotenv import load_dotenv
-from google import genai
-
-load_dotenv()
-google_client = genai.Client()
+import llm_gateway
+from prompts import FUNCTION_ASPECTS
 
 def convert_to_natural_language(data):
     """
@@ -37,25 +34,11 @@ def convert_to_natural_language(data):
     Functional Keywords:
     {chr(10).join([f"- {keyword}" for keyword in data['metadata']['functional_keywords']])}
 
-    Please generate a comprehensive, accurate, and fluent natural language functional description from three aspects:
-    1. Molecular Function (MF) - Biochemical activity of the protein
-    2. Biological Process (BP) - Biological processes the protein participates in
-    3. Cellular Component (CC) - Cellular localization of the protein
-
-    Please provide detailed and accurate functional descriptions, including:
-    - Main functional characteristics
-    - Possible biological roles
-    - Related metabolic pathways
-    - Potential disease associations
-    - Domain and functional site analysis
+    {FUNCTION_ASPECTS}
 
     """
     
-    response = google_client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt
-    )
-    return response.text
+    return llm_gateway.generate(prompt, agent="eval")
 
 def process_eval_data():
     """
@@ -0,0 +1,416 @@
+"""
+可插拔的结构预测（折叠）后端
+
+    esm_atlas  远程 ESM Atlas API（默认）
+    local      本地 ESMFold，CPU 上的进程池推理（需 fair-esm[esmfold] 与 openfold）
+    standin    本地 HTTP 替身服务，按序列返回目录中预先计算好的 PDB / mmCIF，离线压测使用
+
+运行时选择：FOLD_BACKEND 环境变量
+    FOLD_BACKEND=esm_atlas            单个后端
+    FOLD_BACKEND=standin,esm_atlas    依次尝试，前一个失败时切换到下一个
+    FOLD_BACKEND=auto                 探测可用后端，按探针序列的折叠延迟从快到慢排序
+
+替身服务与 ESM Atlas 使用相同协议（POST 原始序列，返回 PDB 文本）：
+    python Agents/fold_backends.py serve --dir Structure_Agent --port 8765
+    FOLD_BACKEND=standin python Agents/update.py
+    python Agents/fold_backends.py bench --backend standin --input proteome.fasta --concurrency 16
+"""
+
+import argparse
+import asyncio
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+
+from http_client import get_async_http_client, get_http_client
+
+ESM_ATLAS_URL = "https://api.esmatlas.com/foldSequence/v1/pdb/"
+STANDIN_URL = os.environ.get("FOLD_STANDIN_URL", "http://127.0.0.1:8765/foldSequence/v1/pdb/")
+FOLD_TIMEOUT = float(os.environ.get("FOLD_TIMEOUT", "300"))
+ESMFOLD_WORKERS = int(os.environ.get("ESMFOLD_WORKERS", "1"))
+ESMFOLD_CHUNK_SIZE = os.environ.get("ESMFOLD_CHUNK_SIZE")
+# auto 模式下用于测延迟的探针序列
+PROBE_SEQUENCE = "MKTAYIAKQRQISFVKSHFSRQ"
+
+
+def check_fold_response(ok, status_code, text):
+    """校验折叠服务返回内容，返回 PDB 文本"""
+    if not ok:
+        raise RuntimeError(f"Fold API request failed: {status_code} {text[:200]}")
+    # 有些情况下服务端返回错误页，但HTTP 200，需检测关键字
+    if "Service Temporarily Unavailable" in text or "<html" in text.lower():
+        raise RuntimeError("Fold API returned an error page content.")
+    # 简单有效性检查：必须包含 ATOM 记录
+    if "ATOM" not in text:
+        raise ValueError("Retrieved PDB has no ATOM records; possibly an error or unsuitable sequence.")
+    return text
+
+
+class ESMAtlasBackend:
+    name = "esm_atlas"
+    # 结构缓存命名空间：None 表示与 ESMFold 预测共享缓存
+    cache_namespace = None
+
+    def __init__(self, url=ESM_ATLAS_URL, timeout=FOLD_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+
+    def available(self):
+        return True
+
+    def fold(self, seq):
+        response = get_http_client().post(self.url, data=seq, timeout=self.timeout)
+        return check_fold_response(response.ok, response.status_code, response.text)
+
+    async def fold_async(self, seq):
+        response = await get_async_http_client().post(self.url, content=seq, timeout=self.timeout)
+        return check_fold_response(response.is_success, response.status_code, response.text)
+
+
+class StandInBackend(ESMAtlasBackend):
+    name = "standin"
+    # 替身返回的并非真实预测，单独的缓存命名空间避免污染
+    cache_namespace = "standin"
+
+    def __init__(self, url=STANDIN_URL, timeout=FOLD_TIMEOUT):
+        super().__init__(url=url, timeout=timeout)
+
+    def available(self):
+        try:
+            return get_http_client().get(self.url.split("/foldSequence")[0] + "/health", timeout=1, retries=0).ok
+        except requests.RequestException:
+            return False
+
+
+_esmfold_model = None
+
+
+def _esmfold_init(num_threads, chunk_size):
+    """进程池 worker 初始化：每个进程只加载一次 ESMFold"""
+    global _esmfold_model
+    import torch
+    import esm
+
+    torch.set_num_threads(num_threads)
+    _esmfold_model = esm.pretrained.esmfold_v1().eval()
+    if chunk_size:
+        # 分块计算轴向注意力，降低长序列的内存峰值
+        _esmfold_model.set_chunk_size(int(chunk_size))
+
+
+def _esmfold_infer(seq):
+    import torch
+
+    with torch.no_grad():
+        return _esmfold_model.infer_pdb(seq)
+
+
+class LocalESMFoldBackend:
+    name = "local"
+    cache_namespace = None
+
+    def __init__(self, max_workers=ESMFOLD_WORKERS, chunk_size=ESMFOLD_CHUNK_SIZE):
+        """
+        Args:
+            max_workers: 推理进程数，每个进程持有一份模型
+            chunk_size: ESMFold 轴向注意力分块大小，None 表示不分块
+        """
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def available(self):
+        return all(importlib.util.find_spec(m) is not None for m in ("torch", "esm", "openfold"))
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                num_threads = max(1, (os.cpu_count() or 1) // self.max_workers)
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    initializer=_esmfold_init,
+                    initargs=(num_threads, self.chunk_size),
+                )
+            return self._pool
+
+    def fold(self, seq):
+        return check_fold_response(True, 200, self._get_pool().submit(_esmfold_infer, seq).result())
+
+    async def fold_async(self, seq):
+        text = await asyncio.wrap_future(self._get_pool().submit(_esmfold_infer, seq))
+        return check_fold_response(True, 200, text)
+
+
+BACKENDS = {
+    ESMAtlasBackend.name: ESMAtlasBackend,
+    LocalESMFoldBackend.name: LocalESMFoldBackend,
+    StandInBackend.name: StandInBackend,
+}
+
+
+def rank_backends(names=None):
+    """
+    探测可用后端，按探针序列的折叠延迟从快到慢排序
+
+    Returns:
+        [(name, 延迟秒数), ...]，不可用或探测失败的后端不在结果中
+    """
+    ranked = []
+    for name in names or BACKENDS:
+        backend = BACKENDS[name]()
+        if not backend.available():
+            continue
+        start = time.perf_counter()
+        try:
+            backend.fold(PROBE_SEQUENCE)
+        except Exception as e:
+            print(f"Warning: Fold backend {name} probe failed: {e}")
+            continue
+        ranked.append((name, time.perf_counter() - start))
+    return sorted(ranked, key=lambda item: item[1])
+
+
+class FailoverBackend:
+    """按顺序尝试多个后端，前一个失败时切换到下一个"""
+
+    def __init__(self, backends):
+        self.backends = backends
+        self.name = ",".join(b.name for b in backends)
+
+    @property
+    def cache_namespace(self):
+        # 混用真实预测与替身时单独命名空间，避免替身结果写入真实预测缓存
+        namespaces = {b.cache_namespace for b in self.backends}
+        return namespaces.pop() if len(namespaces) == 1 else self.name
+
+    def fold(self, seq):
+        errors = []
+        for backend in self.backends:
+            try:
+                return backend.fold(seq)
+            except Exception as e:
+                errors.append(f"{backend.name}: {e}")
+        raise RuntimeError("All fold backends failed: " + "; ".join(errors))
+
+    async def fold_async(self, seq):
+        errors = []
+        for backend in self.backends:
+            try:
+                return await backend.fold_async(seq)
+            except Exception as e:
+                errors.append(f"{backend.name}: {e}")
+        raise RuntimeError("All fold backends failed: " + "; ".join(errors))
+
+
+def load_fold_backend(spec):
+    """
+    按名称构建折叠后端
+
+    Args:
+        spec: 后端名、逗号分隔的后端列表，或 auto
+    """
+    if spec == "auto":
+        ranked = rank_backends()
+        if not ranked:
+            raise RuntimeError("No fold backend is available")
+        print(f"Fold backends ranked by probe latency: {', '.join(f'{n}={t:.2f}s' for n, t in ranked)}")
+        names = [name for name, _ in ranked]
+    else:
+        names = [name.strip() for name in spec.split(",") if name.strip()]
+    unknown = [name for name in names if name not in BACKENDS]
+    if unknown:
+        raise ValueError(f"未知的折叠后端: {', '.join(unknown)}，可选: {', '.join(BACKENDS)}")
+    if len(names) == 1:
+        return BACKENDS[names[0]]()
+    return FailoverBackend([BACKENDS[name]() for name in names])
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_fold_backend():
+    global _backend
+    # 分窗折叠会在多个线程中同时首次调用，加锁避免重复探测 / 重复创建进程池
+    with _backend_lock:
+        if _backend is None:
+            _backend = load_fold_backend(os.environ.get("FOLD_BACKEND", ESMAtlasBackend.name))
+    return _backend
+
+
+class StandInIndex:
+    """替身服务的结构目录：按序列精确匹配，未收录的序列按序列哈希确定性地映射到某个结构"""
+
+    def __init__(self, directory):
+        import biotite.structure as struc
+        import biotite.structure.io as bsio
+
+        self.paths = []
+        self.by_sequence = {}
+        self._texts = {}
+        for fname in sorted(os.listdir(directory)):
+            if not fname.lower().endswith((".pdb", ".cif")):
+                continue
+            path = os.path.join(directory, fname)
+            try:
+                atoms = bsio.load_structure(path, model=1)
+                atoms = atoms[~atoms.hetero]
+                sequences, _ = struc.to_sequence(atoms)
+            except Exception as e:
+                print(f"Warning: Skipping {path}: {e}")
+                continue
+            self.paths.append(path)
+            self.by_sequence.setdefault(str(sequences[0]), path)
+        if not self.paths:
+            raise ValueError(f"No readable PDB / mmCIF files in {directory}")
+
+    def pdb_text(self, path):
+        """mmCIF 统一转为 PDB 文本（保留 B-factor），结果按文件缓存"""
+        if path not in self._texts:
+            if path.lower().endswith(".pdb"):
+                with open(path, "r") as f:
+                    self._texts[path] = f.read()
+            else:
+                import biotite.structure.io as bsio
+                import biotite.structure.io.pdb as bpdb
+
+                atoms = bsio.load_structure(path, model=1, extra_fields=["b_factor"])
+                pdb_file = bpdb.PDBFile()
+                pdb_file.set_structure(atoms)
+                out = io.StringIO()
+                pdb_file.write(out)
+                self._texts[path] = out.getvalue()
+        return self._texts[path]
+
+    def lookup(self, seq):
+        """
+        Returns:
+            (PDB 文本, exact / hashed)
+        """
+        if seq in self.by_sequence:
+            return self.pdb_text(self.by_sequence[seq]), "exact"
+        digest = int(hashlib.sha256(seq.encode("utf-8")).hexdigest(), 16)
+        return self.pdb_text(self.paths[digest % len(self.paths)]), "hashed"
+
+
+def serve_standin(directory, host="127.0.0.1", port=8765, delay_ms=0):
+    """
+    启动替身折叠服务
+
+    Args:
+        directory: 存放预计算 PDB / mmCIF 的目录
+        delay_ms: 每个请求的人为延迟，用于模拟远程服务
+    """
+    index = StandInIndex(directory)
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body, match=None):
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(data)))
+            if match:
+                self.send_header("X-Stand-In-Match", match)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/health":
+                self._send(200, "ok")
+            else:
+                self._send(404, "not found")
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            seq = self.rfile.read(length).decode("utf-8").strip().upper()
+            if not seq:
+                self._send(400, "empty sequence")
+                return
+            if delay_ms:
+                time.sleep(delay_ms / 1000)
+            text, match = index.lookup(seq)
+            self._send(200, text, match)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"✅ Stand-in fold server on http://{host}:{port}/foldSequence/v1/pdb/ ({len(index.paths)} structures)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def benchmark(backend_spec, sequences, concurrency=8):
+    """并发折叠一组序列，统计吞吐与单条延迟（不经过结构缓存）"""
+    backend = load_fold_backend(backend_spec)
+    latencies, errors = [], 0
+
+    def run(seq):
+        start = time.perf_counter()
+        backend.fold(seq)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(run, seq) for seq in sequences]:
+            try:
+                latencies.append(future.result())
+            except Exception as e:
+                errors += 1
+                print(f"Warning: Fold failed: {e}")
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies) if latencies else np.zeros(1)
+    return {
+        "backend": backend.name,
+        "sequences": len(sequences),
+        "errors": errors,
+        "concurrency": concurrency,
+        "throughput_per_s": len(sequences) / elapsed if elapsed > 0 else None,
+        "latency_s_p50": float(np.percentile(latencies, 50)),
+        "latency_s_p95": float(np.percentile(latencies, 95)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="折叠后端工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="启动本地替身折叠服务")
+    serve.add_argument("--dir", default="Structure_Agent")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--delay-ms", type=int, default=0)
+
+    bench = sub.add_parser("bench", help="对折叠后端做吞吐 / 延迟测试")
+    bench.add_argument("--backend", default="standin")
+    bench.add_argument("--input", required=True, help="FASTA 文件")
+    bench.add_argument("--limit", type=int, default=None)
+    bench.add_argument("--concurrency", type=int, default=8)
+
+    sub.add_parser("rank", help="探测可用后端并按延迟排序")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve_standin(args.dir, host=args.host, port=args.port, delay_ms=args.delay_ms)
+    elif args.command == "bench":
+        from Bio import SeqIO
+
+        sequences = [str(record.seq) for record in SeqIO.parse(args.input, "fasta")][:args.limit]
+        print(json.dumps(benchmark(args.backend, sequences, concurrency=args.concurrency), indent=2, ensure_ascii=False))
+    elif args.command == "rank":
+        for name, latency in rank_backends():
+            print(f"{name}: {latency:.2f}s")
@@ -0,0 +1,266 @@
+"""
+GO 预测的紧凑表示
+
+把 DeepGO 响应解析为 GOPrediction（term_id / namespace / score / name），每个命名空间只保留阈值以上
+最具体的术语（去掉被其他预测术语覆盖的祖先），再按 token 预算渲染为提示词片段，替代整段 JSON。
+
+祖先关系来自 GO_OBO_PATH 指向的 go-basic.obo（is_a / part_of）。DeepGO 返回的是向祖先传播后的术语，
+没有本体文件就无法剪枝，因此首次使用时从 GO_OBO_URL 下载并缓存到 GO_OBO_PATH（GO_OBO_DOWNLOAD=0 关闭）；
+仍不可用时打印一次警告，只去掉三个根术语，其余按分数保留。
+
+预先下载 / 更新本体：
+    python Agents/go_terms.py fetch
+"""
+
+import argparse
+import json
+import os
+import threading
+from dataclasses import dataclass
+
+GO_OBO_PATH = os.environ.get("GO_OBO_PATH", "Agents/data/go-basic.obo")
+GO_OBO_URL = os.environ.get("GO_OBO_URL", "https://purl.obolibrary.org/obo/go/go-basic.obo")
+GO_OBO_DOWNLOAD = os.environ.get("GO_OBO_DOWNLOAD", "1") != "0"
+PROMPT_TOKEN_BUDGET = int(os.environ.get("GO_PROMPT_TOKENS", "400"))
+MAX_TERMS_PER_NAMESPACE = int(os.environ.get("GO_MAX_TERMS_PER_NAMESPACE", "15"))
+
+NAMESPACE_ORDER = ("MF", "BP", "CC")
+NAMESPACE_NAMES = {"MF": "Molecular Function", "BP": "Biological Process", "CC": "Cellular Component"}
+_NAMESPACE_ALIASES = {
+    "mf": "MF", "molecular function": "MF", "molecular_function": "MF", "mfo": "MF",
+    "bp": "BP", "biological process": "BP", "biological_process": "BP", "bpo": "BP",
+    "cc": "CC", "cellular component": "CC", "cellular_component": "CC", "cco": "CC",
+}
+ROOT_TERMS = {"GO:0003674", "GO:0008150", "GO:0005575"}
+
+
+@dataclass(frozen=True)
+class GOPrediction:
+    term_id: str
+    namespace: str
+    score: float
+    name: str
+
+
+def normalize_namespace(name):
+    return _NAMESPACE_ALIASES.get(str(name).strip().lower())
+
+
+_go_parents = None
+_go_parents_lock = threading.Lock()
+
+
+def fetch_go_obo(path=GO_OBO_PATH, url=GO_OBO_URL):
+    """
+    下载 go-basic.obo（先写临时文件再替换，中断的下载不会留下半个文件）
+
+    Returns:
+        文件路径
+    """
+    from http_client import get_http_client
+
+    out_dir = os.path.dirname(path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    response = get_http_client().get(url, stream=True)
+    response.raise_for_status()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            for block in response.iter_content(chunk_size=1 << 20):
+                f.write(block)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+def load_go_parents(path=GO_OBO_PATH):
+    """
+    读取 OBO 文件中的 is_a / part_of 父节点，文件不存在时先尝试下载
+
+    Returns:
+        {term_id: set(父节点)}，文件不可用时返回空字典
+    """
+    global _go_parents
+    # 并发的首次调用只下载 / 解析一次
+    with _go_parents_lock:
+        if _go_parents is not None:
+            return _go_parents
+        if not os.path.exists(path) and GO_OBO_DOWNLOAD:
+            print(f"GO ontology not found at {path}, downloading {GO_OBO_URL} ...")
+            try:
+                fetch_go_obo(path)
+            except Exception as e:
+                print(f"Warning: GO ontology download failed: {e}")
+        parents = {}
+        if not os.path.exists(path):
+            # 结果会被缓存，警告只打印一次
+            print(
+                f"Warning: GO ontology not available at {path}; ancestor terms will not be pruned "
+                "(run: python Agents/go_terms.py fetch)"
+            )
+        else:
+            term = None
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line == "[Term]":
+                        term = None
+                    elif line.startswith("id: GO:"):
+                        term = line[4:]
+                        parents.setdefault(term, set())
+                    elif term and line.startswith("is_a: "):
+                        parents[term].add(line[6:16])
+                    elif term and line.startswith("relationship: part_of "):
+                        parents[term].add(line[22:32])
+        _go_parents = parents
+        return parents
+
+
+def _ancestors(term, parents, memo):
+    if term not in memo:
+        result = set()
+        for parent in parents.get(term, ()):
+            result.add(parent)
+            result |= _ancestors(parent, parents, memo)
+        memo[term] = result
+    return memo[term]
+
+
+def _iter_raw_terms(go_response):
+    """兼容 DeepGO 的 predictions -> functions -> [[id, name, score], ...] 结构，以及 id/name/score 字典"""
+    predictions = go_response.get("predictions", []) if isinstance(go_response, dict) else go_response
+    for pred in predictions or []:
+        for group in pred.get("functions", []):
+            namespace = normalize_namespace(group.get("name", ""))
+            for item in group.get("functions", []):
+                if isinstance(item, dict):
+                    term_id = item.get("id") or item.get("term")
+                    name = item.get("name") or item.get("label") or ""
+                    score = item.get("score")
+                    ns = normalize_namespace(item.get("namespace", "")) or namespace
+                else:
+                    term_id, name, score = (list(item) + [None, None, None])[:3]
+                    ns = namespace
+                if term_id and score is not None and ns:
+                    yield GOPrediction(str(term_id), ns, float(score), str(name))
+
+
+def parse_deepgo_response(go_response, threshold=0.0):
+    """
+    Returns:
+        [GOPrediction, ...]，同一术语只保留最高分，低于阈值的丢弃
+    """
+    best = {}
+    for pred in _iter_raw_terms(go_response):
+        if pred.score < threshold:
+            continue
+        if pred.term_id not in best or pred.score > best[pred.term_id].score:
+            best[pred.term_id] = pred
+    return list(best.values())
+
+
+def most_specific(predictions, parents=None):
+    """
+    每个命名空间只保留最具体的术语
+
+    Returns:
+        {namespace: [GOPrediction, ...]}，按分数从高到低
+    """
+    parents = load_go_parents() if parents is None else parents
+    predicted = {p.term_id for p in predictions}
+    covered = set()
+    memo = {}
+    for term in predicted:
+        covered |= _ancestors(term, parents, memo) & predicted
+    by_namespace = {ns: [] for ns in NAMESPACE_ORDER}
+    for pred in predictions:
+        if pred.term_id in ROOT_TERMS or pred.term_id in covered:
+            continue
+        by_namespace[pred.namespace].append(pred)
+    for ns in by_namespace:
+        by_namespace[ns].sort(key=lambda p: (-p.score, p.term_id))
+        del by_namespace[ns][MAX_TERMS_PER_NAMESPACE:]
+    return by_namespace
+
+
+def estimate_tokens(text):
+    # 英文 + GO 编号的粗略估计：约 4 个字符一个 token
+    return len(text) // 4 + 1
+
+
+def render_go_section(by_namespace, token_budget=PROMPT_TOKEN_BUDGET, threshold=None):
+    """
+    按 token 预算渲染：各命名空间轮流按分数取术语，超出预算即停止；
+    每个非空命名空间至少保留分数最高的一个术语（即使因此略超预算）
+
+    Returns:
+        多行文本，每个命名空间一行：MF: GO:0004672 protein kinase activity 0.62; ...
+    """
+    chosen = {ns: [] for ns in NAMESPACE_ORDER}
+    full = set()
+    used = 0
+    depth = 0
+    while True:
+        added = False
+        for ns in NAMESPACE_ORDER:
+            if ns not in full and depth < len(by_namespace.get(ns, [])):
+                pred = by_namespace[ns][depth]
+                entry = f"{pred.term_id} {pred.name} {pred.score:.2f}"
+                cost = estimate_tokens(entry) + 1
+                if depth > 0 and used + cost > token_budget:
+                    # 保持每个命名空间内按分数连续截取
+                    full.add(ns)
+                    continue
+                chosen[ns].append(entry)
+                used += cost
+                added = True
+        if not added:
+            break
+        depth += 1
+
+    lines = []
+    for ns in NAMESPACE_ORDER:
+        total = len(by_namespace.get(ns, []))
+        if not total:
+            cutoff = f" {threshold:g}" if threshold else ""
+            lines.append(f"{ns} ({NAMESPACE_NAMES[ns]}): no GO terms above threshold{cutoff}")
+            continue
+        line = f"{ns} ({NAMESPACE_NAMES[ns]}): " + "; ".join(chosen[ns])
+        if len(chosen[ns]) < total:
+            line += f"; ... {total - len(chosen[ns])} more"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def summarize_go_response(go_response, threshold=0.0, token_budget=PROMPT_TOKEN_BUDGET):
+    """
+    DeepGO 响应 -> 紧凑提示词片段
+
+    只有无法识别的响应结构才退回紧凑 JSON（截断到预算内）；能解析但没有术语达到阈值时，
+    每个命名空间输出一行 "no GO terms above threshold"，阈值以下的预测不进入提示词
+    """
+    try:
+        raw_terms = list(_iter_raw_terms(go_response))
+    except (AttributeError, TypeError, ValueError):
+        raw_terms = None
+    parsed = bool(raw_terms) or (isinstance(go_response, dict) and isinstance(go_response.get("predictions"), list))
+    if raw_terms is None or not parsed:
+        compact = json.dumps(go_response, ensure_ascii=False, separators=(",", ":"), default=str)
+        return compact[:token_budget * 4]
+    predictions = parse_deepgo_response(go_response, threshold=threshold)
+    return render_go_section(most_specific(predictions), token_budget=token_budget, threshold=threshold)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GO 本体工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    fetch = sub.add_parser("fetch", help="下载 go-basic.obo 到 GO_OBO_PATH")
+    fetch.add_argument("--path", default=GO_OBO_PATH)
+    fetch.add_argument("--url", default=GO_OBO_URL)
+    args = parser.parse_args()
+
+    path = fetch_go_obo(args.path, args.url)
+    print(f"✅ GO ontology saved to {path} ({len(load_go_parents(path))} terms)")
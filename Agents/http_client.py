@@ -0,0 +1,273 @@
+"""
+共享的 HTTP 客户端层（ESM Atlas / DeepGO / UniProt / BioContainers 等外部 API 共用）
+
+    - 连接池：进程内复用同一个 requests.Session / httpx.AsyncClient，避免每次请求重新握手
+    - 每个主机的并发上限：HTTP_HOST_LIMITS="api.esmatlas.com=4,deepgo.cbrc.kaust.edu.sa=2"，默认 HTTP_MAX_PER_HOST
+    - 默认超时：HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT（秒）
+    - 重试：连接错误、429、5xx 按带抖动的指数退避重试 HTTP_MAX_RETRIES 次，优先遵循 Retry-After
+    - 延迟指标：http_stats() 按主机统计请求数、重试数、错误数与 p50 / p95 延迟
+    - 追踪：每次请求记录一个 "http <主机>" span（状态码、重试次数、收发字节数，见 tracing）
+
+项目根目录的脚本通过 from Agents.http_client import get_http_client 使用。
+"""
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from tracing import span
+except ImportError:  # 项目根目录的脚本以 Agents.http_client 导入
+    from .tracing import span
+
+MAX_PER_HOST = int(os.environ.get("HTTP_MAX_PER_HOST", "8"))
+POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "32"))
+CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "60"))
+MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.environ.get("HTTP_BACKOFF_BASE", "0.5"))
+BACKOFF_CAP = float(os.environ.get("HTTP_BACKOFF_CAP", "30"))
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# 每个主机保留的最近延迟样本数
+LATENCY_WINDOW = 2048
+
+
+def _parse_host_limits(spec):
+    limits = {}
+    for item in spec.split(","):
+        if "=" in item:
+            host, limit = item.split("=", 1)
+            limits[host.strip()] = int(limit)
+    return limits
+
+
+HOST_LIMITS = _parse_host_limits(os.environ.get("HTTP_HOST_LIMITS", ""))
+
+
+def _host(url):
+    return urlsplit(url).netloc
+
+
+def _request_bytes(kwargs):
+    """请求体的大致字节数（json / data / content）"""
+    body = kwargs.get("content", kwargs.get("data"))
+    if body is None and kwargs.get("json") is not None:
+        body = json.dumps(kwargs["json"])
+    if body is None:
+        return 0
+    if isinstance(body, str):
+        return len(body.encode("utf-8"))
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    # 表单字典等
+    return len(urlencode(body, doseq=True)) if isinstance(body, dict) else 0
+
+
+def _response_bytes(response, streamed=False):
+    # 流式下载不在这里读取响应体，按 Content-Length 计
+    if streamed:
+        return int(response.headers.get("Content-Length") or 0)
+    return len(response.content)
+
+
+def backoff_delay(attempt, retry_after=None):
+    """第 attempt 次重试前的等待秒数：全抖动指数退避，Retry-After 优先"""
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+    if retry_after:
+        try:
+            delay = max(delay, min(BACKOFF_CAP, float(retry_after)))
+        except ValueError:
+            pass
+    return delay
+
+
+class HttpMetrics:
+    """按主机统计的请求指标（线程安全，同步与异步客户端共用）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _entry(self, host):
+        if host not in self._hosts:
+            self._hosts[host] = {"requests": 0, "retries": 0, "errors": 0, "latencies": []}
+        return self._hosts[host]
+
+    def record(self, host, latency, retries, error):
+        with self._lock:
+            entry = self._entry(host)
+            entry["requests"] += 1
+            entry["retries"] += retries
+            entry["errors"] += int(error)
+            entry["latencies"].append(latency)
+            if len(entry["latencies"]) > LATENCY_WINDOW:
+                del entry["latencies"][:-LATENCY_WINDOW]
+
+    def stats(self):
+        with self._lock:
+            report = {}
+            for host, entry in self._hosts.items():
+                latencies = np.array(entry["latencies"]) * 1000 if entry["latencies"] else np.zeros(1)
+                report[host] = {
+                    "requests": entry["requests"],
+                    "retries": entry["retries"],
+                    "errors": entry["errors"],
+                    "latency_ms_p50": float(np.percentile(latencies, 50)),
+                    "latency_ms_p95": float(np.percentile(latencies, 95)),
+                }
+            return report
+
+
+_metrics = HttpMetrics()
+
+
+def http_stats():
+    return _metrics.stats()
+
+
+class HttpClient:
+    """带连接池、每主机并发上限与重试的同步客户端"""
+
+    def __init__(self, pool_size=POOL_SIZE, max_retries=MAX_RETRIES):
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._slots = {}
+        self._slots_lock = threading.Lock()
+
+    def _slot(self, host):
+        with self._slots_lock:
+            if host not in self._slots:
+                self._slots[host] = threading.BoundedSemaphore(HOST_LIMITS.get(host, MAX_PER_HOST))
+            return self._slots[host]
+
+    def request(self, method, url, retries=None, **kwargs):
+        """
+        发送请求，连接错误 / 429 / 5xx 时重试
+
+        Args:
+            retries: 覆盖默认重试次数（如健康检查传 0）
+            kwargs: 透传给 requests，未指定 timeout 时使用默认超时
+
+        Returns:
+            requests.Response（重试用尽后返回最后一次响应，由调用方 raise_for_status）
+        """
+        kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+        retries = self.max_retries if retries is None else retries
+        host = _host(url)
+        start = time.perf_counter()
+        attempt = 0
+        with span(f"http {host}", kind="client", method=method, bytes_sent=_request_bytes(kwargs)) as trace:
+            while True:
+                try:
+                    with self._slot(host):
+                        response = self.session.request(method, url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout):
+                    if attempt >= retries:
+                        _metrics.record(host, time.perf_counter() - start, attempt, error=True)
+                        raise
+                    time.sleep(backoff_delay(attempt))
+                    attempt += 1
+                    continue
+                if response.status_code in RETRY_STATUS and attempt < retries:
+                    time.sleep(backoff_delay(attempt, response.headers.get("Retry-After")))
+                    attempt += 1
+                    continue
+                _metrics.record(host, time.perf_counter() - start, attempt, error=not response.ok)
+                trace.set(status=response.status_code, retries=attempt,
+                          bytes_received=_response_bytes(response, kwargs.get("stream", False)))
+                return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+class AsyncHttpClient:
+    """HttpClient 的异步版本（httpx），每个事件循环一个实例"""
+
+    def __init__(self, pool_size=POOL_SIZE, max_retries=MAX_RETRIES):
+        import httpx
+
+        self._httpx = httpx
+        self.max_retries = max_retries
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        )
+        self._slots = {}
+
+    def _slot(self, host):
+        if host not in self._slots:
+            self._slots[host] = asyncio.Semaphore(HOST_LIMITS.get(host, MAX_PER_HOST))
+        return self._slots[host]
+
+    async def request(self, method, url, retries=None, **kwargs):
+        httpx = self._httpx
+        retries = self.max_retries if retries is None else retries
+        host = _host(url)
+        start = time.perf_counter()
+        attempt = 0
+        with span(f"http {host}", kind="client", track_cpu=False, method=method,
+                  bytes_sent=_request_bytes(kwargs)) as trace:
+            while True:
+                try:
+                    async with self._slot(host):
+                        response = await self.client.request(method, url, **kwargs)
+                except httpx.TransportError:
+                    if attempt >= retries:
+                        _metrics.record(host, time.perf_counter() - start, attempt, error=True)
+                        raise
+                    await asyncio.sleep(backoff_delay(attempt))
+                    attempt += 1
+                    continue
+                if response.status_code in RETRY_STATUS and attempt < retries:
+                    await asyncio.sleep(backoff_delay(attempt, response.headers.get("Retry-After")))
+                    attempt += 1
+                    continue
+                _metrics.record(host, time.perf_counter() - start, attempt, error=not response.is_success)
+                trace.set(status=response.status_code, retries=attempt, bytes_received=_response_bytes(response))
+                return response
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+_async_clients = {}
+
+
+def get_http_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+    return _client
+
+
+def get_async_http_client():
+    """返回当前事件循环的异步客户端（httpx 连接与 asyncio 信号量都绑定事件循环）"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        # 清理已关闭事件循环遗留的客户端
+        for old_loop in [l for l in _async_clients if l.is_closed()]:
+            del _async_clients[old_loop]
+        client = _async_clients[loop] = AsyncHttpClient()
+    return client
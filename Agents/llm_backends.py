@@ -0,0 +1,520 @@
+"""
+可插拔的 LLM 后端（由 llm_gateway 调用）
+
+    gemini   远程 Gemini（默认），受 rate_limiter 的配额调度；静态前缀足够长（GEMINI_MIN_CACHE_TOKENS）时
+             用显式上下文缓存（caches.create）保存前缀，之后的请求只提交每蛋白内容，LLM_CONTEXT_CACHE=0 关闭
+    local    本地因果语言模型（默认 phi3-biostars-merged，加载方式与 rag/rag_agent.py 相同），CPU 推理：
+               - 跨蛋白批处理：后台线程在 LOCAL_LLM_BATCH_WAIT_MS 内收集最多 LOCAL_LLM_BATCH_SIZE 个请求，
+                 左填充后一次 generate
+               - 前缀 KV 复用：调用方给出静态前缀时，前缀的 KV cache 只计算一次，之后单独执行的请求只预填充后缀；
+                 同一前缀、同一生成参数的多个请求同时排队时合并为一批（前缀随每条提示词一起批量预填充）
+               - 可选权重量化：LOCAL_LLM_QUANT=int8（torch 动态量化 Linear 层）/ int4（bitsandbytes，
+                 不可用时退回 int8）
+
+运行时选择：LLM_BACKEND=gemini / local；单个智能体可用 LLM_BACKEND_<AGENT> 覆盖，
+如 LLM_BACKEND_REASONING=gemini 让综合分析仍走远程，其余智能体走本地模型。
+
+离线吞吐测试：
+    LLM_BACKEND=local python Agents/update.py
+    python Agents/llm_backends.py bench --backend local --prompts 16 --concurrency 8
+    python Agents/llm_backends.py bench --backend local --no-prefix   # 只测批处理，不含前缀 KV 复用
+"""
+
+import argparse
+import asyncio
+import copy
+import hashlib
+import importlib.util
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini")
+GEMINI_MODEL = os.environ.get("LLM_MODEL", "gemini-2.5-flash")
+CONTEXT_CACHE_ENABLED = os.environ.get("LLM_CONTEXT_CACHE", "1") != "0"
+# Gemini 显式缓存的最小 token 数（2.5 Flash 为 1024），更短的前缀直接随请求提交
+GEMINI_MIN_CACHE_TOKENS = int(os.environ.get("GEMINI_MIN_CACHE_TOKENS", "1024"))
+CONTEXT_CACHE_TTL = int(os.environ.get("LLM_CONTEXT_CACHE_TTL", "3600"))
+LOCAL_LLM_PATH = os.environ.get("LOCAL_LLM_PATH", "phi3-biostars-merged")
+LOCAL_LLM_QUANT = os.environ.get("LOCAL_LLM_QUANT", "none")
+LOCAL_LLM_THREADS = int(os.environ.get("LOCAL_LLM_THREADS", "0"))
+LOCAL_LLM_BATCH_SIZE = int(os.environ.get("LOCAL_LLM_BATCH_SIZE", "4"))
+LOCAL_LLM_BATCH_WAIT_MS = float(os.environ.get("LOCAL_LLM_BATCH_WAIT_MS", "50"))
+LOCAL_LLM_MAX_NEW_TOKENS = int(os.environ.get("LOCAL_LLM_MAX_NEW_TOKENS", "768"))
+# 保留的前缀 KV cache 个数（每个智能体的静态前缀各占一个）
+PREFIX_CACHE_SIZE = int(os.environ.get("LOCAL_LLM_PREFIX_CACHE", "8"))
+
+
+def _usage(response):
+    """usage_metadata 转为 {prompt_tokens, completion_tokens, total_tokens}，没有时返回 None"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None
+    return {
+        "prompt_tokens": getattr(usage, "prompt_token_count", None),
+        "completion_tokens": getattr(usage, "candidates_token_count", None),
+        "total_tokens": getattr(usage, "total_token_count", None),
+    }
+
+
+def _local_usage(n_prompt, n_completion):
+    return {"prompt_tokens": n_prompt, "completion_tokens": n_completion, "total_tokens": n_prompt + n_completion}
+
+
+class GeminiBackend:
+    name = "gemini"
+    # 远程配额由 rate_limiter 调度
+    rate_limited = True
+
+    def __init__(self, model=GEMINI_MODEL):
+        self.default_model = model
+        self._client = None
+        self._lock = threading.Lock()
+        # (模型, 前缀哈希) -> (缓存名, 过期时间)；创建失败记为 None，不再重试
+        self._context_caches = {}
+        self.context_cache_hits = 0
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                from dotenv import load_dotenv
+                from google import genai
+
+                load_dotenv()
+                self._client = genai.Client()
+        return self._client
+
+    def available(self):
+        return importlib.util.find_spec("google.genai") is not None
+
+    def _cached_prefix(self, model, prefix):
+        """返回前缀对应的显式上下文缓存名；前缀过短或创建失败时返回 None"""
+        if not CONTEXT_CACHE_ENABLED or len(prefix) // 4 < GEMINI_MIN_CACHE_TOKENS:
+            return None
+        key = (model, hashlib.sha256(prefix.encode("utf-8")).hexdigest())
+        now = time.time()
+        with self._lock:
+            entry = self._context_caches.get(key, ())
+            if entry is None:
+                return None
+            if entry and entry[1] > now:
+                self.context_cache_hits += 1
+                return entry[0]
+        try:
+            cache = self.client.caches.create(
+                model=model, config={"contents": [prefix], "ttl": f"{CONTEXT_CACHE_TTL}s"}
+            )
+            entry = (cache.name, now + CONTEXT_CACHE_TTL * 0.9)
+        except Exception as e:
+            print(f"Warning: Gemini context cache unavailable, sending prefix inline: {e}")
+            entry = None
+        with self._lock:
+            self._context_caches[key] = entry
+        return entry[0] if entry else None
+
+    def _request(self, prompt, model, config, prefix):
+        """Returns: (contents, config)，前缀已缓存时只提交每蛋白内容"""
+        if prefix:
+            name = self._cached_prefix(model, prefix)
+            if name:
+                return prompt, {**(config or {}), "cached_content": name}
+        return (prefix or "") + prompt, config
+
+    async def _request_async(self, prompt, model, config, prefix):
+        if prefix and CONTEXT_CACHE_ENABLED and len(prefix) // 4 >= GEMINI_MIN_CACHE_TOKENS:
+            return await asyncio.to_thread(self._request, prompt, model, config, prefix)
+        return (prefix or "") + prompt, config
+
+    def generate(self, prompt, model, config=None, prefix=None):
+        """
+        Args:
+            prefix: 静态前缀（足够长时走显式上下文缓存）
+
+        Returns:
+            (文本, token 用量字典或 None)
+        """
+        contents, config = self._request(prompt, model, config, prefix)
+        response = self.client.models.generate_content(model=model, contents=contents, config=config)
+        return response.text, _usage(response)
+
+    async def generate_async(self, prompt, model, config=None, prefix=None):
+        contents, config = await self._request_async(prompt, model, config, prefix)
+        response = await self.client.aio.models.generate_content(model=model, contents=contents, config=config)
+        return response.text, _usage(response)
+
+    def generate_stream(self, prompt, model, config=None, prefix=None):
+        """Yields: (文本片段, token 用量字典或 None)"""
+        contents, config = self._request(prompt, model, config, prefix)
+        for chunk in self.client.models.generate_content_stream(model=model, contents=contents, config=config):
+            yield chunk.text or "", _usage(chunk)
+
+    async def generate_stream_async(self, prompt, model, config=None, prefix=None):
+        contents, config = await self._request_async(prompt, model, config, prefix)
+        stream = await self.client.aio.models.generate_content_stream(model=model, contents=contents, config=config)
+        async for chunk in stream:
+            yield chunk.text or "", _usage(chunk)
+
+    def stats(self):
+        with self._lock:
+            active = sum(1 for entry in self._context_caches.values() if entry)
+        return {"context_caches": active, "context_cache_hits": self.context_cache_hits}
+
+
+class _Job:
+    __slots__ = ("prefix", "prompt", "params", "future", "streamer")
+
+    def __init__(self, prefix, prompt, params, streamer=None):
+        self.prefix = prefix
+        self.prompt = prompt
+        self.params = params
+        self.future = Future()
+        self.streamer = streamer
+
+
+class LocalCausalLMBackend:
+    name = "local"
+    rate_limited = False
+
+    def __init__(self, model_path=LOCAL_LLM_PATH, quantization=LOCAL_LLM_QUANT, batch_size=LOCAL_LLM_BATCH_SIZE,
+                 batch_wait_ms=LOCAL_LLM_BATCH_WAIT_MS, max_new_tokens=LOCAL_LLM_MAX_NEW_TOKENS):
+        """
+        Args:
+            model_path: transformers 模型目录（如 merge.py 生成的 phi3-biostars-merged）
+            quantization: none / int8 / int4
+            batch_size: 每次 generate 合并的最大请求数
+            batch_wait_ms: 凑批的最长等待时间
+            max_new_tokens: 默认生成长度（config 中的 max_output_tokens 优先）
+        """
+        self.model_path = model_path
+        self.default_model = model_path
+        self.quantization = quantization
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000.0
+        self.max_new_tokens = max_new_tokens
+        self._model = None
+        self._tokenizer = None
+        self._template = None
+        self._prefix_cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+        self.batches = 0
+        self.prefix_hits = 0
+
+    def available(self):
+        return (
+            all(importlib.util.find_spec(m) is not None for m in ("torch", "transformers"))
+            and os.path.isdir(self.model_path)
+        )
+
+    def _load(self):
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        if LOCAL_LLM_THREADS:
+            torch.set_num_threads(LOCAL_LLM_THREADS)
+        tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+        # 批量生成需要左填充，生成的 token 才能接在每条提示词之后
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+
+        model = None
+        if self.quantization == "int4":
+            try:
+                from transformers import BitsAndBytesConfig
+
+                model = AutoModelForCausalLM.from_pretrained(
+                    self.model_path,
+                    quantization_config=BitsAndBytesConfig(load_in_4bit=True, bnb_4bit_compute_dtype=torch.float32),
+                )
+            except Exception as e:
+                print(f"Warning: int4 quantization unavailable, falling back to int8: {e}")
+                self.quantization = "int8"
+        if model is None:
+            model = AutoModelForCausalLM.from_pretrained(self.model_path, torch_dtype=torch.float32)
+        if self.quantization == "int8":
+            # CPU 上的动态量化：Linear 权重存为 int8，激活在运行时量化
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        model.eval()
+
+        # 对话模板拆成 头 + 内容 + 尾，前缀 KV 才能与完整提示词的 token 对齐
+        head, tail = "", ""
+        if getattr(tokenizer, "chat_template", None):
+            rendered = tokenizer.apply_chat_template(
+                [{"role": "user", "content": "\x00"}], tokenize=False, add_generation_prompt=True
+            )
+            head, tail = rendered.split("\x00", 1)
+        self._tokenizer, self._model, self._template = tokenizer, model, (head, tail)
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._model is None:
+                self._load()
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="local-llm", daemon=True)
+                self._worker.start()
+
+    def _gen_kwargs(self, params):
+        kwargs = {"max_new_tokens": params.get("max_output_tokens", self.max_new_tokens)}
+        temperature = params.get("temperature")
+        if temperature:
+            kwargs.update(do_sample=True, temperature=temperature, top_p=params.get("top_p", 1.0))
+        else:
+            kwargs["do_sample"] = False
+        kwargs["pad_token_id"] = self._tokenizer.pad_token_id
+        return kwargs
+
+    def _run(self):
+        while True:
+            jobs = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(jobs) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    jobs.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            # 流式请求逐条处理；其余按 (前缀, 生成参数) 分组，多条的组合并为一批，
+            # 只有一条时单独执行并复用前缀 KV
+            groups = {}
+            for job in jobs:
+                if job.streamer is not None:
+                    self._execute([job])
+                else:
+                    key = (job.prefix or "", json.dumps(job.params, sort_keys=True))
+                    groups.setdefault(key, []).append(job)
+            for group in groups.values():
+                self._execute(group)
+
+    def _execute(self, jobs):
+        try:
+            results = self._generate_prefixed(jobs[0]) if len(jobs) == 1 else self._generate_batch(jobs)
+        except Exception as e:
+            for job in jobs:
+                if job.streamer is not None:
+                    # 结束流，避免读取方一直阻塞
+                    job.streamer.end()
+                job.future.set_exception(e)
+            return
+        self.batches += 1
+        for job, result in zip(jobs, results):
+            job.future.set_result(result)
+
+    def _generate_batch(self, jobs):
+        import torch
+
+        head, tail = self._template
+        texts = [head + (job.prefix or "") + job.prompt + tail for job in jobs]
+        inputs = self._tokenizer(texts, return_tensors="pt", padding=True, add_special_tokens=False)
+        with torch.no_grad():
+            output = self._model.generate(**inputs, **self._gen_kwargs(jobs[0].params))
+        prompt_len = inputs["input_ids"].shape[1]
+        results = []
+        for i, row in enumerate(output):
+            generated = row[prompt_len:]
+            text = self._tokenizer.decode(generated, skip_special_tokens=True)
+            n_prompt = int(inputs["attention_mask"][i].sum())
+            n_completion = int((generated != self._tokenizer.pad_token_id).sum())
+            results.append((text, _local_usage(n_prompt, n_completion)))
+        return results
+
+    def _prefix_kv(self, prefix_text):
+        """前缀的 token 与 KV cache（LRU 缓存，返回深拷贝，generate 会原地扩展 cache）"""
+        import torch
+        from transformers import DynamicCache
+
+        entry = self._prefix_cache.get(prefix_text)
+        if entry is None:
+            ids = self._tokenizer(prefix_text, return_tensors="pt", add_special_tokens=False)["input_ids"]
+            with torch.no_grad():
+                kv = self._model(input_ids=ids, past_key_values=DynamicCache(), use_cache=True).past_key_values
+            entry = self._prefix_cache[prefix_text] = (ids, kv)
+            while len(self._prefix_cache) > PREFIX_CACHE_SIZE:
+                self._prefix_cache.popitem(last=False)
+        else:
+            self._prefix_cache.move_to_end(prefix_text)
+            self.prefix_hits += 1
+        return entry[0], copy.deepcopy(entry[1])
+
+    def _generate_prefixed(self, job):
+        import torch
+
+        head, tail = self._template
+        kwargs = self._gen_kwargs(job.params)
+        if job.streamer is not None:
+            kwargs["streamer"] = job.streamer
+        suffix_ids = self._tokenizer(job.prompt + tail, return_tensors="pt", add_special_tokens=False)["input_ids"]
+        if job.prefix:
+            prefix_ids, kv = self._prefix_kv(head + job.prefix)
+            kwargs["past_key_values"] = kv
+        else:
+            prefix_ids = self._tokenizer(head, return_tensors="pt", add_special_tokens=False)["input_ids"]
+        input_ids = torch.cat([prefix_ids, suffix_ids], dim=1)
+        with torch.no_grad():
+            output = self._model.generate(
+                input_ids=input_ids, attention_mask=torch.ones_like(input_ids), **kwargs
+            )
+        generated = output[0][input_ids.shape[1]:]
+        text = self._tokenizer.decode(generated, skip_special_tokens=True)
+        return [(text, _local_usage(int(input_ids.shape[1]), int(generated.shape[0])))]
+
+    def stats(self):
+        return {
+            "model": self.model_path,
+            "quantization": self.quantization,
+            "batches": self.batches,
+            "prefix_cache_hits": self.prefix_hits,
+        }
+
+    def submit(self, prompt, config=None, prefix=None, streamer=None):
+        self._ensure_worker()
+        job = _Job(prefix, prompt, dict(config or {}), streamer)
+        self._queue.put(job)
+        return job.future
+
+    def generate(self, prompt, model=None, config=None, prefix=None):
+        return self.submit(prompt, config, prefix).result()
+
+    async def generate_async(self, prompt, model=None, config=None, prefix=None):
+        return await asyncio.wrap_future(self.submit(prompt, config, prefix))
+
+    def _streamer(self):
+        from transformers import TextIteratorStreamer
+
+        return TextIteratorStreamer(self._tokenizer, skip_prompt=True, skip_special_tokens=True)
+
+    def generate_stream(self, prompt, model=None, config=None, prefix=None):
+        self._ensure_worker()
+        streamer = self._streamer()
+        future = self.submit(prompt, config, prefix, streamer=streamer)
+        for delta in streamer:
+            yield delta, None
+        yield "", future.result()[1]
+
+    async def generate_stream_async(self, prompt, model=None, config=None, prefix=None):
+        self._ensure_worker()
+        streamer = self._streamer()
+        future = self.submit(prompt, config, prefix, streamer=streamer)
+        loop = asyncio.get_running_loop()
+        done = object()
+        while True:
+            # TextIteratorStreamer 是阻塞迭代器，放到线程中取下一段
+            delta = await loop.run_in_executor(None, next, streamer, done)
+            if delta is done:
+                break
+            yield delta, None
+        result = await asyncio.wrap_future(future)
+        yield "", result[1]
+
+
+BACKENDS = {
+    GeminiBackend.name: GeminiBackend,
+    LocalCausalLMBackend.name: LocalCausalLMBackend,
+}
+
+_backends = {}
+_backend_lock = threading.Lock()
+
+
+def get_llm_backend(agent=None):
+    """
+    返回某个智能体使用的后端实例（同名后端在进程内共享，本地模型只加载一次）
+
+    Args:
+        agent: 智能体名（sequence / structure / function / reasoning / eval），用于查找 LLM_BACKEND_<AGENT>
+    """
+    name = LLM_BACKEND
+    if agent:
+        name = os.environ.get(f"LLM_BACKEND_{agent.upper()}", name)
+    if name not in BACKENDS:
+        raise ValueError(f"未知的 LLM 后端: {name}，可选: {', '.join(BACKENDS)}")
+    with _backend_lock:
+        if name not in _backends:
+            _backends[name] = BACKENDS[name]()
+        return _backends[name]
+
+
+def llm_backend_stats():
+    with _backend_lock:
+        return {name: backend.stats() for name, backend in _backends.items() if hasattr(backend, "stats")}
+
+
+BENCH_PREFIX = "You are a protein function expert. Describe the Molecular Function, Biological Process and Cellular Component of the protein below.\n\n"
+
+
+def benchmark(backend_name, prompts, concurrency=8, config=None, prefix=BENCH_PREFIX):
+    """
+    并发生成一组提示词，统计吞吐与单条延迟（不经过响应缓存与限流）
+
+    Args:
+        prefix: 所有提示词共享的静态前缀；传 None 时只测批处理，不含前缀 KV 复用
+    """
+    backend = BACKENDS[backend_name]()
+    latencies, tokens, errors = [], 0, 0
+
+    def run(prompt):
+        start = time.perf_counter()
+        _, usage = backend.generate(prompt, backend.default_model, config=config, prefix=prefix)
+        return time.perf_counter() - start, (usage or {}).get("total_tokens") or 0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(run, prompt) for prompt in prompts]:
+            try:
+                latency, n_tokens = future.result()
+                latencies.append(latency)
+                tokens += n_tokens
+            except Exception as e:
+                errors += 1
+                print(f"Warning: Generation failed: {e}")
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies) if latencies else np.zeros(1)
+    return {
+        "backend": backend.name,
+        "prompts": len(prompts),
+        "errors": errors,
+        "concurrency": concurrency,
+        "prefix": prefix is not None,
+        "requests_per_s": len(prompts) / elapsed if elapsed > 0 else None,
+        "tokens_per_s": tokens / elapsed if elapsed > 0 else None,
+        "latency_s_p50": float(np.percentile(latencies, 50)),
+        "latency_s_p95": float(np.percentile(latencies, 95)),
+        # 本地后端的 batches / prefix_cache_hits：批次数远小于提示词数说明请求确实被合并
+        "backend_stats": backend.stats(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM 后端工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    bench = sub.add_parser("bench", help="对 LLM 后端做吞吐 / 延迟测试")
+    bench.add_argument("--backend", default="local", choices=list(BACKENDS))
+    bench.add_argument("--input", default=None, help="FASTA 文件，每条序列生成一个提示词")
+    bench.add_argument("--prompts", type=int, default=16, help="未指定 --input 时生成的提示词个数")
+    bench.add_argument("--concurrency", type=int, default=8)
+    bench.add_argument("--max-new-tokens", type=int, default=128)
+    bench.add_argument("--no-prefix", action="store_true", help="不使用共享前缀（单独测量跨请求批处理）")
+    args = parser.parse_args()
+
+    if args.input:
+        from Bio import SeqIO
+
+        sequences = [str(record.seq) for record in SeqIO.parse(args.input, "fasta")][:args.prompts]
+    else:
+        sequences = ["MKTAYIAKQRQISFVKSHFSRQ" * (i % 4 + 1) for i in range(args.prompts)]
+    prompts = [f"Protein sequence:\n{seq}\n" for seq in sequences]
+    report = benchmark(args.backend, prompts, concurrency=args.concurrency,
+                       config={"max_output_tokens": args.max_new_tokens},
+                       prefix=None if args.no_prefix else BENCH_PREFIX)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
@@ -0,0 +1,443 @@
+"""
+统一的 LLM 调用层（所有智能体的 LLM 调用都经过这里）
+
+    - 后端由 llm_backends 提供：远程 Gemini（默认）或本地因果语言模型，LLM_BACKEND / LLM_BACKEND_<AGENT> 选择
+    - 内容寻址的响应缓存：键为 sha256(后端 + 模型 + 提示词 + 生成参数)，存储在 SQLite 中，
+      超过 LLM_CACHE_TTL_DAYS 天视为过期，总大小超过 LLM_CACHE_MAX_MB 时按 LRU 淘汰
+    - 在途去重：相同的请求同时到达时只发起一次调用，其余调用等待同一结果
+    - 默认模型由 LLM_MODEL 指定；LLM_CACHE=0 关闭缓存（在途去重仍然生效）
+    - 远程后端的实际调用前经过 rate_limiter 的 RPM / TPM 令牌桶与优先级队列，429 时自适应退避后重试
+    - 流式接口 generate_stream / generate_stream_async 逐块产出文本，结束后整段写入缓存；
+      命中缓存时一次产出完整文本
+    - 每次调用记录一个 llm.<agent> span（见 tracing）：缓存命中、在途去重、排队等待、重试与 token 用量
+
+重跑与评估时输入不变的提示词不再产生 LLM 调用。
+
+项目根目录及 rag/ 下的脚本把 Agents 目录加入 sys.path 后 from llm_gateway import generate 使用。
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+
+from http_client import backoff_delay
+from llm_backends import get_llm_backend, llm_backend_stats
+from rate_limiter import EXPECTED_OUTPUT_TOKENS, estimate_prompt_tokens, get_rate_scheduler
+from tracing import current_span, span
+
+CACHE_ENABLED = os.environ.get("LLM_CACHE", "1") != "0"
+CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "Agents/.cache/llm.sqlite")
+CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL_DAYS", "30")) * 86400
+CACHE_MAX_BYTES = int(float(os.environ.get("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024)
+MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "5"))
+
+
+def llm_cache_key(model, prompt, config=None):
+    payload = json.dumps(
+        {"model": model, "prompt": prompt, "config": config or {}},
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_rate_limit_error(error):
+    return getattr(error, "code", None) == 429 or getattr(error, "status", None) == "RESOURCE_EXHAUSTED"
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return headers.get("Retry-After")
+    except AttributeError:
+        return None
+
+
+class LLMResponseCache:
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES):
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, text BLOB, nbytes INTEGER, created REAL, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_used)")
+
+    def get(self, key):
+        """返回缓存的响应文本，未命中或已过期时返回 None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT text, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def put(self, key, model, text):
+        blob = zlib.compress(text.encode("utf-8"), 6)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model, blob, len(blob), now, now),
+                )
+                self._evict(now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        total = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, nbytes in self._conn.execute("SELECT key, nbytes FROM responses ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= nbytes
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def _usage_attributes(usage):
+    """后端返回的 token 用量 -> span 属性"""
+    usage = usage or {}
+    return {"prompt_tokens": usage.get("prompt_tokens"), "completion_tokens": usage.get("completion_tokens")}
+
+
+class LLMGateway:
+    """带响应缓存、在途去重与配额调度的 LLM 调用入口"""
+
+    def __init__(self, cache=None, use_cache=CACHE_ENABLED):
+        self.use_cache = use_cache
+        self._cache = cache
+        self._cache_lock = threading.Lock()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._inflight_async = {}
+        self.calls = 0
+        self.deduplicated = 0
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            # 并发的首次调用只创建一个缓存实例（一个 SQLite 连接与一份命中统计）
+            with self._cache_lock:
+                if self._cache is None:
+                    self._cache = LLMResponseCache()
+        return self._cache
+
+    def _cached(self, key):
+        if not self.use_cache:
+            return None
+        try:
+            return self.cache.get(key)
+        except Exception as e:
+            print(f"Warning: LLM cache lookup failed: {e}")
+            return None
+
+    def _store(self, key, model, text):
+        if not self.use_cache or not text:
+            return
+        try:
+            self.cache.put(key, model, text)
+        except Exception as e:
+            print(f"Warning: LLM cache write failed: {e}")
+
+    def _resolve(self, prompt, model, config, agent, prefix):
+        """Returns: (后端, 模型, 缓存键)"""
+        backend = get_llm_backend(agent)
+        model = model or backend.default_model
+        return backend, model, llm_cache_key(f"{backend.name}:{model}", (prefix or "") + prompt, config)
+
+    @staticmethod
+    def _span(agent, backend, model, track_cpu=True, activate=True, **attributes):
+        return span(f"llm.{agent or 'default'}", kind="client", track_cpu=track_cpu, activate=activate,
+                    backend=backend.name, model=model, **attributes)
+
+    def _call(self, backend, model, prompt, config, priority, prefix):
+        if not backend.rate_limited:
+            self.calls += 1
+            text, usage = backend.generate(prompt, model, config, prefix=prefix)
+            current_span().set(**_usage_attributes(usage))
+            return text
+        scheduler = get_rate_scheduler()
+        estimate = estimate_prompt_tokens((prefix or "") + prompt) + EXPECTED_OUTPUT_TOKENS
+        attempt = 0
+        while True:
+            current_span().add(queue_wait_s=scheduler.acquire(estimate, priority))
+            self.calls += 1
+            try:
+                text, usage = backend.generate(prompt, model, config, prefix=prefix)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= MAX_RETRIES:
+                    raise
+                scheduler.on_rate_limited(backoff_delay(attempt, _retry_after(e)))
+                current_span().add(retries=1)
+                attempt += 1
+                continue
+            scheduler.on_success()
+            scheduler.settle(estimate, (usage or {}).get("total_tokens"))
+            current_span().set(**_usage_attributes(usage))
+            return text
+
+    async def _call_async(self, backend, model, prompt, config, priority, prefix):
+        if not backend.rate_limited:
+            self.calls += 1
+            text, usage = await backend.generate_async(prompt, model, config, prefix=prefix)
+            current_span().set(**_usage_attributes(usage))
+            return text
+        scheduler = get_rate_scheduler()
+        estimate = estimate_prompt_tokens((prefix or "") + prompt) + EXPECTED_OUTPUT_TOKENS
+        attempt = 0
+        while True:
+            current_span().add(queue_wait_s=await scheduler.acquire_async(estimate, priority))
+            self.calls += 1
+            try:
+                text, usage = await backend.generate_async(prompt, model, config, prefix=prefix)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= MAX_RETRIES:
+                    raise
+                scheduler.on_rate_limited(backoff_delay(attempt, _retry_after(e)))
+                current_span().add(retries=1)
+                attempt += 1
+                continue
+            scheduler.on_success()
+            scheduler.settle(estimate, (usage or {}).get("total_tokens"))
+            current_span().set(**_usage_attributes(usage))
+            return text
+
+    def generate(self, prompt, model=None, config=None, priority=None, agent=None, prefix=None):
+        """
+        生成文本（先查缓存，相同请求并发时只调用一次）
+
+        Args:
+            prompt: 提示词（有 prefix 时为前缀之后的部分）
+            model: 模型名，默认使用后端的默认模型
+            config: 生成参数（字典），参与缓存键
+            priority: 限流队列中的优先级（rate_limiter.PRIORITIES 中的名称或整数），默认取 agent，不参与缓存键
+            agent: 调用方智能体名，用于选择后端（LLM_BACKEND_<AGENT>）
+            prefix: 多个请求共享的静态前缀，本地后端复用其 KV cache
+
+        Returns:
+            响应文本
+        """
+        backend, model, key = self._resolve(prompt, model, config, agent, prefix)
+        with self._span(agent, backend, model) as trace:
+            text = self._cached(key)
+            if text is not None:
+                trace.set(cache_hit=True)
+                return text
+
+            with self._inflight_lock:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = self._inflight[key] = Future()
+                else:
+                    self.deduplicated += 1
+            if not leader:
+                trace.set(deduplicated=True)
+                return future.result()
+
+            try:
+                text = self._call(backend, model, prompt, config, priority or agent, prefix)
+                self._store(key, model, text)
+                future.set_result(text)
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with self._inflight_lock:
+                    del self._inflight[key]
+            return text
+
+    async def generate_async(self, prompt, model=None, config=None, priority=None, agent=None, prefix=None):
+        """generate 的异步版本（在途去重按事件循环进行）"""
+        backend, model, key = self._resolve(prompt, model, config, agent, prefix)
+        with self._span(agent, backend, model, track_cpu=False) as trace:
+            text = self._cached(key)
+            if text is not None:
+                trace.set(cache_hit=True)
+                return text
+
+            loop = asyncio.get_running_loop()
+            if loop not in self._inflight_async:
+                for old_loop in [l for l in self._inflight_async if l.is_closed()]:
+                    del self._inflight_async[old_loop]
+            inflight = self._inflight_async.setdefault(loop, {})
+            task = inflight.get(key)
+            if task is None:
+                # 任务复制当前上下文，token 用量记在发起调用的 span 上
+                task = inflight[key] = asyncio.ensure_future(
+                    self._generate_and_store(key, backend, model, prompt, config, priority or agent, prefix)
+                )
+                task.add_done_callback(lambda _: inflight.pop(key, None))
+            else:
+                self.deduplicated += 1
+                trace.set(deduplicated=True)
+            # shield：某个等待者被取消时不影响其他等待同一结果的调用
+            return await asyncio.shield(task)
+
+    async def _generate_and_store(self, key, backend, model, prompt, config, priority, prefix):
+        text = await self._call_async(backend, model, prompt, config, priority, prefix)
+        self._store(key, model, text)
+        return text
+
+    def generate_stream(self, prompt, model=None, config=None, priority=None, agent=None, prefix=None):
+        """
+        流式生成，逐块产出文本（不做在途去重；已开始输出后不再重试）
+
+        Yields:
+            文本片段
+        """
+        backend, model, key = self._resolve(prompt, model, config, agent, prefix)
+        # 跨 yield 持有的 span 不设为当前 span
+        with self._span(agent, backend, model, track_cpu=False, activate=False, stream=True) as trace:
+            text = self._cached(key)
+            if text is not None:
+                trace.set(cache_hit=True)
+                yield text
+                return
+
+            scheduler = get_rate_scheduler() if backend.rate_limited else None
+            estimate = estimate_prompt_tokens((prefix or "") + prompt) + EXPECTED_OUTPUT_TOKENS
+            attempt = 0
+            while True:
+                if scheduler:
+                    trace.add(queue_wait_s=scheduler.acquire(estimate, priority or agent))
+                self.calls += 1
+                parts = []
+                usage = None
+                try:
+                    for delta, chunk_usage in backend.generate_stream(prompt, model, config, prefix=prefix):
+                        if chunk_usage and chunk_usage.get("total_tokens"):
+                            usage = chunk_usage
+                        if delta:
+                            parts.append(delta)
+                            yield delta
+                except Exception as e:
+                    if parts or not scheduler or not is_rate_limit_error(e) or attempt >= MAX_RETRIES:
+                        raise
+                    scheduler.on_rate_limited(backoff_delay(attempt, _retry_after(e)))
+                    trace.add(retries=1)
+                    attempt += 1
+                    continue
+                if scheduler:
+                    scheduler.on_success()
+                    scheduler.settle(estimate, (usage or {}).get("total_tokens"))
+                trace.set(**_usage_attributes(usage))
+                self._store(key, model, "".join(parts))
+                return
+
+    async def generate_stream_async(self, prompt, model=None, config=None, priority=None, agent=None, prefix=None):
+        """generate_stream 的异步版本"""
+        backend, model, key = self._resolve(prompt, model, config, agent, prefix)
+        # 跨 yield 持有的 span 不设为当前 span
+        with self._span(agent, backend, model, track_cpu=False, activate=False, stream=True) as trace:
+            text = self._cached(key)
+            if text is not None:
+                trace.set(cache_hit=True)
+                yield text
+                return
+
+            scheduler = get_rate_scheduler() if backend.rate_limited else None
+            estimate = estimate_prompt_tokens((prefix or "") + prompt) + EXPECTED_OUTPUT_TOKENS
+            attempt = 0
+            while True:
+                if scheduler:
+                    trace.add(queue_wait_s=await scheduler.acquire_async(estimate, priority or agent))
+                self.calls += 1
+                parts = []
+                usage = None
+                try:
+                    async for delta, chunk_usage in backend.generate_stream_async(prompt, model, config, prefix=prefix):
+                        if chunk_usage and chunk_usage.get("total_tokens"):
+                            usage = chunk_usage
+                        if delta:
+                            parts.append(delta)
+                            yield delta
+                except Exception as e:
+                    if parts or not scheduler or not is_rate_limit_error(e) or attempt >= MAX_RETRIES:
+                        raise
+                    scheduler.on_rate_limited(backoff_delay(attempt, _retry_after(e)))
+                    trace.add(retries=1)
+                    attempt += 1
+                    continue
+                if scheduler:
+                    scheduler.on_success()
+                    scheduler.settle(estimate, (usage or {}).get("total_tokens"))
+                trace.set(**_usage_attributes(usage))
+                self._store(key, model, "".join(parts))
+                return
+
+    def stats(self):
+        report = {"calls": self.calls, "deduplicated": self.deduplicated, "scheduler": get_rate_scheduler().stats()}
+        backends = llm_backend_stats()
+        if backends:
+            report["backends"] = backends
+        if self.use_cache and self._cache is not None:
+            report["cache"] = self._cache.stats()
+        return report
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway():
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+    return _gateway
+
+
+def generate(prompt, model=None, config=None, priority=None, agent=None, prefix=None):
+    return get_llm_gateway().generate(prompt, model=model, config=config, priority=priority, agent=agent, prefix=prefix)
+
+
+async def generate_async(prompt, model=None, config=None, priority=None, agent=None, prefix=None):
+    return await get_llm_gateway().generate_async(
+        prompt, model=model, config=config, priority=priority, agent=agent, prefix=prefix
+    )
+
+
+def generate_stream(prompt, model=None, config=None, priority=None, agent=None, prefix=None):
+    return get_llm_gateway().generate_stream(
+        prompt, model=model, config=config, priority=priority, agent=agent, prefix=prefix
+    )
+
+
+def generate_stream_async(prompt, model=None, config=None, priority=None, agent=None, prefix=None):
+    return get_llm_gateway().generate_stream_async(
+        prompt, model=model, config=config, priority=priority, agent=agent, prefix=prefix
+    )
+
+
+def llm_stats():
+    return get_llm_gateway().stats()
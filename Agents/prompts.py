@@ -0,0 +1,130 @@
+"""
+各智能体共用的提示词模板
+
+每个模板拆成两部分：
+    prefix  静态部分（角色 + MF / BP / CC 指令块），对同一智能体的所有蛋白完全相同，放在最前面：
+            本地后端复用其 KV cache，Gemini 后端可对其做上下文缓存（见 llm_backends）
+    body    每个蛋白各自的内容（序列、检索结果、GO 预测、结构特征等）
+
+原始序列只交给确实需要它的智能体：序列智能体保留完整序列，结构 / 功能智能体只看序列摘要
+（长度、N / C 端片段、组成特征），它们的依据分别是结构特征和 GO 预测。
+可用 PROMPT_SEQUENCE_<AGENT>=full / digest / none 覆盖。
+"""
+
+import os
+from dataclasses import dataclass
+
+FUNCTION_ASPECTS = """Please generate a comprehensive, accurate, and fluent natural language functional description from three aspects:
+1. Molecular Function (MF) - Biochemical activity of the protein
+2. Biological Process (BP) - Biological processes the protein participates in
+3. Cellular Component (CC) - Cellular localization of the protein
+
+Please provide detailed and accurate functional descriptions, including:
+- Main functional characteristics
+- Possible biological roles
+- Related metabolic pathways
+- Potential disease associations
+- Domain and functional site analysis"""
+
+SEQUENCE_MODES = {
+    "sequence": os.environ.get("PROMPT_SEQUENCE_SEQUENCE", "full"),
+    "structure": os.environ.get("PROMPT_SEQUENCE_STRUCTURE", "digest"),
+    "function": os.environ.get("PROMPT_SEQUENCE_FUNCTION", "digest"),
+}
+
+HYDROPHOBIC = set("AVILMFWC")
+CHARGED = set("DEKR")
+
+
+def sequence_digest(sequence, head=30, tail=10):
+    """
+    序列摘要：长度、N 端（信号肽 / 转运肽）与 C 端（如 KDEL、CAAX）片段、组成特征
+
+    Returns:
+        单行文本
+    """
+    length = len(sequence)
+    if length <= head + tail:
+        return f"length {length} aa: {sequence}"
+    hydrophobic = sum(1 for aa in sequence if aa in HYDROPHOBIC) / length
+    charged = sum(1 for aa in sequence if aa in CHARGED) / length
+    return (
+        f"length {length} aa; N-terminus {sequence[:head]}...; C-terminus ...{sequence[-tail:]}; "
+        f"hydrophobic {hydrophobic:.0%}, charged {charged:.0%}, Cys {sequence.count('C')}"
+    )
+
+
+def sequence_for_prompt(sequence, agent):
+    mode = SEQUENCE_MODES.get(agent, "full")
+    if mode == "none":
+        return "(omitted)"
+    if mode == "digest":
+        return sequence_digest(sequence)
+    return sequence
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    agent: str
+    prefix: str
+    body: str
+
+    def render(self, **fields):
+        """
+        Returns:
+            (prefix, body)：prefix 对同一模板恒定，body 为填入字段后的每蛋白内容
+        """
+        if "sequence" in fields:
+            fields["sequence"] = sequence_for_prompt(fields["sequence"], self.agent)
+        return self.prefix, self.body.format(**fields)
+
+
+SEQUENCE_PROMPT = PromptTemplate(
+    agent="sequence",
+    prefix=(
+        "You are a protein sequence information expert. Please provide a functional prediction based on the "
+        "protein sequence and the related annotations from similar proteins given below.\n\n"
+        f"{FUNCTION_ASPECTS}\n\n"
+    ),
+    body="User input sequence:\n{sequence}\n\nRelated annotations from similar proteins:\n{relevant_info}\n",
+)
+
+STRUCTURE_PROMPT = PromptTemplate(
+    agent="structure",
+    prefix=(
+        "You are a protein structure expert. Please provide a comprehensive functional prediction based on the "
+        "protein structure information given below.\n\n"
+        f"{FUNCTION_ASPECTS}\n\n"
+    ),
+    body="Protein sequence:\n{sequence}\n\nProtein structure information:\n{structure_info}\n",
+)
+
+FUNCTION_PROMPT = PromptTemplate(
+    agent="function",
+    prefix=(
+        "You are a protein function prediction expert. Please provide a detailed functional analysis based on the "
+        "protein and the GO terms prediction results given below.\n\n"
+        f"{FUNCTION_ASPECTS}\n\n"
+    ),
+    body="Protein sequence:\n{sequence}\n\nGO Terms prediction results:\n{go_terms}\n",
+)
+
+REASONING_PROMPT = PromptTemplate(
+    agent="reasoning",
+    prefix=(
+        "You are a protein function summary expert. Please synthesize the analysis from function expert, "
+        "sequence expert, and structure expert given below to summarize the potential functions, pathways, "
+        "domains, and disease associations of this protein.\n\n"
+        "Notes:\n"
+        "1. The function expert analysis is based on GO terms prediction and has higher authority, so it should be "
+        "given more weight\n"
+        "2. If a certain expert has low confidence, please adjust the reliance on that expert's analysis accordingly\n"
+        "3. Please highlight the consistency and complementarity among the expert analysis results\n\n"
+        f"{FUNCTION_ASPECTS}\n\n"
+    ),
+    body=(
+        "Function expert analysis (confidence: {function_confidence:.2f}):\n{function_nl}\n\n"
+        "Sequence expert analysis (confidence: {sequence_confidence:.2f}):\n{sequence_nl}\n\n"
+        "Structure expert analysis (confidence: {structure_confidence:.2f}):\n{structure_nl}\n"
+    ),
+)
@@ -0,0 +1,117 @@
+"""
+蛋白质向量索引 - 一次构建、只读打开的持久化索引
+
+索引目录即 embedding_store 格式的二进制存储（float16 embedding 矩阵 + 行偏移元数据 + id 索引），
+全部以 mmap 只读打开，多个 worker 共享 OS page cache，打开耗时与语料规模无关。
+
+构建（只需执行一次）：
+    python Agents/protein_index.py build --input "Agents/uniprot_documents_with_embedding copy.json" --output Agents/protein_index
+或直接从文档计算 embedding 并写入同一目录：
+    python Sequence_Agent/getembedding.py
+索引目录默认 Agents/protein_index，可用 PROTEIN_INDEX_DIR 统一修改（建库与检索共用）。
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+from embedding_store import convert_json, open_store
+from ann_backends import load_backend
+
+# 建库脚本（Sequence_Agent/getembedding.py、build 子命令）写入、智能体读取的默认索引目录
+DEFAULT_INDEX_DIR = os.environ.get("PROTEIN_INDEX_DIR", "Agents/protein_index")
+# 与 Chroma 默认度量保持一致（平方欧氏距离），置信度阈值依赖于此
+METRIC = "l2"
+
+
+def flatten_metadata(meta):
+    new_meta = {}
+    for k, v in meta.items():
+        if isinstance(v, list):
+            new_meta[k] = ", ".join(map(str, v))
+        else:
+            new_meta[k] = v
+    return new_meta
+
+
+def build_index(json_path, index_dir):
+    """
+    从带 embedding 的文档 JSON 构建持久化索引
+
+    Args:
+        json_path: uniprot_documents_with_embedding.json 路径
+        index_dir: 输出索引目录
+
+    Returns:
+        写入的条目数
+    """
+    return convert_json(json_path, index_dir)
+
+
+class ProteinIndex:
+    """只读蛋白质向量索引，查询接口与 Chroma collection.query 返回格式一致"""
+
+    def __init__(self, index_dir, backend="exact", **search_params):
+        """
+        Args:
+            index_dir: 索引目录
+            backend: 检索后端 exact / ivfpq / hnsw（ANN 索引需先用 ann_backends.py build 构建）
+            search_params: 后端检索旋钮，如 nprobe / refine / ef_search
+        """
+        self.index_dir = index_dir
+        try:
+            self.store = open_store(index_dir)
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"未找到蛋白质索引 {index_dir}，请先运行: python Agents/protein_index.py build --input <json> --output {index_dir}"
+            )
+        self.backend = load_backend(backend, self.store, index_dir, **search_params)
+
+    def count(self):
+        return len(self.store)
+
+    def search(self, query_embeddings, n_results):
+        """返回 (distances, rows)，均为 (Q, k) 数组，ANN 后端可能以 -1 填充不足的行"""
+        queries = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        return self.backend.search(queries, n_results)
+
+    def get_rows(self, rows):
+        """按行号读取 id / document / 扁平化后的 metadata，保持输入顺序"""
+        return [
+            (rec["id"], rec.get("document", ""), flatten_metadata(rec.get("metadata", {})))
+            for rec in self.store.get_records([r for r in rows if r >= 0])
+        ]
+
+    def query(self, query_embeddings, n_results=3, include=("documents", "metadatas", "distances")):
+        distances, rows = self.search(query_embeddings, n_results)
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for q in range(len(rows)):
+            records = self.get_rows(rows[q])
+            result["ids"].append([r[0] for r in records])
+            if "documents" in include:
+                result["documents"].append([r[1] for r in records])
+            if "metadatas" in include:
+                result["metadatas"].append([r[2] for r in records])
+            if "distances" in include:
+                result["distances"].append([float(d) for d, r in zip(distances[q], rows[q]) if r >= 0])
+        return {k: v for k, v in result.items() if k == "ids" or k in include}
+
+
+def open_index(index_dir, backend="exact", **search_params):
+    return ProteinIndex(index_dir, backend=backend, **search_params)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="构建蛋白质向量索引")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="从带 embedding 的文档 JSON 构建索引")
+    build.add_argument("--input", default="Agents/uniprot_documents_with_embedding copy.json")
+    build.add_argument("--output", default=DEFAULT_INDEX_DIR)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        n = build_index(args.input, args.output)
+        print(f"✅ 索引构建完成，共 {n} 个蛋白，保存在 {args.output}")
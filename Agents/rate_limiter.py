@@ -0,0 +1,238 @@
+"""
+LLM 调用的客户端限流与调度
+
+    - 两个令牌桶：每分钟请求数（LLM_RPM）与每分钟 token 数（LLM_TPM），按 LLM_QUOTA_HEADROOM 留出余量，
+      桶容量为 LLM_BURST_SECONDS 秒的额度，使吞吐平稳地贴近配额而不是先突发再集中失败
+    - 优先级队列：数值越小越先放行；批量运行时即将完成的蛋白（reasoning）优先于新蛋白（sequence）
+    - 自适应退避：收到 429 时暂停放行并把有效速率减半，之后每次成功调用逐步恢复（AIMD）
+    - token 预估：提示词按约 4 字符 / token 加预期输出 token 预扣，响应返回后按 usage_metadata 多退少补
+
+同步线程与 asyncio 协程共用同一个队列，优先级在两者之间同样有效。
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+
+RPM_LIMIT = float(os.environ.get("LLM_RPM", "1000"))
+TPM_LIMIT = float(os.environ.get("LLM_TPM", "1000000"))
+QUOTA_HEADROOM = float(os.environ.get("LLM_QUOTA_HEADROOM", "0.9"))
+BURST_SECONDS = float(os.environ.get("LLM_BURST_SECONDS", "6"))
+EXPECTED_OUTPUT_TOKENS = int(os.environ.get("LLM_EXPECTED_OUTPUT_TOKENS", "1024"))
+MIN_RATE_SCALE = 0.1
+RECOVERY_STEP = 0.05
+
+# 各智能体调用的默认优先级（越小越先）
+PRIORITIES = {
+    "reasoning": 0,
+    "function": 1,
+    "structure": 1,
+    "sequence": 2,
+    "default": 2,
+    "eval": 3,
+}
+
+
+def resolve_priority(priority):
+    if priority is None:
+        return PRIORITIES["default"]
+    if isinstance(priority, str):
+        return PRIORITIES.get(priority, PRIORITIES["default"])
+    return int(priority)
+
+
+def estimate_prompt_tokens(prompt):
+    return len(prompt) // 4 + 1
+
+
+class TokenBucket:
+    """按 rate（每秒）补充、上限为 capacity 的令牌桶；允许透支，透支部分由后续补充偿还"""
+
+    def __init__(self, per_minute, burst_seconds=BURST_SECONDS):
+        self.per_minute = per_minute
+        self.burst_seconds = burst_seconds
+        self.scale = 1.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def rate(self):
+        return self.per_minute / 60.0 * self.scale
+
+    @property
+    def capacity(self):
+        # 至少容纳一个请求，否则大请求永远无法放行
+        return max(self.per_minute / 60.0 * self.burst_seconds * self.scale, 1.0)
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """需要等待多少秒才能扣除 amount（amount 超过容量时按桶满计算）"""
+        need = min(amount, self.capacity) - self.tokens
+        return 0.0 if need <= 0 else need / self.rate
+
+    def consume(self, amount):
+        self.tokens -= amount
+
+
+class _Waiter:
+    __slots__ = ("cost", "event", "loop", "future")
+
+    def __init__(self, cost, loop=None):
+        self.cost = cost
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class RateScheduler:
+    def __init__(self, rpm=RPM_LIMIT, tpm=TPM_LIMIT, headroom=QUOTA_HEADROOM):
+        self.requests = TokenBucket(rpm * headroom)
+        self.tokens = TokenBucket(tpm * headroom)
+        self._lock = threading.Lock()
+        self._heap = []
+        self._counter = itertools.count()
+        self._blocked_until = 0.0
+        self.granted = 0
+        self.throttled = 0
+        self.rate_limited = 0
+        self.waited = 0.0
+
+    def _grant_ready(self):
+        """在锁内按优先级放行所有当前额度允许的等待者，返回队首还需等待的秒数"""
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        while self._heap:
+            waiter = self._heap[0][2]
+            delay = max(self.requests.wait_time(1), self.tokens.wait_time(waiter.cost))
+            if delay > 0:
+                return delay
+            heapq.heappop(self._heap)
+            self.requests.consume(1)
+            self.tokens.consume(waiter.cost)
+            self.granted += 1
+            waiter.wake()
+        return None
+
+    def _enqueue(self, waiter, priority):
+        with self._lock:
+            heapq.heappush(self._heap, (resolve_priority(priority), next(self._counter), waiter))
+            delay = self._grant_ready()
+            if delay is not None:
+                self.throttled += 1
+        return delay
+
+    def _cancel(self, waiter):
+        with self._lock:
+            for i, entry in enumerate(self._heap):
+                if entry[2] is waiter:
+                    self._heap.pop(i)
+                    heapq.heapify(self._heap)
+                    return
+
+    def acquire(self, cost, priority=None):
+        """
+        阻塞直到额度允许放行
+
+        Args:
+            cost: 预扣的 token 数
+            priority: PRIORITIES 中的名称或整数，越小越先
+
+        Returns:
+            等待的秒数
+        """
+        start = time.monotonic()
+        waiter = _Waiter(cost)
+        delay = self._enqueue(waiter, priority)
+        while not waiter.event.is_set():
+            # 超时后自己推进队列（补充令牌不会主动唤醒等待者）
+            waiter.event.wait(timeout=delay if delay else 0.05)
+            with self._lock:
+                delay = self._grant_ready()
+        return self._record_wait(start)
+
+    async def acquire_async(self, cost, priority=None):
+        """acquire 的协程版本，等待时不占用线程"""
+        start = time.monotonic()
+        waiter = _Waiter(cost, loop=asyncio.get_running_loop())
+        delay = self._enqueue(waiter, priority)
+        try:
+            while not waiter.future.done():
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter.future), timeout=delay if delay else 0.05)
+                except asyncio.TimeoutError:
+                    pass
+                with self._lock:
+                    delay = self._grant_ready()
+        except asyncio.CancelledError:
+            self._cancel(waiter)
+            raise
+        return self._record_wait(start)
+
+    def _record_wait(self, start):
+        waited = time.monotonic() - start
+        with self._lock:
+            self.waited += waited
+        return waited
+
+    def settle(self, estimated, actual):
+        """响应返回后按实际 token 数修正预扣"""
+        if actual is None:
+            return
+        with self._lock:
+            self.tokens.consume(actual - estimated)
+
+    def on_success(self):
+        with self._lock:
+            for bucket in (self.requests, self.tokens):
+                bucket.scale = min(1.0, bucket.scale + RECOVERY_STEP)
+
+    def on_rate_limited(self, delay):
+        """收到 429：delay 秒内不再放行，并把有效速率减半"""
+        with self._lock:
+            self.rate_limited += 1
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            for bucket in (self.requests, self.tokens):
+                bucket.scale = max(MIN_RATE_SCALE, bucket.scale * 0.5)
+                bucket.tokens = min(bucket.tokens, bucket.capacity)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "granted": self.granted,
+                "throttled": self.throttled,
+                "rate_limited": self.rate_limited,
+                "waited_s": round(self.waited, 3),
+                "queued": len(self._heap),
+                "rate_scale": round(self.requests.scale, 3),
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_rate_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RateScheduler()
+    return _scheduler
@@ -0,0 +1,117 @@
+"""
+二级结构指派：DSSP 优先，缺少 DSSP 可执行文件时回退到 biotite 的 P-SEA（纯 NumPy，无需外部程序）
+
+结果以 DSSP 风格的逐残基字符串表示（H/G/I 螺旋，E/B 折叠，其余为卷曲等），
+并按 结构内容哈希 + 方法 缓存在结构缓存的 SQLite 中，同一结构不再重复启动 DSSP 子进程。
+
+SSE_METHOD 环境变量：auto（默认，有 DSSP 用 DSSP，否则 P-SEA）/ dssp / psea
+DSSP_BINARY 指定可执行文件；未指定时依次查找 mkdssp（DSSP 4.x、conda / apt 包）与 dssp
+"""
+
+import os
+import shutil
+
+import biotite.structure as struc
+
+from structure_cache import get_structure_cache
+
+SSE_METHOD = os.environ.get("SSE_METHOD", "auto")
+DSSP_BINARY = os.environ.get("DSSP_BINARY")
+DSSP_CANDIDATES = ("mkdssp", "dssp")
+
+HELIX_CODES = ("H", "G", "I")
+SHEET_CODES = ("E", "B")
+COIL_CODES = (" ", "-")
+# P-SEA 的 a / b / c 映射为 DSSP 字符，后续统计与 DSSP 共用
+PSEA_TO_DSSP = {"a": "H", "b": "E", "c": "-"}
+
+
+def dssp_binary():
+    """
+    Returns:
+        DSSP 可执行文件路径，找不到时返回 None
+    """
+    for name in (DSSP_BINARY,) if DSSP_BINARY else DSSP_CANDIDATES:
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+
+def dssp_available():
+    return dssp_binary() is not None
+
+
+def _dssp_codes(ctx):
+    from Bio.PDB.DSSP import dssp_dict_from_pdb_file
+
+    with ctx.structure_file() as path:
+        # 强制 SSE_METHOD=dssp 但找不到可执行文件时，按原名调用以给出明确的错误
+        dssp_dict, _ = dssp_dict_from_pdb_file(path, DSSP=dssp_binary() or DSSP_BINARY or "mkdssp")
+    return "".join(v[1] for v in dssp_dict.values())
+
+
+def _psea_codes(ctx):
+    # 缺少 CA 的残基 P-SEA 返回空字符串，不计入统计
+    sse = struc.annotate_sse(ctx.protein)
+    return "".join(PSEA_TO_DSSP[s] for s in sse if s in PSEA_TO_DSSP)
+
+
+def _resolve_method(method):
+    if method == "auto":
+        return "dssp" if dssp_available() else "psea"
+    if method not in ("dssp", "psea"):
+        raise ValueError(f"未知的二级结构方法: {method}，可选: auto, dssp, psea")
+    return method
+
+
+def assign_secondary_structure(ctx, method=SSE_METHOD):
+    """
+    逐残基二级结构指派（带缓存）
+
+    Args:
+        ctx: StructureContext
+        method: auto / dssp / psea
+
+    Returns:
+        (DSSP 风格的逐残基字符串, 实际使用的方法)
+    """
+    method = _resolve_method(method)
+    key = f"{ctx.content_hash}:{method}"
+    try:
+        cached = get_structure_cache().get_sse(key)
+    except Exception as e:
+        print(f"Warning: Secondary structure cache lookup failed: {e}")
+        cached = None
+    if cached is not None:
+        return cached, method
+
+    if method == "dssp":
+        try:
+            codes = _dssp_codes(ctx)
+        except Exception as e:
+            print(f"Warning: DSSP failed, falling back to P-SEA: {e}")
+            method, key = "psea", f"{ctx.content_hash}:psea"
+            codes = _psea_codes(ctx)
+    else:
+        codes = _psea_codes(ctx)
+
+    try:
+        get_structure_cache().put_sse(key, codes)
+    except Exception as e:
+        print(f"Warning: Secondary structure cache write failed: {e}")
+    return codes, method
+
+
+def secondary_structure_percentages(codes):
+    """
+    Returns:
+        (螺旋 %, 折叠 %, 卷曲 %)，无残基时均为 None
+    """
+    total = len(codes)
+    if total == 0:
+        return None, None, None
+    helix = sum(1 for s in codes if s in HELIX_CODES)  # α-螺旋
+    sheet = sum(1 for s in codes if s in SHEET_CODES)  # β-折叠
+    coil = sum(1 for s in codes if s in COIL_CODES)    # 无规卷曲
+    return helix / total * 100, sheet / total * 100, coil / total * 100
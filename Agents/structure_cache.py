@@ -0,0 +1,174 @@
+"""
+内容寻址的结构预测缓存
+
+键：sha256(折叠时实际提交的序列) + 截断长度 [+ 折叠后端命名空间]
+值：zlib 压缩的 PDB 文本 + pLDDT 摘要（均值 / 最小 / 最大）
+存储：单个 SQLite 文件，总大小超过上限时按 LRU 淘汰。
+
+同一文件中另有 secondary_structure 表，按 结构内容哈希 + 方法 缓存逐残基二级结构字符串；
+两张表一起计入大小上限，按最近访问时间统一淘汰。
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+CACHE_PATH = os.environ.get("STRUCTURE_CACHE_PATH", "Agents/.cache/structures.sqlite")
+MAX_BYTES = int(float(os.environ.get("STRUCTURE_CACHE_MAX_MB", "512")) * 1024 * 1024)
+
+
+def structure_key(sequence, max_len, namespace=None):
+    key = hashlib.sha256(sequence.encode("utf-8")).hexdigest() + f":{max_len}"
+    return key if namespace is None else f"{key}:{namespace}"
+
+
+def plddt_summary(pdb_text):
+    """从 ATOM 记录的 B-factor 列（ESMFold 中为 pLDDT）统计摘要"""
+    values = []
+    for line in pdb_text.splitlines():
+        if line.startswith("ATOM"):
+            try:
+                values.append(float(line[60:66]))
+            except ValueError:
+                continue
+    if not values:
+        return {"plddt_mean": None, "plddt_min": None, "plddt_max": None}
+    return {
+        "plddt_mean": sum(values) / len(values),
+        "plddt_min": min(values),
+        "plddt_max": max(values),
+    }
+
+
+class StructureCache:
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_BYTES):
+        cache_dir = os.path.dirname(path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS structures ("
+            "key TEXT PRIMARY KEY, pdb BLOB, nbytes INTEGER, "
+            "plddt_mean REAL, plddt_min REAL, plddt_max REAL, "
+            "created REAL, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS structures_lru ON structures (last_used)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS secondary_structure ("
+            "key TEXT PRIMARY KEY, codes TEXT, created REAL, nbytes INTEGER, last_used REAL)"
+        )
+        # 旧版本的表没有 nbytes / last_used 列
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(secondary_structure)")}
+        if "nbytes" not in columns:
+            self._conn.execute("ALTER TABLE secondary_structure ADD COLUMN nbytes INTEGER")
+            self._conn.execute("ALTER TABLE secondary_structure ADD COLUMN last_used REAL")
+            self._conn.execute("UPDATE secondary_structure SET nbytes = LENGTH(codes), last_used = created")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS secondary_structure_lru ON secondary_structure (last_used)")
+
+    def get(self, key):
+        """
+        Returns:
+            (pdb_text, pLDDT 摘要字典)，未命中时返回 None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT pdb, plddt_mean, plddt_min, plddt_max FROM structures WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE structures SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+        pdb, plddt_mean, plddt_min, plddt_max = row
+        summary = {"plddt_mean": plddt_mean, "plddt_min": plddt_min, "plddt_max": plddt_max}
+        return zlib.decompress(pdb).decode("utf-8"), summary
+
+    def put(self, key, pdb_text):
+        blob = zlib.compress(pdb_text.encode("utf-8"), 6)
+        summary = plddt_summary(pdb_text)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO structures VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, blob, len(blob), summary["plddt_mean"], summary["plddt_min"], summary["plddt_max"], now, now),
+                )
+                self._evict()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return summary
+
+    def get_sse(self, key):
+        """返回缓存的逐残基二级结构字符串，未命中时返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT codes FROM secondary_structure WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE secondary_structure SET last_used = ? WHERE key = ?", (time.time(), key))
+        return None if row is None else row[0]
+
+    def put_sse(self, key, codes):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO secondary_structure (key, codes, created, nbytes, last_used) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, codes, now, len(codes.encode("utf-8")), now),
+                )
+                self._evict()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self):
+        """两张表合计超过上限时，按最近访问时间从旧到新删除结构与二级结构条目"""
+        total = self._conn.execute(
+            "SELECT (SELECT COALESCE(SUM(nbytes), 0) FROM structures)"
+            " + (SELECT COALESCE(SUM(nbytes), 0) FROM secondary_structure)"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT 'structures', key, nbytes, last_used FROM structures"
+            " UNION ALL SELECT 'secondary_structure', key, nbytes, last_used FROM secondary_structure"
+            " ORDER BY last_used"
+        ).fetchall()
+        for table, key, nbytes, _ in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+            total -= nbytes or 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_structure_cache():
+    global _cache
+    if _cache is None:
+        # 线程池中的并发首次调用只创建一个实例
+        with _cache_lock:
+            if _cache is None:
+                _cache = StructureCache()
+    return _cache
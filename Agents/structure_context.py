@@ -0,0 +1,153 @@
+"""
+解析一次、共享给所有结构特征提取函数的结构上下文
+
+StructureContext 只解析一次 PDB / mmCIF（第一个模型），保存：
+    atoms           biotite AtomArray（含 HETATM）
+    coords          原子坐标 (N, 3)
+    b_factors       原子 B-factor（ESMFold 中为 pLDDT）
+    elements        原子元素
+    蛋白残基索引     res_names / res_ids / res_chain_ids / ca_coords / atom_residue_index
+    近邻搜索层       atom_neighbors / ca_neighbors（首次访问时构建 KD-tree）
+    溶剂可及性       atom_sasa（首次访问时计算一次 SASA）
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+import biotite.structure as struc
+import biotite.structure.io as bsio
+import biotite.structure.io.pdb as bpdb
+
+from neighbor_search import NeighborSearch
+
+# Shrake-Rupley 每个原子的采样点数，越小越快（200 时总面积误差约 0.1%）
+SASA_POINT_NUMBER = int(os.environ.get("SASA_POINT_NUMBER", "1000"))
+
+
+class StructureContext:
+    def __init__(self, atoms, path=None, pdb_text=None):
+        """
+        Args:
+            atoms: biotite AtomArray（单个模型），需包含 b_factor 注释
+            path: 来源文件路径（DSSP 等需要文件的工具使用）
+            pdb_text: 内存中的 PDB 文本（无文件路径时使用）
+        """
+        self.path = path
+        self.pdb_text = pdb_text
+        self.atoms = atoms
+        self.coords = atoms.coord
+        self.b_factors = atoms.b_factor
+        self.elements = atoms.element
+        # 链 ID 按出现顺序去重
+        self.chain_ids = list(dict.fromkeys(atoms.chain_id.tolist()))
+
+        # 蛋白残基（ATOM 记录）索引
+        self.protein_mask = ~atoms.hetero
+        protein = atoms[self.protein_mask]
+        self.protein = protein
+        starts = struc.get_residue_starts(protein) if len(protein) > 0 else np.zeros(0, dtype=int)
+        self.residue_starts = starts
+        self.res_names = protein.res_name[starts]
+        self.res_ids = protein.res_id[starts]
+        self.res_chain_ids = protein.chain_id[starts]
+        # 每个蛋白原子所属的残基序号
+        self.atom_residue_index = np.searchsorted(starts, np.arange(len(protein)), side="right") - 1
+        self.ca_coords = np.full((len(starts), 3), np.nan, dtype=np.float32)
+        ca_mask = protein.atom_name == "CA"
+        self.ca_coords[self.atom_residue_index[ca_mask]] = protein.coord[ca_mask]
+        self.has_ca = ~np.isnan(self.ca_coords[:, 0])
+        # 有 CA 原子的残基序号，ca_neighbors 中的下标对应此数组
+        self.ca_residue_index = np.flatnonzero(self.has_ca)
+        self._atom_neighbors = None
+        self._ca_neighbors = None
+        self._content_hash = None
+        self._atom_sasa = None
+
+    @property
+    def num_residues(self):
+        return len(self.residue_starts)
+
+    @property
+    def content_hash(self):
+        """结构内容的 sha256（PDB 文本或来源文件字节），用作派生结果的缓存键"""
+        if self._content_hash is None:
+            if self.pdb_text is not None:
+                data = self.pdb_text.encode("utf-8")
+            else:
+                with open(self.path, "rb") as f:
+                    data = f.read()
+            self._content_hash = hashlib.sha256(data).hexdigest()
+        return self._content_hash
+
+    @property
+    def atom_sasa(self):
+        """每个原子的 SASA（Å²），全结构只计算一次"""
+        if self._atom_sasa is None:
+            self._atom_sasa = struc.sasa(self.atoms, point_number=SASA_POINT_NUMBER)
+        return self._atom_sasa
+
+    @property
+    def atom_neighbors(self):
+        """全部原子坐标上的近邻搜索"""
+        if self._atom_neighbors is None:
+            self._atom_neighbors = NeighborSearch(self.coords)
+        return self._atom_neighbors
+
+    @property
+    def ca_neighbors(self):
+        """CA 原子坐标上的近邻搜索，下标经 ca_residue_index 映射回残基序号"""
+        if self._ca_neighbors is None:
+            self._ca_neighbors = NeighborSearch(self.ca_coords[self.ca_residue_index])
+        return self._ca_neighbors
+
+    @classmethod
+    def from_file(cls, path):
+        """读取 PDB 或 mmCIF（按扩展名识别），只取第一个模型"""
+        atoms = bsio.load_structure(path, model=1, extra_fields=["b_factor"])
+        return cls(atoms, path=path)
+
+    @classmethod
+    def from_text(cls, pdb_text, path=None):
+        """从内存中的 PDB 文本构建，不落盘，可在多个线程 / 进程中并行使用"""
+        pdb_file = bpdb.PDBFile.read(io.StringIO(pdb_text))
+        atoms = bpdb.get_structure(pdb_file, model=1, extra_fields=["b_factor"])
+        return cls(atoms, path=path, pdb_text=pdb_text)
+
+    def _to_pdb_text(self):
+        pdb_file = bpdb.PDBFile()
+        pdb_file.set_structure(self.atoms)
+        out = io.StringIO()
+        pdb_file.write(out)
+        return out.getvalue()
+
+    @contextmanager
+    def structure_file(self):
+        """
+        为只接受文件路径的外部工具（如 DSSP）提供结构文件
+
+        来源为 PDB 文件时直接返回其路径；否则（内存文本或 mmCIF）写入本请求独享的临时 PDB 文件，退出时删除。
+        """
+        if self.path is not None and self.path.lower().endswith((".pdb", ".ent")):
+            yield self.path
+            return
+        fd, tmp_path = tempfile.mkstemp(suffix=".pdb", prefix="structure_")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.pdb_text if self.pdb_text is not None else self._to_pdb_text())
+            yield tmp_path
+        finally:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+def load_structure_context(source):
+    """接受文件路径或已构建的 StructureContext"""
+    if isinstance(source, StructureContext):
+        return source
+    return StructureContext.from_file(source)
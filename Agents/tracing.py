@@ -0,0 +1,335 @@
+"""
+流水线追踪：StateGraph 节点与外部调用（LLM / HTTP / 折叠 / ESM 编码 / DeepGO）的耗时与资源记录
+
+每个 span 记录：
+    wall_s          墙钟时间
+    cpu_s           当前线程的 CPU 时间（异步 span 中多个协程交错运行，不记录）
+    peak_rss_mb     span 结束时进程的峰值常驻内存；rss_peak_growth_mb 为 span 期间峰值的增长
+    attributes      bytes_sent / bytes_received、prompt_tokens / completion_tokens、cache_hit 等
+
+输出：
+    TRACE_FORMAT=jsonl（默认）每行一个 span；TRACE_FORMAT=otlp 每行一个 OTLP/JSON 的 resourceSpans 文档，
+    可直接被 OpenTelemetry Collector 的 otlpjsonfile 接收器读取。TRACE_PATH 指定文件，TRACE=0 关闭。
+
+用法：
+    with trace_run("analysis"):            # 一次运行（结束时打印按 span 名汇总的耗时分解）
+        app.invoke(...)
+    with span("fold", backend="esm_atlas") as s:
+        ...
+        s.set(cache_hit=True)
+
+线程池中的任务需用 propagate(fn) 包装，才能挂到提交方的 span 下。
+"""
+
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TRACE_ENABLED = os.environ.get("TRACE", "1") != "0"
+TRACE_PATH = os.environ.get("TRACE_PATH", "Agents/traces.jsonl")
+TRACE_FORMAT = os.environ.get("TRACE_FORMAT", "jsonl")
+SERVICE_NAME = "protein-function-agents"
+# 汇总表中累加的数值属性
+SUMMED_ATTRIBUTES = ("prompt_tokens", "completion_tokens", "bytes_sent", "bytes_received")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_current_run = contextvars.ContextVar("current_run", default=None)
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    # Linux 上 ru_maxrss 以 KB 为单位
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Span:
+    def __init__(self, name, kind="internal", attributes=None, track_cpu=True):
+        parent = _current_span.get()
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        # 创建时所属的运行（结束时可能已不在同一上下文中，如被事件循环关闭的异步生成器）
+        self.run = _current_run.get()
+        self.track_cpu = track_cpu
+        self.error = None
+        self.start_ns = time.time_ns()
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time() if track_cpu else None
+        self._rss = _peak_rss_mb()
+        self.wall_s = None
+        self.cpu_s = None
+        self.peak_rss_mb = None
+        self.rss_peak_growth_mb = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, **counters):
+        for key, value in counters.items():
+            if value is not None:
+                self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def finish(self):
+        self.wall_s = time.perf_counter() - self._wall
+        if self.track_cpu:
+            self.cpu_s = time.thread_time() - self._cpu
+        rss = _peak_rss_mb()
+        if rss is not None:
+            self.peak_rss_mb = rss
+            self.rss_peak_growth_mb = rss - self._rss
+
+    def to_record(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_unix_ns": self.start_ns,
+            "wall_s": round(self.wall_s, 6),
+            "cpu_s": None if self.cpu_s is None else round(self.cpu_s, 6),
+            "peak_rss_mb": None if self.peak_rss_mb is None else round(self.peak_rss_mb, 1),
+            "rss_peak_growth_mb": None if self.rss_peak_growth_mb is None else round(self.rss_peak_growth_mb, 1),
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(span):
+    """单个 span 的 OTLP/JSON（resourceSpans）文档"""
+    record = span.to_record()
+    attributes = dict(record["attributes"])
+    for key in ("wall_s", "cpu_s", "peak_rss_mb", "rss_peak_growth_mb"):
+        if record[key] is not None:
+            attributes[key] = record[key]
+    otlp_span = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        # 1 = INTERNAL, 3 = CLIENT
+        "kind": 3 if span.kind == "client" else 1,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.start_ns + int(span.wall_s * 1e9)),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items() if v is not None],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        otlp_span["parentSpanId"] = span.parent_id
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": [otlp_span]}],
+        }]
+    }
+
+
+class SpanExporter:
+    """按行追加写出 span（线程安全）"""
+
+    def __init__(self, path=TRACE_PATH, fmt=TRACE_FORMAT):
+        self.path = path
+        self.format = fmt
+        self._file = None
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        record = to_otlp(span) if self.format == "otlp" else span.to_record()
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                out_dir = os.path.dirname(self.path)
+                if out_dir:
+                    os.makedirs(out_dir, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+
+
+class RunSummary:
+    """一次运行内按 span 名累加的统计"""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = {}
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            row = self.rows.setdefault(span.name, {
+                "count": 0, "errors": 0, "wall_s": 0.0, "wall_max_s": 0.0, "cpu_s": 0.0,
+                "cache_hits": 0, **{key: 0 for key in SUMMED_ATTRIBUTES},
+            })
+            row["count"] += 1
+            row["errors"] += int(span.error is not None)
+            row["wall_s"] += span.wall_s
+            row["wall_max_s"] = max(row["wall_max_s"], span.wall_s)
+            row["cpu_s"] += span.cpu_s or 0.0
+            row["cache_hits"] += int(bool(span.attributes.get("cache_hit")))
+            for key in SUMMED_ATTRIBUTES:
+                row[key] += span.attributes.get(key) or 0
+
+    def format(self, root):
+        lines = [
+            f"📈 TRACE BREAKDOWN: {self.name} (wall {root.wall_s:.2f}s, cpu {root.attributes.get('process_cpu_s', 0):.2f}s, "
+            f"peak RSS {root.peak_rss_mb or 0:.0f} MB)",
+            "-" * 104,
+            f"{'span':<28}{'count':>7}{'wall_s':>10}{'share':>8}{'max_s':>9}{'cpu_s':>9}"
+            f"{'tok_in':>9}{'tok_out':>9}{'KB_io':>9}{'hits':>6}",
+        ]
+        total = root.wall_s or 1.0
+        with self._lock:
+            rows = sorted(self.rows.items(), key=lambda item: -item[1]["wall_s"])
+        for name, row in rows:
+            kb = (row["bytes_sent"] + row["bytes_received"]) / 1024
+            lines.append(
+                f"{name[:27]:<28}{row['count']:>7}{row['wall_s']:>10.2f}{row['wall_s'] / total:>8.0%}"
+                f"{row['wall_max_s']:>9.2f}{row['cpu_s']:>9.2f}{row['prompt_tokens']:>9}"
+                f"{row['completion_tokens']:>9}{kb:>9.1f}{row['cache_hits']:>6}"
+            )
+        lines.append("(嵌套 span 的时间互相包含，share 为相对整次运行墙钟时间的比例)")
+        return "\n".join(lines)
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter():
+    global _exporter
+    with _exporter_lock:
+        if _exporter is None:
+            _exporter = SpanExporter()
+    return _exporter
+
+
+class _NullSpan:
+    def set(self, **attributes):
+        pass
+
+    def add(self, **counters):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def current_span():
+    """当前上下文中的 span；未开启追踪或不在任何 span 内时返回空操作对象"""
+    return _current_span.get() or _NULL_SPAN
+
+
+@contextmanager
+def span(name, kind="internal", track_cpu=True, activate=True, **attributes):
+    """
+    记录一个 span；异常照常抛出，span 标记为 error
+
+    Args:
+        name: span 名（汇总表按名字分组）
+        kind: internal / client（外部调用）
+        track_cpu: 是否记录线程 CPU 时间（协程中应为 False）
+        activate: 是否设为当前 span（子 span 挂在其下）；在生成器中跨 yield 使用时必须为 False，
+            否则调用方读取流期间创建的 span 会挂到它下面，且生成器在其他上下文中关闭时无法复位
+    """
+    if not TRACE_ENABLED:
+        yield _NULL_SPAN
+        return
+    current = Span(name, kind, attributes, track_cpu)
+    token = _current_span.set(current) if activate else None
+    try:
+        yield current
+    except BaseException as e:
+        # 流式生成器被调用方提前关闭不算错误
+        if not isinstance(e, GeneratorExit):
+            current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        if token is not None:
+            _current_span.reset(token)
+        current.finish()
+        if current.run is not None:
+            current.run.add(current)
+        try:
+            get_exporter().export(current)
+        except Exception as e:
+            print(f"Warning: Trace export failed: {e}")
+
+
+@contextmanager
+def trace_run(name, summary=True, **attributes):
+    """
+    一次运行的根 span；结束时打印该运行内所有 span 的分解
+
+    Yields:
+        RunSummary
+    """
+    if not TRACE_ENABLED:
+        yield None
+        return
+    run = RunSummary(name)
+    token = _current_run.set(run)
+    start_cpu = time.process_time()
+    try:
+        with span(f"run.{name}", **attributes) as root:
+            try:
+                yield run
+            finally:
+                # 根 span 另记进程总 CPU 时间（包含所有线程）
+                root.set(process_cpu_s=round(time.process_time() - start_cpu, 3))
+    finally:
+        _current_run.reset(token)
+    if summary:
+        print(run.format(root))
+
+
+def propagate(fn):
+    """把当前的 span / run 上下文带到线程池中执行的函数里（每次调用使用独立的上下文副本）"""
+    ctx = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return ctx.copy().run(fn, *args, **kwargs)
+
+    return wrapper
+
+
+def traced_node(name, fn):
+    """包装 StateGraph 节点函数（同步或异步），每次执行记录一个 node.<name> span"""
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(state):
+            with span(f"node.{name}", track_cpu=False):
+                return await fn(state)
+
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(state):
+        with span(f"node.{name}"):
+            return fn(state)
+
+    return wrapper
@@ -1,9 +1,12 @@
+import asyncio
+import sys
 from langgraph.graph import StateGraph, END
 from typing import TypedDict
-from Seq_Agent import sequence_agent
-from Struct_Agent import structure_agent
-from Fuc_Agent import function_agent
-from Reasoning_Agent import reasoning_agent
+from Seq_Agent import sequence_agent, sequence_agent_async
+from Struct_Agent import structure_agent, structure_agent_async
+from Fuc_Agent import function_agent, function_agent_async
+from Reasoning_Agent import reasoning_agent, reasoning_agent_async, reasoning_agent_stream_async
+from tracing import trace_run, traced_node
 
 class AgentState(TypedDict):
     input: str
@@ -12,56 +15,41 @@ class AgentState(TypedDict):
     function_nl: str
     sequence_confidence: float
     structure_confidence: float
+    structure_meta: dict
     function_confidence: float
     final_answer: str
     final_confidence: float
 
-def format_output_with_confidence(result: dict) -> str:
-    """
-    格式化输出结果，包含置信度信息
-    """
+# 专家节点 -> (标题, 文本字段, 置信度字段)，顺序即完整报告中的顺序
+SECTIONS = {
+    "function": ("🎯 FUNCTION ANALYSIS", "function_nl", "function_confidence"),
+    "sequence": ("🔬 SEQUENCE ANALYSIS", "sequence_nl", "sequence_confidence"),
+    "structure": ("🧬 STRUCTURE ANALYSIS", "structure_nl", "structure_confidence"),
+    "reasoning": ("🎯 COMPREHENSIVE ANALYSIS", "final_answer", "final_confidence"),
+}
+
+def format_report_header() -> str:
     output = "\n" + "=" * 60 + "\n"
     output += "MULTI-AGENT PROTEIN ANALYSIS RESULTS\n"
     output += "=" * 60 + "\n\n"
-    
-    # Function Agent结果 (最高优先级)
-    if 'function_nl' in result:
-        confidence = result.get('function_confidence', 0.0)
-        confidence_bar = "█" * int(confidence * 10) + "░" * (10 - int(confidence * 10))
-        output += f"🎯 FUNCTION ANALYSIS (Confidence: {confidence:.2f})\n"
-        output += f"Confidence: [{confidence_bar}] {confidence:.1%}\n"
-        output += "-" * 40 + "\n"
-        output += result['function_nl'] + "\n\n"
-    
-    # Sequence Agent结果
-    if 'sequence_nl' in result:
-        confidence = result.get('sequence_confidence', 0.0)
-        confidence_bar = "█" * int(confidence * 10) + "░" * (10 - int(confidence * 10))
-        output += f"🔬 SEQUENCE ANALYSIS (Confidence: {confidence:.2f})\n"
-        output += f"Confidence: [{confidence_bar}] {confidence:.1%}\n"
-        output += "-" * 40 + "\n"
-        output += result['sequence_nl'] + "\n\n"
-    
-    # Structure Agent结果
-    if 'structure_nl' in result:
-        confidence = result.get('structure_confidence', 0.0)
-        confidence_bar = "█" * int(confidence * 10) + "░" * (10 - int(confidence * 10))
-        output += f"🧬 STRUCTURE ANALYSIS (Confidence: {confidence:.2f})\n"
-        output += f"Confidence: [{confidence_bar}] {confidence:.1%}\n"
-        output += "-" * 40 + "\n"
-        output += result['structure_nl'] + "\n\n"
-    
-    # 综合分析结果
-    if 'final_answer' in result:
-        confidence = result.get('final_confidence', 0.0)
-        confidence_bar = "█" * int(confidence * 10) + "░" * (10 - int(confidence * 10))
-        output += f"🎯 COMPREHENSIVE ANALYSIS (Confidence: {confidence:.2f})\n"
-        output += f"Confidence: [{confidence_bar}] {confidence:.1%}\n"
-        output += "-" * 40 + "\n"
-        output += result['final_answer'] + "\n\n"
-    
-    # 置信度总结
-    output += "📊 CONFIDENCE SUMMARY\n"
+    return output
+
+def format_section_header(title: str, confidence: float) -> str:
+    confidence_bar = "█" * int(confidence * 10) + "░" * (10 - int(confidence * 10))
+    output = f"{title} (Confidence: {confidence:.2f})\n"
+    output += f"Confidence: [{confidence_bar}] {confidence:.1%}\n"
+    output += "-" * 40 + "\n"
+    return output
+
+def format_section(node: str, result: dict) -> str:
+    """单个智能体的报告段落；结果中没有该智能体的文本时返回空字符串"""
+    title, text_key, confidence_key = SECTIONS[node]
+    if text_key not in result:
+        return ""
+    return format_section_header(title, result.get(confidence_key, 0.0)) + result[text_key] + "\n\n"
+
+def format_confidence_summary(result: dict) -> str:
+    output = "📊 CONFIDENCE SUMMARY\n"
     output += "-" * 40 + "\n"
     if 'function_confidence' in result:
         output += f"Function Analysis: {result['function_confidence']:.1%}\n"
@@ -71,15 +59,46 @@ def format_output_with_confidence(result: dict) -> str:
         output += f"Structure Analysis: {result['structure_confidence']:.1%}\n"
     if 'final_confidence' in result:
         output += f"Final Analysis: {result['final_confidence']:.1%}\n"
-    
     return output
 
-if __name__ == "__main__":
+def format_output_with_confidence(result: dict) -> str:
+    """
+    格式化输出结果，包含置信度信息
+    """
+    output = format_report_header()
+    # Function Agent结果 (最高优先级)、Sequence、Structure，最后是综合分析结果
+    for node in SECTIONS:
+        output += format_section(node, result)
+    # 置信度总结
+    output += format_confidence_summary(result)
+    return output
+
+def build_app(use_async=False, stream=False):
+    """
+    构建并编译多智能体 StateGraph
+
+    Args:
+        use_async: 注册异步节点，需用 ainvoke 调用；三个专家的网络 I/O 在同一事件循环中并发
+        stream: 使用流式的 reasoning 节点（隐含 use_async），配合 astream(stream_mode=["updates", "custom"])
+    """
     graph = StateGraph(AgentState)
-    graph.add_node("function", function_agent)
-    graph.add_node("sequence", sequence_agent)
-    graph.add_node("structure", structure_agent)
-    graph.add_node("reasoning", reasoning_agent)
+    if use_async or stream:
+        nodes = {
+            "function": function_agent_async,
+            "sequence": sequence_agent_async,
+            "structure": structure_agent_async,
+            "reasoning": reasoning_agent_stream_async if stream else reasoning_agent_async,
+        }
+    else:
+        nodes = {
+            "function": function_agent,
+            "sequence": sequence_agent,
+            "structure": structure_agent,
+            "reasoning": reasoning_agent,
+        }
+    # 每个节点记录一个 node.<name> span（见 tracing）
+    for name, node in nodes.items():
+        graph.add_node(name, traced_node(name, node))
 
     # 并行入口 - 三个智能体并行运行
     graph.set_entry_point("function")
@@ -91,8 +110,48 @@ if __name__ == "__main__":
     graph.add_edge("structure", "reasoning")
     graph.add_edge("reasoning", END)
 
-    app = graph.compile()
-    
+    return graph.compile()
+
+app = build_app()
+async_app = build_app(use_async=True)
+stream_app = build_app(stream=True)
+
+async def stream_analysis(sequence: str, sink=None) -> dict:
+    """
+    流式分析：每个专家完成后立即输出其段落，综合分析逐 token 输出
+
+    Args:
+        sequence: 蛋白质序列
+        sink: 报告写入器（如打开的文件），与控制台同步写入；段落按完成顺序排列
+
+    Returns:
+        与 app.invoke 相同的最终状态字典
+    """
+    def emit(text):
+        print(text, end="", flush=True)
+        if sink is not None:
+            sink.write(text)
+            sink.flush()
+
+    result = {"input": sequence}
+    emit(format_report_header())
+    async for mode, chunk in stream_app.astream({"input": sequence}, stream_mode=["updates", "custom"]):
+        if mode == "custom":
+            if "final_confidence" in chunk:
+                emit(format_section_header(SECTIONS["reasoning"][0], chunk["final_confidence"]))
+            elif "final_answer_delta" in chunk:
+                emit(chunk["final_answer_delta"])
+            continue
+        for node, update in chunk.items():
+            result.update(update or {})
+            if node == "reasoning":
+                emit("\n\n")
+            elif node in SECTIONS:
+                emit(format_section(node, result))
+    emit(format_confidence_summary(result))
+    return result
+
+if __name__ == "__main__":
     # 测试序列
     test_sequence = "MGLEALVPLAMIVAIFLLLVDLMHRHQRWAARYPPGPLPLPGLGNLLHVDFQNTPYCFDQLRRRFGDVFSLQLAWTPVVVLNGLAAVREAMVTRGEDTADRPPAPIYQVLGFGPRSQGVILSRYGPAWREQRRFSVSTLRNLGLGKKSLEQWVTEEAACLCAAFADQAGRPFRPNGLLDKAVSNVIASLTCGRRFEYDDPRFLRLLDLAQEGLKEESGFLREVLNAVPVLPHIPALAGKVLRFQKAFLTQLDELLTEHRMTWDPAQPPRDLTEAFLAKKEKAKGSPESSFNDENLRIVVGNLFLAGMVTTSTTLAWGLLLMILHLDVQRGRRVSPGCPIVGTHVCPVRVQQEIDDVIGQVRRPEMGDQAHMPCTTAVIHEVQHFGDIVPLGVTHMTSRDIEVQGFRIPKGTTLITNLSSVLKDEAVWKKPFRFHPEHFLDAQGHFVKPEAFLPFSAGRRACLGEPLARMELFLFFTSLLQHFSFSVAAGQPRPSHSRVVSFLVTPSPYELCAVPR"
     
@@ -100,16 +159,24 @@ if __name__ == "__main__":
     print(f"Input sequence: {test_sequence[:50]}...")
     print()
     
+    output_path = "Agents/CAFA/analysis_result_with_confidence_A0A087X1C5.txt"
     try:
-        result = app.invoke({"input": test_sequence})
-        
-        # 格式化并显示结果
-        formatted_output = format_output_with_confidence(result)
-        print(formatted_output)
-        
-        # 保存结果到文件
-        with open("Agents/CAFA/analysis_result_with_confidence_A0A087X1C5.txt", "w", encoding="utf-8") as f:
-            f.write(formatted_output)
+        # 结束时打印各节点与外部调用的耗时 / token / 缓存分解，span 写入 TRACE_PATH
+        with trace_run("analysis"):
+            if "--stream" in sys.argv:
+                # 流式输出：专家段落按完成顺序输出，综合分析逐 token 写入控制台与报告文件
+                with open(output_path, "w", encoding="utf-8") as f:
+                    asyncio.run(stream_analysis(test_sequence, sink=f))
+            else:
+                result = app.invoke({"input": test_sequence})
+            
+                # 格式化并显示结果
+                formatted_output = format_output_with_confidence(result)
+                print(formatted_output)
+            
+                # 保存结果到文件
+                with open(output_path, "w", encoding="utf-8") as f:
+                    f.write(formatted_output)
         print("✅ Analysis completed! Results saved to 'analysis_result_with_confidence_A0A087X1C5.txt'")
         
     except Exception as e:
@@ -1,10 +1,15 @@
-import requests
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Agents"))
+from fold_backends import get_fold_backend
 
 seq = "MGLEALVPLAMIVAIFLLLVDLMHRHQRWAARYPPGPLPLPGLGNLLHVDFQNTPYCFDQLRRRFGDVFSLQLAWTPVVVLNGLAAVREAMVTRGEDTADRPPAPIYQVLGFGPRSQGVILSRYGPAWREQRRFSVSTLRNLGLGKKSLEQWVTEEAACLCAAFADQAGRPFRPNGLLDKAVSNVIASLTCGRRFEYDDPRFLRLLDLAQEGLKEESGFLREVLNAVPVLPHIPALAGKVLRFQKAFLTQLDELLTEHRMTWDPAQPPRDLTEAFLAKKEKAKGSPESSFNDENLRIVVGNLFLAGMVTTSTTLAWGLLLMILHLDVQRGRRVSPGCPIVGTHVCPVRVQQEIDDVIGQVRRPEMGDQAHMPCTTAVIHEVQHFGDIVPLGVTHMTSRDIEVQGFRIPKGTTLITNLSSVLKDEAVWKKPFRFHPEHFLDAQGHFVKPEAFLPFSAGRRACLGEPLARMELFLFFTSLLQHFSFSVAAGQPRPSHSRVVSFLVTPSPYELCAVPR"
-url = "https://api.esmatlas.com/foldSequence/v1/pdb/"
 
-response = requests.post(url, data=seq)
+# 折叠后端由 FOLD_BACKEND 选择（esm_atlas / local / standin / auto）
+backend = get_fold_backend()
+pdb_text = backend.fold(seq)
 with open("result.pdb", "w") as f:
-    f.write(response.text)
+    f.write(pdb_text)
 
-print("✅ PDB结构预测完成，已保存 result.pdb")
+print(f"✅ PDB结构预测完成（{backend.name}），已保存 result.pdb")
@@ -1,43 +1,51 @@
 import json
-import torch
+import os
+import sys
 from tqdm import tqdm
-import esm
 
-# 加载 ESM-2 模型
-model, alphabet = esm.pretrained.esm2_t33_650M_UR50D()  # 1280维
-batch_converter = alphabet.get_batch_converter()
-model.eval()
-
-def compute_embedding(sequence: str) -> list:
-    batch_labels, batch_strs, batch_tokens = batch_converter([("protein", sequence)])
-    batch_tokens = batch_tokens  
-
-    with torch.no_grad():
-        results = model(batch_tokens, repr_layers=[33], return_contacts=False)
-    token_embeddings = results["representations"][33]
-
-    embedding = token_embeddings[0, 1:len(sequence)+1].mean(0).cpu().numpy()
-    return embedding.tolist()
+# 与 Agents/Seq_Agent.py 共用同一个批量 embedding 引擎
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Agents"))
+from esm_embedder import embed_sequences
+from embedding_store import write_store
+# 写入智能体读取的同一个索引目录（PROTEIN_INDEX_DIR，默认 Agents/protein_index）
+from protein_index import DEFAULT_INDEX_DIR
 
+# 每次送入引擎的序列数，引擎内部再按长度分桶、按 token 预算组批
+CHUNK_SIZE = 512
 
 
 with open("./uniprot_documents.json", "r", encoding="utf-8") as f:
     docs = json.load(f)
 
 
-docs = docs[:1000]
-
-for doc in tqdm(docs):
-    seq = doc.get("sequence", "")
-    if seq:
-        try:
-            doc["embedding"] = compute_embedding(seq)
-        except Exception as e:
-            print(f"[ERROR] {doc['id']}: {e}")
-            doc["embedding"] = []
-
-
-with open("./uniprot_documents_with_embedding.json", "w", encoding="utf-8") as f:
-    json.dump(docs, f, indent=2, ensure_ascii=False)
-
-print(f"✅ 成功为 {len(docs)} 个蛋白生成 embedding")
+# 默认处理全部文档；可传入条数上限用于调试，如 python getembedding.py 1000
+if len(sys.argv) > 1:
+    docs = docs[:int(sys.argv[1])]
+
+todo = [doc for doc in docs if doc.get("sequence", "")]
+for start in tqdm(range(0, len(todo), CHUNK_SIZE)):
+    chunk = todo[start:start + CHUNK_SIZE]
+    try:
+        embeddings = embed_sequences([doc["sequence"] for doc in chunk])
+        for doc, emb in zip(chunk, embeddings):
+            doc["embedding"] = emb
+    except Exception:
+        # 整批失败时逐条重试，定位出错的序列
+        for doc in chunk:
+            try:
+                doc["embedding"] = embed_sequences([doc["sequence"]])[0]
+            except Exception as e:
+                print(f"[ERROR] {doc['id']}: {e}")
+                doc["embedding"] = None
+
+
+# 写入二进制列式存储（float16 mmap 矩阵 + 元数据表 + id 索引），不再输出 JSON 浮点列表
+done = [doc for doc in docs if doc.get("embedding") is not None]
+write_store(
+    DEFAULT_INDEX_DIR,
+    [doc["id"] for doc in done],
+    [doc["embedding"] for doc in done],
+    [{k: v for k, v in doc.items() if k not in ("id", "embedding")} for doc in done],
+)
+
+print(f"✅ 成功为 {len(done)}/{len(docs)} 个蛋白生成 embedding，已保存到 {DEFAULT_INDEX_DIR}")
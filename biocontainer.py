@@ -3,6 +3,8 @@ import json
 from datetime import datetime
 import sys
 
+from Agents.http_client import get_http_client
+
 
 def fetch_biocontainers_tools(size=50, show_preview=3):
     """
@@ -24,7 +26,7 @@ def fetch_biocontainers_tools(size=50, show_preview=3):
 
     try:
         print(f"Fetching top {size} bioinformatics tools...")
-        response = requests.get(url, params=params, timeout=30)
+        response = get_http_client().get(url, params=params, timeout=30)
         response.raise_for_status()  # Raises an HTTPError for bad responses
 
         data = response.json()
@@ -76,12 +76,11 @@ reranked_chunks = rerank(query, retrieved_chunks,3)
 for i,chunk in enumerate(reranked_chunks):
     print(f"[{i}]{chunk}\n")
 
-from dotenv import load_dotenv
-from google import genai
+import os
+import sys
 
-
-load_dotenv()
-google_client = genai.Client()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Agents"))
+import llm_gateway
 
 def generate(query: str, chunks: List[str]) -> str:
     relevant_info = "\n\n".join(chunks)
@@ -98,11 +97,7 @@ Please answer according to the information mentioned above. Do not make up infor
 
     print(f"{prompt}\n\n---\n")
 
-    response = google_client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt
-    )
-    return response.text
+    return llm_gateway.generate(prompt)
 
 
 answer = generate(query,reranked_chunks)
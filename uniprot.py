@@ -1,7 +1,8 @@
-import requests
 import pandas as pd
 from tqdm import tqdm
 
+from Agents.http_client import get_http_client
+
 def fetch_uniprot_json(query, size=1000):
     base_url = "https://rest.uniprot.org/uniprotkb/search"
     params = {
@@ -14,9 +15,11 @@ def fetch_uniprot_json(query, size=1000):
     fetched = 0
     all_data = []
     pbar = tqdm(total=size, desc="Downloading JSON records")
+    # 翻页请求复用同一连接，429 / 5xx 自动退避重试
+    client = get_http_client()
 
     while fetched < size:
-        response = requests.get(base_url, params=params)
+        response = client.get(base_url, params=params)
         if response.status_code != 200:
             print("Request failed:", response.status_code)
             break